@@ -2,6 +2,7 @@
 # Collect string literals per method and export as JSON:
 # { 'className': { 'methodSignature': ['s1','s2', ...], ... }, ... }
 
+import io
 import json
 import os
 
@@ -11,11 +12,96 @@ from com.pnfsoftware.jeb.core.units.code.android import IDexUnit
 from com.pnfsoftware.jeb.core.units.code import ICodeItem
 from java.util import ArrayList
 
-# Some JEB builds expose Dalvik opcodes/mnemonics via these packages
-# We only rely on instruction.getMnemonic() and getParameters()
-# to keep compatibility across versions.
+# JEB builds differ in how instructions expose their opcode and how a
+# const-string instruction exposes its string. Whether getOpcode() is
+# available is probed on the first instruction scanned, of any kind; the
+# string accessor is probed on the first const-string found. Both are then
+# reused for every instruction of the export.
+# JEB loads the script afresh on every run, so the probe runs once per run;
+# nothing module-level survives between runs.
 
 DEFAULT_OUT = "strings_by_class_method.json"
+CONST_STRING_OPCODES = (0x1a, 0x1b)  # const-string, const-string/jumbo
+
+
+def opcode_number(insn):
+    return insn.getOpcode()
+
+
+def opcode_from_mnemonic(insn):
+    mnemonic = insn.getMnemonic()
+    if mnemonic is not None and mnemonic.lower().startswith("const-string"):
+        return CONST_STRING_OPCODES[0]
+    return None
+
+
+def string_from_param(dex, params):
+    # Builds where the parameter resolves the string itself
+    sObj = params.get(1).getString()
+    if sObj is None:
+        return None
+    return sObj.getValue() if hasattr(sObj, "getValue") else unicode(sObj)
+
+
+def string_from_index(dex, params):
+    # Builds where the parameter value is the string pool index
+    v = params.get(1).getValue()
+    if not isinstance(v, (int, long)):
+        return None
+    sObj = dex.getString(int(v))
+    return sObj.getValue() if sObj is not None else None
+
+
+def string_from_value(dex, params):
+    # Builds where the parameter value is a DexString or a Java string
+    v = params.get(1).getValue()
+    if isinstance(v, basestring):
+        return v
+    if hasattr(v, "getValue"):
+        return v.getValue()
+    return None
+
+
+def string_from_any_param(dex, params):
+    """Slow fallback: probe every parameter for something that looks like a string."""
+    for j in range(params.size()):
+        pj = params.get(j)
+        try:
+            if hasattr(pj, "getString") and pj.getString() is not None:
+                sObj = pj.getString()
+                return sObj.getValue() if hasattr(sObj, "getValue") else unicode(sObj)
+            if hasattr(pj, "getValue") and pj.getValue() is not None:
+                v = pj.getValue()
+                if isinstance(v, basestring):
+                    return v
+                if hasattr(v, "getValue"):
+                    return v.getValue()
+        except:
+            pass
+    return None
+
+
+STRING_ACCESSORS = (string_from_param, string_from_index, string_from_value)
+
+
+def resolve_opcode_reader(insn):
+    try:
+        if isinstance(insn.getOpcode(), (int, long)):
+            return opcode_number
+    except:
+        pass
+    return opcode_from_mnemonic
+
+
+def resolve_string_accessor(dex, params):
+    for accessor in STRING_ACCESSORS:
+        try:
+            if params.size() >= 2 and accessor(dex, params) is not None:
+                return accessor
+        except:
+            pass
+    return string_from_any_param
+
 
 class StringsPerMethodExporter(IScript):
     def run(self, ctx):
@@ -37,105 +123,11 @@ class StringsPerMethodExporter(IScript):
         outpath = ctx.displayInput("Output JSON path", DEFAULT_OUT)
         if not outpath:
             outpath = DEFAULT_OUT
+        # Same filter as the Soot extractor, e.g. "com.example." (empty for all classes)
+        prefix = ctx.displayInput("Package prefix (empty for all classes)", "") or ""
+        prefix = prefix.replace('.', '/')
 
-        result = {}  # class -> method -> list(strings)
-
-        for dex in dex_units:
-            # Iterate classes
-            for c in dex.getClasses():
-                clsname = c.getName(True)  # True = internal style (Lpkg/Class;), or use False for dot
-                # Convert to more readable slash-style without leading 'L' and trailing ';'
-                if clsname.startswith('L') and clsname.endswith(';'):
-                    clskey = clsname[1:-1]  # e.g., com/example/Foo
-                else:
-                    clskey = clsname
-
-                # Prepare per-class dict
-                class_map = result.setdefault(clskey, {})
-
-                # Iterate methods
-                for m in c.getMethods():
-                    # Skip if no code item (abstract/native)
-                    md = m.getData()
-                    if md is None:
-                        continue
-                    code = md.getCodeItem()
-                    if code is None:
-                        continue
-
-                    strings = set()
-
-                    # Walk instructions and look for const-string(/jumbo)
-                    try:
-                        insns = code.getInstructions()
-                        for insn in insns:
-                            mnemonic = insn.getMnemonic()
-                            if mnemonic is None:
-                                continue
-                            mn = mnemonic.lower()
-                            if mn.startswith("const-string"):  # matches const-string and const-string/jumbo
-                                # Parameters usually: vX, STRING@idx  (2 params)
-                                params = insn.getParameters()
-                                if params is None or params.size() == 0:
-                                    continue
-                                # Find the parameter that represents the string pool index/value
-                                # Typically param[1] is a DexString reference in recent APIs.
-                                s = None
-                                if params.size() >= 2:
-                                    p = params.get(1)
-                                    try:
-                                        # Many JEB builds allow .getString() or .getValue() returning an IDexString or raw string
-                                        if hasattr(p, "getString") and p.getString() is not None:
-                                            sObj = p.getString()
-                                            s = sObj.getValue() if hasattr(sObj, "getValue") else str(sObj)
-                                        elif hasattr(p, "getValue") and p.getValue() is not None:
-                                            v = p.getValue()
-                                            # v may already be a Python string (Jython) or a DexString
-                                            if hasattr(v, "getValue"):
-                                                s = v.getValue()
-                                            else:
-                                                s = unicode(v)  # Jython safe cast
-                                    except Exception as e:
-                                        # Fallback: try toString of parameter
-                                        try:
-                                            s = unicode(p.toString())
-                                        except:
-                                            pass
-                                # If still not found, try any param that looks like a string
-                                if s is None:
-                                    for j in range(params.size()):
-                                        pj = params.get(j)
-                                        try:
-                                            if hasattr(pj, "getString") and pj.getString() is not None:
-                                                sObj = pj.getString()
-                                                s = sObj.getValue() if hasattr(sObj, "getValue") else str(sObj)
-                                                break
-                                            if hasattr(pj, "getValue") and pj.getValue() is not None:
-                                                v = pj.getValue()
-                                                if isinstance(v, basestring):
-                                                    s = v
-                                                    break
-                                                if hasattr(v, "getValue"):
-                                                    s = v.getValue()
-                                                    break
-                                        except:
-                                            pass
-
-                                if s is not None:
-                                    strings.add(unicode(s))
-                    except Exception as e:
-                        # Keep going even if one method fails to decode
-                        ctx.print("Warning: failed to scan method %s in %s: %s" %
-                                  (safeMethodSig(m), clskey, e))
-
-                    if strings:
-                        # Record using the Dalvik short signature for uniqueness, e.g. doFoo(I)V
-                        mkey = safeMethodSig(m)
-                        # Sort results for determinism
-                        class_map[mkey] = sorted(strings)
-
-        # Remove classes that ended up empty (possible if no methods had strings)
-        result = {k: v for (k, v) in result.items() if v}
+        opcode_reader, accessor = None, None
 
         # Ensure parent folder exists if a path was provided
         parent = os.path.dirname(outpath)
@@ -145,11 +137,82 @@ class StringsPerMethodExporter(IScript):
             except Exception as e:
                 ctx.print("Could not create output directory: %s" % e)
 
-        # Write JSON (UTF-8, pretty)
-        with open(outpath, "w") as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+        # Classes are written as soon as they are scanned instead of being
+        # kept in memory; a class in several dex files keeps its first copy,
+        # even when that copy has no strings
+        seen = set()
+        written = 0
+        with io.open(outpath, "w", encoding="utf-8") as out:
+            out.write(u"{")
+            for dex in dex_units:
+                # Iterate classes
+                for c in dex.getClasses():
+                    clsname = c.getName(True)  # True = internal style (Lpkg/Class;), or use False for dot
+                    # Convert to more readable slash-style without leading 'L' and trailing ';'
+                    if clsname.startswith('L') and clsname.endswith(';'):
+                        clskey = clsname[1:-1]  # e.g., com/example/Foo
+                    else:
+                        clskey = clsname
+                    if not clskey.startswith(prefix) or clskey in seen:
+                        continue
+                    seen.add(clskey)
+
+                    class_map = {}
+
+                    # Iterate methods
+                    for m in c.getMethods():
+                        # Skip if no code item (abstract/native)
+                        md = m.getData()
+                        if md is None:
+                            continue
+                        code = md.getCodeItem()
+                        if code is None:
+                            continue
+
+                        strings = set()
+
+                        # Walk instructions and look for const-string(/jumbo)
+                        try:
+                            for insn in code.getInstructions():
+                                if opcode_reader is None:
+                                    opcode_reader = resolve_opcode_reader(insn)
+                                if opcode_reader(insn) not in CONST_STRING_OPCODES:
+                                    continue
+                                # Parameters usually: vX, STRING@idx  (2 params)
+                                params = insn.getParameters()
+                                if params is None or params.size() == 0:
+                                    continue
+                                if accessor is None:
+                                    accessor = resolve_string_accessor(dex, params)
+                                    ctx.print("Reading const-string operands with %s" % accessor.__name__)
+                                try:
+                                    s = accessor(dex, params)
+                                except:
+                                    s = None
+                                if s is None and accessor is not string_from_any_param:
+                                    s = string_from_any_param(dex, params)
+                                if s is not None:
+                                    strings.add(unicode(s))
+                        except Exception as e:
+                            # Keep going even if one method fails to decode
+                            ctx.print("Warning: failed to scan method %s in %s: %s" %
+                                      (safeMethodSig(m), clskey, e))
+
+                        if strings:
+                            # Record using the Dalvik short signature for uniqueness, e.g. doFoo(I)V
+                            mkey = safeMethodSig(m)
+                            # Sort results for determinism
+                            class_map[mkey] = sorted(strings)
+
+                    # Skip classes that ended up empty (no methods had strings)
+                    if not class_map:
+                        continue
+                    entry = json.dumps(class_map, ensure_ascii=False, indent=2).replace(u"\n", u"\n  ")
+                    out.write(u"%s\n  %s: %s" % (u"," if written else u"", json.dumps(clskey), entry))
+                    written += 1
+            out.write(u"\n}\n")
 
-        ctx.print("✅ Wrote %d classes to: %s" % (len(result), outpath))
+        ctx.print("✅ Wrote %d classes to: %s" % (written, outpath))
 
 
 def safeMethodSig(m):
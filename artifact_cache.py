@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache for pipeline artifacts.
+
+Every artifact is stored under a key derived from the content of everything
+that produced it (input hashes, parameters, tool versions), so renaming an
+input or changing a parameter can never hit a stale entry. Entries are
+evicted least-recently-used first once the cache grows beyond max_bytes.
+
+Threads sharing an ArtifactCache are serialized by its lock. Other processes
+may use the same directory at the same time, so an entry vanishing while
+it is being read or scanned counts as a miss, not an error.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, Optional, Tuple
+
+HASH_CHUNK_SIZE = 1 << 20
+
+# (path, size, mtime) -> sha256, so an input is hashed once per run
+_file_hash_memo: Dict[Tuple[str, int, int], str] = {}
+
+
+def stream_sha256(stream) -> str:
+    """Hex sha256 of a binary stream read to its end in chunks, rewound afterwards if it can seek."""
+    start = stream.tell() if stream.seekable() else None
+    h = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b""):
+        h.update(chunk)
+    if start is not None:
+        stream.seek(start)
+    return h.hexdigest()
+
+
+def file_sha256(path) -> str:
+    """Hex sha256 of a file's content, read in chunks."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _file_hash_memo.get(memo_key)
+    if digest is None:
+        with open(path, 'rb') as f:
+            digest = _file_hash_memo[memo_key] = stream_sha256(f)
+    return digest
+
+
+def source_version(*paths) -> str:
+    """Version string for a tool, derived from the content of its source files."""
+    return hashlib.sha256("".join(file_sha256(p) for p in paths).encode()).hexdigest()[:16]
+
+
+def cache_key(stage: str, *parts) -> str:
+    """Key for an artifact of the given stage produced from the given inputs."""
+    return hashlib.sha256(json.dumps([stage, *parts]).encode('utf-8')).hexdigest()
+
+
+class ArtifactCache:
+    """Directory of cached artifacts, one sub-directory per key, with LRU eviction."""
+
+    def __init__(self, root, max_bytes: Optional[int] = None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key: str, name: str) -> Optional[str]:
+        """Path of the cached artifact, or None on a miss. A hit refreshes its LRU age."""
+        path = os.path.join(self._entry_dir(key), name)
+        with self._lock:
+            if not os.path.exists(path):
+                return None
+            try:
+                os.utime(self._entry_dir(key))
+            except FileNotFoundError:
+                return None
+        return path
+
+    def put(self, key: str, name: str, src_path) -> str:
+        """Copy src_path into the cache under key and return the cached path."""
+        entry_dir = self._entry_dir(key)
+        path = os.path.join(entry_dir, name)
+        with self._lock:
+            os.makedirs(entry_dir, exist_ok=True)
+            # Copy under a temporary name first so readers never see partial files
+            fd, tmp_path = tempfile.mkstemp(dir=entry_dir, prefix=".tmp-")
+            os.close(fd)
+            try:
+                shutil.copyfile(src_path, tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            os.utime(entry_dir)
+            self.evict(keep=entry_dir)
+        return path
+
+    def fetch(self, key: str, name: str, dest_path) -> bool:
+        """Copy a cached artifact to dest_path. Returns False on a miss."""
+        with self._lock:
+            path = self.get(key, name)
+            if path is None:
+                return False
+            if os.path.abspath(path) != os.path.abspath(dest_path):
+                try:
+                    shutil.copyfile(path, dest_path)
+                except FileNotFoundError:
+                    return False
+        return True
+
+    def _entries(self):
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir():
+                continue
+            try:
+                entries = list(os.scandir(prefix.path))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+                    mtime = entry.stat().st_mtime
+                except FileNotFoundError:
+                    # Evicted by another process while scanning
+                    continue
+                yield mtime, size, entry.path
+
+    def size(self) -> int:
+        with self._lock:
+            return sum(size for _, size, _ in self._entries())
+
+    def evict(self, keep: Optional[str] = None):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
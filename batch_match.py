@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Match one base version against many later versions in a single run.
+
+The base string index is built once and shipped to every worker of a process
+pool; each worker streams one target dump against it, solves the constraints
+and writes matches_<base>_vs_<target>.json. A summary table of all pairs is
+logged and saved as CSV.
+"""
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from artifact_cache import ArtifactCache
+from constraint_set import NameTable
+from create_constrait_problem_from_jsons import build_string_index, pair_with_index
+from run_pipeline import (EXTRACTORS, artifact_bases, extract_strings, logger, set_extractor, set_max_jvms,
+                          setup_logging, timed_stage)
+from solve_class_matches_between_versions import solution_names, solve_staged, write_solution
+
+SUMMARY_FIELDS = ["target", "strings", "shared", "solved", "remaining", "seconds", "matches"]
+
+# Base index of the current worker process, set by _init_worker
+_base_index = None
+_base_names = None
+
+
+def _init_worker(base_index, base_class_names):
+    global _base_index, _base_names
+    _base_index = base_index
+    _base_names = NameTable(base_class_names)
+
+
+def match_target(target_json, matches_json):
+    """Worker task: build and solve the constraints of one target against the base."""
+    start = time.perf_counter()
+    constraints, count2 = pair_with_index(_base_index, _base_names, target_json)
+    remaining_constraints, solution_ids, _, _ = solve_staged(constraints)
+    solution = solution_names(constraints, solution_ids)
+    write_solution(matches_json, solution)
+    return {
+        "target": os.path.basename(target_json),
+        "strings": count2,
+        "shared": len(constraints),
+        "solved": len(solution),
+        "remaining": len(remaining_constraints),
+        "seconds": round(time.perf_counter() - start, 3),
+        "matches": matches_json,
+    }
+
+
+def resolve_json(path, base, package, output_dir, force, cache):
+    """Return the string dump of an input, extracting it first to <base>.json if it is an APK."""
+    if not path.endswith('.apk'):
+        return path
+    if not package:
+        raise SystemExit(f"--package is required to extract {path}")
+    json_path = os.path.join(output_dir, f"{base}.json")
+    extract_strings(path, package, json_path, force, cache)
+    return json_path
+
+
+def format_table(rows):
+    """Plain-text table of the summary rows."""
+    columns = SUMMARY_FIELDS[:-1]
+    widths = {c: max(len(c), *(len(str(row[c])) for row in rows)) for c in columns}
+    lines = ["  ".join(c.ljust(widths[c]) for c in columns)]
+    lines.append("  ".join("-" * widths[c] for c in columns))
+    for row in rows:
+        lines.append("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Match one base APK/JSON against several target versions.")
+    parser.add_argument("base", help="Base version: APK or string-to-classes JSON")
+    parser.add_argument("targets", nargs="+", help="Target versions: APKs or string-to-classes JSONs")
+    parser.add_argument("--package", help="Package prefix, required when extracting APKs")
+    parser.add_argument("--output-dir", default=".", help="Directory for extracted JSONs, matches and summary")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="Number of worker processes for the solve stage")
+    parser.add_argument("--max-jvms", type=int, default=2,
+                        help="Maximum number of extractors (JVMs, or dex extractors sharing the CPUs) "
+                             "running at the same time")
+    parser.add_argument("--extractor", choices=EXTRACTORS, default="dex",
+                        help="String extractor: read the dex files directly (default) or run Soot")
+    parser.add_argument("--force", action="store_true", help="Re-extract APKs even if cached")
+    parser.add_argument("--cache-dir", default=".apkdiff_cache",
+                        help="Directory of the content-addressed artifact cache")
+    parser.add_argument("--cache-max-mb", type=int, default=4096,
+                        help="Evict least recently used cache entries beyond this size")
+    args = parser.parse_args()
+    setup_logging()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    cache = ArtifactCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+    set_max_jvms(args.max_jvms)
+    set_extractor(args.extractor)
+
+    # Inputs with the same file name get distinct artifact names
+    paths = [args.base, *args.targets]
+    base, *targets = artifact_bases(paths)
+
+    # Extract every APK input, bounded by the JVM limit
+    with timed_stage("extraction"):
+        with ThreadPoolExecutor(max_workers=max(1, args.max_jvms)) as pool:
+            futures = [pool.submit(resolve_json, path, name, args.package, args.output_dir, args.force, cache)
+                       for path, name in zip(paths, [base, *targets])]
+            try:
+                base_json, *target_jsons = [f.result() for f in futures]
+            except subprocess.CalledProcessError as e:
+                logger.info(f"Command failed with exit code {e.returncode}: {' '.join(e.cmd)}")
+                sys.exit(e.returncode)
+
+    with timed_stage("base index"):
+        base_names = NameTable()
+        base_index = build_string_index(base_json, base_names)
+    logger.info(f"Base {base_json}: {len(base_index)} strings, {len(base_names)} classes")
+
+    tasks = [(target_json, os.path.join(args.output_dir, f"matches_{base}_vs_{target}.json"))
+             for target_json, target in zip(target_jsons, targets)]
+
+    with timed_stage("match targets"):
+        with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(tasks))),
+                                 initializer=_init_worker,
+                                 initargs=(base_index, base_names.names)) as pool:
+            futures = [pool.submit(match_target, *task) for task in tasks]
+            rows = [f.result() for f in futures]
+
+    summary_csv = os.path.join(args.output_dir, f"summary_{base}.csv")
+    with open(summary_csv, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    logger.info("\n" + format_table(rows))
+    logger.info(f"\nSummary saved to {summary_csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Time, memory-profile and score the matching stages on synthetic or real dumps.
+
+For every workload (one per --classes value, generated by
+synthetic_workload.py, or the --dumps pair) each stage runs --repeat times
+untraced for its best time, then once under tracemalloc for its peak memory:
+
+    load                  both dumps parsed into dicts (json_stream)
+    pair_matching_keys    constraints from the two dicts
+    pair_streaming        constraints streamed from the files
+    solve_renaming        propagation only
+    solve_staged          propagation, exact solver and assignment
+
+The solving stages are scored against the true mapping: precision over the
+mappings made, recall over the true pairs whose classes appear in both
+dumps (a class without strings cannot be matched). Peak memory covers this
+process only, not the workers of solve_staged with --jobs > 1.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from create_constrait_problem_from_jsons import pair_matching_keys, pair_matching_keys_streaming
+from json_stream import load_string_index
+from solve_class_matches_between_versions import solution_names, solve_renaming, solve_staged
+from synthetic_workload import FANOUTS, generate, write_json
+
+STAGES = ["load", "pair_matching_keys", "pair_streaming", "solve_renaming", "solve_staged"]
+
+
+def measure(func: Callable, repeat: int, memory: bool):
+    """(result, best seconds over repeat runs, peak traced MB or None)."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    peak = None
+    if memory:
+        del result
+        tracemalloc.start()
+        try:
+            result = func()
+            peak = tracemalloc.get_traced_memory()[1] / (1 << 20)
+        finally:
+            tracemalloc.stop()
+    return result, best, peak
+
+
+def score(solution: Dict[str, str], truth: Dict[str, str], dump1, dump2) -> Dict[str, float]:
+    """Precision and recall of a solved {v1 class: v2 class} mapping against the true one."""
+    classes1 = {name for classes in dump1.values() for name in classes}
+    classes2 = {name for classes in dump2.values() for name in classes}
+    matchable = {v1: v2 for v1, v2 in truth.items() if v1 in classes1 and v2 in classes2}
+    correct = sum(1 for v1, v2 in solution.items() if matchable.get(v1) == v2)
+    return {
+        "matches": len(solution),
+        "correct": correct,
+        "matchable": len(matchable),
+        "precision": correct / len(solution) if solution else 1.0,
+        "recall": correct / len(matchable) if matchable else 1.0,
+    }
+
+
+def run_workload(path1, path2, truth: Optional[Dict[str, str]], repeat: int = 1, memory: bool = True,
+                 jobs: int = 1, stages: List[str] = STAGES) -> List[Dict]:
+    """One result row per stage: seconds, peak MB and, for solving stages with a truth, accuracy."""
+    rows = []
+
+    def record(stage, func):
+        result, seconds, peak = measure(func, repeat, memory)
+        rows.append({"stage": stage, "seconds": seconds, "peak_mb": peak})
+        return result
+
+    # Later stages need the earlier results, so these always run
+    dump1, dump2 = record("load", lambda: (load_string_index(path1), load_string_index(path2)))
+    constraints = record("pair_matching_keys", lambda: pair_matching_keys(dump1, dump2))
+    rows[-1]["constraints"] = len(constraints)
+    if "pair_streaming" in stages:
+        record("pair_streaming", lambda: pair_matching_keys_streaming(path1, path2))
+    if "solve_renaming" in stages:
+        _, solution = record("solve_renaming", lambda: solve_renaming(constraints))
+        if truth is not None:
+            rows[-1].update(score(solution, truth, dump1, dump2))
+    if "solve_staged" in stages:
+        _, solution_ids, _, _ = record("solve_staged", lambda: solve_staged(constraints, jobs=jobs))
+        if truth is not None:
+            rows[-1].update(score(solution_names(constraints, solution_ids), truth, dump1, dump2))
+    for row in rows:
+        row.update(classes=len({name for classes in dump1.values() for name in classes}), strings=len(dump1))
+    return [row for row in rows if row["stage"] in stages]
+
+
+def print_rows(rows: List[Dict]):
+    print(f"{'classes':>8} {'strings':>9} {'stage':<20} {'seconds':>9} {'peak MB':>9} "
+          f"{'matches':>8} {'precision':>9} {'recall':>7}")
+    for row in rows:
+        peak = f"{row['peak_mb']:.1f}" if row["peak_mb"] is not None else "-"
+        accuracy = (f"{row['matches']:>8} {row['precision']:>9.3f} {row['recall']:>7.3f}"
+                    if "precision" in row else f"{'-':>8} {'-':>9} {'-':>7}")
+        print(f"{row['classes']:>8} {row['strings']:>9} {row['stage']:<20} {row['seconds']:>9.3f} {peak:>9} "
+              f"{accuracy}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the matching stages on synthetic workloads or real dumps.")
+    parser.add_argument("--classes", type=int, nargs="+", default=[1000, 5000, 20000],
+                        help="Synthetic workload sizes (classes in version 1)")
+    parser.add_argument("--strings-per-class", type=float, default=10.0,
+                        help="Strings in version 1 per class")
+    parser.add_argument("--fanout", choices=FANOUTS, default="pareto", help="Fan-out distribution of strings")
+    parser.add_argument("--fanout-param", type=float, default=3.0,
+                        help="Pareto alpha, geometric mean, or fixed fan-out")
+    parser.add_argument("--max-fanout", type=int, default=50, help="Largest fan-out of a string")
+    parser.add_argument("--rename-rate", type=float, default=0.9, help="Fraction of surviving classes renamed")
+    parser.add_argument("--add-rate", type=float, default=0.05, help="Classes added, as a fraction of version 1")
+    parser.add_argument("--delete-rate", type=float, default=0.05, help="Fraction of classes deleted")
+    parser.add_argument("--churn-rate", type=float, default=0.05, help="Fraction of string uses changed")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the generator")
+    parser.add_argument("--dumps", nargs=2, metavar=("VERSION1", "VERSION2"),
+                        help="Benchmark these string -> classes dumps instead of synthetic ones")
+    parser.add_argument("--truth", help="True mapping JSON {v1 class: v2 class} for --dumps")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="Stages to report")
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per stage, the best is reported")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run of every stage")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes for solve_staged")
+    parser.add_argument("--output", help="Write the result rows as JSON")
+    args = parser.parse_args()
+
+    memory = not args.no_memory
+    repeat = max(1, args.repeat)
+    rows = []
+    if args.dumps:
+        truth = None
+        if args.truth:
+            with open(args.truth, 'r', encoding='utf-8') as f:
+                truth = json.load(f)
+        rows.extend(run_workload(args.dumps[0], args.dumps[1], truth, repeat, memory, args.jobs, args.stages))
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for num_classes in args.classes:
+                try:
+                    dump1, dump2, truth = generate(num_classes, int(num_classes * args.strings_per_class),
+                                                   args.fanout, args.fanout_param, args.max_fanout,
+                                                   args.rename_rate, args.add_rate, args.delete_rate,
+                                                   args.churn_rate, args.seed)
+                except ValueError as e:
+                    print(f"Error: {e}", file=sys.stderr)
+                    sys.exit(1)
+                path1, path2 = os.path.join(tmp_dir, "v1.json"), os.path.join(tmp_dir, "v2.json")
+                write_json(path1, dump1)
+                write_json(path2, dump2)
+                del dump1, dump2
+                rows.extend(run_workload(path1, path2, truth, repeat, memory, args.jobs, args.stages))
+
+    print_rows(rows)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Structural class fingerprints, a matching signal for classes without strings.
+
+Built from the class metadata exported by "added things/extract_types.py"
+({class: {"fields": {name: type}, "methods": {name: {"return type", "args"}}}}).
+Names of fields, methods and app classes are obfuscated and change between
+versions, so only the shape of a class is used:
+
+    fields      multiset of field types
+    methods     histogram of (arity, return type)
+    signatures  multiset of full method signatures "(arg types)return type"
+
+Every type is normalized first: primitive and framework types (java/,
+android/, ...) are kept as they are, app classes all become "L*;". Each
+feature is hashed into a 64-bit integer, so the fingerprints of a version are
+four int arrays, and candidates are found through a hash index instead of
+comparing classes pairwise.
+"""
+import argparse
+import hashlib
+import json
+import sys
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+# Types under these packages keep their name; every other class is an app class
+FRAMEWORK_PREFIXES = ("java/", "javax/", "android/", "dalvik/", "kotlin/",
+                      "org/json/", "org/xml/", "org/w3c/", "org/apache/http/")
+APP_TYPE = "L*;"
+FEATURES = ("fields", "methods", "signatures", "combined")
+HASH_TYPECODE = 'Q'  # unsigned 64 bit
+
+
+def fingerprint_hash(items: Iterable[str]) -> int:
+    """64-bit hash of a multiset of strings, independent of their order."""
+    h = hashlib.blake2b(digest_size=8)
+    for item in sorted(items):
+        h.update(item.encode('utf-8'))
+        h.update(b"\0")
+    return int.from_bytes(h.digest(), 'little')
+
+
+def normalize_type(descriptor: str, app_classes) -> str:
+    """Type descriptor with app class names erased, e.g. '[LX/0Ab;' -> '[L*;'."""
+    dimensions = len(descriptor) - len(descriptor.lstrip('['))
+    element = descriptor[dimensions:]
+    if element.startswith('L') and element.endswith(';'):
+        name = element[1:-1]
+        if name in app_classes or not name.startswith(FRAMEWORK_PREFIXES):
+            element = APP_TYPE
+    return '[' * dimensions + element
+
+
+def class_features(meta: Dict, app_classes) -> Dict[str, List[str]]:
+    """The normalized feature multisets of one class's metadata."""
+    fields = [normalize_type(t, app_classes) for t in meta.get("fields", {}).values()]
+    methods, signatures = [], []
+    for method in meta.get("methods", {}).values():
+        args = [normalize_type(arg["arg type"], app_classes) for arg in method.get("args", [])]
+        ret = normalize_type(method.get("return type", "V"), app_classes)
+        methods.append(f"{len(args)}:{ret}")
+        signatures.append(f"({''.join(args)}){ret}")
+    return {"fields": fields, "methods": methods, "signatures": signatures}
+
+
+class Fingerprints:
+    """Fixed-width fingerprints of every class of one version, with a hash index per feature."""
+
+    def __init__(self, names: List[str], hashes: Dict[str, array]):
+        self.names = names
+        self.hashes = hashes
+        self._indexes: Dict[str, Dict[int, List[int]]] = {}
+
+    @classmethod
+    def from_metadata(cls, metadata: Dict[str, Dict]) -> "Fingerprints":
+        """Fingerprint every class of an extract_types.py export."""
+        app_classes = set(metadata)
+        names = []
+        hashes = {feature: array(HASH_TYPECODE) for feature in FEATURES}
+        for name, meta in metadata.items():
+            features = class_features(meta, app_classes)
+            names.append(name.replace('/', '.'))  # Same form as the string dumps
+            for feature, items in features.items():
+                hashes[feature].append(fingerprint_hash(items))
+            hashes["combined"].append(fingerprint_hash(
+                f"{feature}={h[-1]:016x}" for feature, h in hashes.items() if feature != "combined"))
+        return cls(names, hashes)
+
+    @classmethod
+    def load(cls, path) -> "Fingerprints":
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_metadata(json.load(f))
+
+    def index(self, feature: str = "combined") -> Dict[int, List[int]]:
+        """{hash: class ids with that hash} for one feature, built on first use."""
+        index = self._indexes.get(feature)
+        if index is None:
+            index = self._indexes[feature] = {}
+            for class_id, h in enumerate(self.hashes[feature]):
+                index.setdefault(h, []).append(class_id)
+        return index
+
+    def candidates(self, h: int, feature: str = "combined") -> List[str]:
+        """Names of the classes whose feature hashes to h."""
+        return [self.names[i] for i in self.index(feature).get(h, ())]
+
+    def to_dict(self) -> Dict[str, Dict[str, str]]:
+        """{class: {feature: hex hash}}, for exporting."""
+        return {name: {feature: f"{self.hashes[feature][i]:016x}" for feature in FEATURES}
+                for i, name in enumerate(self.names)}
+
+
+def match_fingerprints(fp1: Fingerprints, fp2: Fingerprints,
+                       matched: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Match the classes left unmatched by matched ({v1 class: v2 class}) whose
+    combined fingerprint is unique among the unmatched classes of both
+    versions. Classes without any members are skipped, their fingerprint
+    carries no information.
+    """
+    matched = matched or {}
+    taken = set(matched.values())
+    empty = fingerprint_hash(f"{feature}={fingerprint_hash(()):016x}" for feature in FEATURES[:-1])
+
+    def unmatched_index(fp, excluded):
+        index: Dict[int, List[str]] = {}
+        for name, h in zip(fp.names, fp.hashes["combined"]):
+            if name not in excluded and h != empty:
+                index.setdefault(h, []).append(name)
+        return index
+
+    index1 = unmatched_index(fp1, matched)
+    index2 = unmatched_index(fp2, taken)
+    return {names[0]: index2[h][0] for h, names in index1.items()
+            if len(names) == 1 and len(index2.get(h, ())) == 1}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Match classes by structural fingerprints of their extract_types.py metadata.")
+    parser.add_argument("meta1", help="Class metadata JSON of version 1")
+    parser.add_argument("meta2", help="Class metadata JSON of version 2")
+    parser.add_argument("output_file", help="Path to output JSON file for the fingerprint matches")
+    parser.add_argument("--matches", help="Existing matches JSON (e.g. from the string solver); "
+                                          "only classes it leaves unmatched are fingerprinted against each other")
+    parser.add_argument("--merged-output", help="Also write the existing matches plus the new ones here")
+    parser.add_argument("--export", nargs=2, metavar=("FP1", "FP2"),
+                        help="Write the fingerprints of both versions as JSON")
+    args = parser.parse_args()
+
+    try:
+        fp1, fp2 = Fingerprints.load(args.meta1), Fingerprints.load(args.meta2)
+        matched = {}
+        if args.matches:
+            with open(args.matches, 'r', encoding='utf-8') as f:
+                matched = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading input: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    distinct = Counter(len(ids) for ids in fp1.index().values())
+    print(f"Fingerprinted {len(fp1.names)} and {len(fp2.names)} classes, "
+          f"{distinct[1]} unique fingerprints in version 1")
+
+    result = match_fingerprints(fp1, fp2, matched)
+    with open(args.output_file, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"Number of fingerprint matches: {len(result)}")
+    print(f"Matches saved to {args.output_file}")
+
+    if args.merged_output:
+        with open(args.merged_output, 'w', encoding='utf-8') as f:
+            json.dump({**matched, **result}, f, indent=2)
+        print(f"{len(matched) + len(result)} merged matches saved to {args.merged_output}")
+
+    if args.export:
+        for fp, path in zip((fp1, fp2), args.export):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(fp.to_dict(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,59 +1,192 @@
+#!/usr/bin/env python3
+"""
+Match the files of two decompiled trees by content, without any Java tooling.
+
+Both trees are walked with os.scandir. Every file is hashed on its first
+PREFIX_SIZE bytes (plus its size); full hashes are computed only for files
+whose prefix key collides with another file. Hashing runs in a thread pool,
+since it is I/O bound. Files are then matched in three passes:
+
+    name       same relative path and identical content
+    content    identical content that is unique among the unmatched files
+               of both trees (moved or renamed files)
+    hierarchy  identical content that is not unique, disambiguated by the
+               directory its parent maps to, as voted by the earlier passes
+
+For decompiled classes (.java, .smali, ...) the file matches translate
+directly into class matches in the matches JSON format of the solver.
+String and method body comparisons live in the solver pipeline
+(create_constrait_problem_from_jsons.py, method_body_hashes.py).
+"""
+import argparse
+import fnmatch
+import hashlib
+import json
 import os
 import sys
-import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
-RECALCULATE_HASHES = True
+PREFIX_SIZE = 8192
+HASH_CHUNK_SIZE = 1 << 20
+CLASS_EXTENSIONS = (".java", ".smali", ".class", ".kt", ".jimple")
 
 
-def concat_hash_files(directory):
-    """Concatenate hash files from two directories."""
-    fv_files = []
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if file.endswith("__fv.txt"):
-                fv_files.append(os.path.join(root, file))  # Only filename, not full path
-    print(f"Found {len(fv_files)} files with __fv.txt suffix in {directory}")
-    with open(os.path.join(directory, '__fv.txt'), 'w') as outfile:
-        for fname in fv_files:
-            with open(fname, 'r') as infile:
-                outfile.write(f'### file: {fname[:-8]}\n'+infile.read())
+def load_ignore_patterns(path) -> List[str]:
+    """Glob patterns (relative paths) from an ignore file, one per line, # for comments."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
 
-hash_clac_cmd = 'file_verification.exe --algorithm MD5 --file '
 
+def list_files(root, package: Optional[str] = None, ignore: List[str] = ()) -> Dict[str, Tuple[str, int]]:
+    """
+    {relative path (with '/'): (absolute path, size)} of every file under root,
+    limited to the package directory if given (e.g. "com.example").
+    """
+    start = os.path.join(root, *package.split('.')) if package else root
+    files = {}
+    stack = [start] if os.path.isdir(start) else []
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    rel_path = os.path.relpath(entry.path, root).replace(os.sep, '/')
+                    if entry.name.endswith("__fv.txt") or any(fnmatch.fnmatch(rel_path, p) for p in ignore):
+                        continue
+                    files[rel_path] = (entry.path, entry.stat().st_size)
+    return files
 
-def get_sha1_list(root_dir):
-    if RECALCULATE_HASHES:
-        res = subprocess.run([hash_clac_cmd+f'"{root_dir}"'], shell=True)
-    with open(os.path.join(root_dir, '__fv.txt'), 'r') as f:
-        pass
 
-def intersection_size(list1, list2):
-    return len(set(list1) & set(list2))
+def prefix_hash(path) -> str:
+    """Hash of the first PREFIX_SIZE bytes of a file."""
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(PREFIX_SIZE), digest_size=16).hexdigest()
 
-def main(dir1, dir2):
-    concat_hash_files(dir1)
-    # print('Intersection:', intersection_size(sha_list1, sha_list2))
 
-# List all files
-# Compute all the hashes for the first 8192 bytes of each file
-# first try to compare the hashes of files with the same name
-# Then try to find intersections according to hierarchy
-# This should cover third of the classes
+def full_hash(path) -> str:
+    """Hash of the whole file, read in chunks."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
 
-# Things to do:
-# compare strings
-# compare content of methods without registers and names
-# process only classes inside specific package
-# Make the filtering modular and ignore files in ignore.txt
 
-if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print(f"Usage: python {sys.argv[0]} <directory1> <directory2>")
-        sys.exit(1)
+def content_keys(trees: List[Dict[str, Tuple[str, int]]], pool: ThreadPoolExecutor) -> List[Dict[str, str]]:
+    """
+    {relative path: content key} for every file of every tree. The key is the
+    size and prefix hash, refined to the full hash only when files longer
+    than the prefix share a key.
+    """
+    paths = [(t, rel_path, path, size) for t, files in enumerate(trees) for rel_path, (path, size) in files.items()]
+    prefixes = pool.map(prefix_hash, [path for _, _, path, _ in paths], chunksize=64)
+    keys = [f"{size}:{prefix}" for (_, _, _, size), prefix in zip(paths, prefixes)]
+
+    counts = Counter(keys)
+    colliding = [i for i, key in enumerate(keys) if counts[key] > 1 and paths[i][3] > PREFIX_SIZE]
+    for i, digest in zip(colliding, pool.map(full_hash, [paths[i][2] for i in colliding], chunksize=16)):
+        keys[i] = f"{paths[i][3]}:{digest}"
+
+    result = [{} for _ in trees]
+    for (t, rel_path, _, _), key in zip(paths, keys):
+        result[t][rel_path] = key
+    return result
+
+
+def match_files(keys1: Dict[str, str], keys2: Dict[str, str]) -> Dict[str, Dict[str, str]]:
+    """{pass name: {tree 1 path: tree 2 path}} for the name, content and hierarchy passes."""
+    name = {path: path for path, key in keys1.items() if keys2.get(path) == key}
+
+    def unmatched_by_key(keys, matched):
+        groups: Dict[str, List[str]] = {}
+        for path, key in keys.items():
+            if path not in matched:
+                groups.setdefault(key, []).append(path)
+        return groups
+
+    groups1 = unmatched_by_key(keys1, name)
+    groups2 = unmatched_by_key(keys2, set(name.values()))
+    content = {paths[0]: groups2[key][0] for key, paths in groups1.items()
+               if len(paths) == 1 and len(groups2.get(key, ())) == 1}
+
+    # Directory correspondence voted by every match so far
+    votes: Dict[str, Counter] = {}
+    for path1, path2 in (*name.items(), *content.items()):
+        votes.setdefault(os.path.dirname(path1), Counter())[os.path.dirname(path2)] += 1
+    directory_map = {d1: counter.most_common(1)[0][0] for d1, counter in votes.items()}
+
+    hierarchy = {}
+    for key, paths1 in groups1.items():
+        paths2 = groups2.get(key, ())
+        if len(paths1) == 1 and len(paths2) == 1:
+            continue  # Already matched by content
+        by_directory: Dict[str, List[str]] = {}
+        for path2 in paths2:
+            by_directory.setdefault(os.path.dirname(path2), []).append(path2)
+        claimed = Counter(directory_map.get(os.path.dirname(path1)) for path1 in paths1)
+        for path1 in paths1:
+            target = directory_map.get(os.path.dirname(path1))
+            candidates = by_directory.get(target, ())
+            # Only when both sides are unambiguous within the mapped directory
+            if len(candidates) == 1 and claimed[target] == 1:
+                hierarchy[path1] = candidates[0]
+    return {"name": name, "content": content, "hierarchy": hierarchy}
 
-    dir1, dir2 = sys.argv[1], sys.argv[2]
 
-    if not os.path.isdir(dir1) or not os.path.isdir(dir2):
-        print("Both arguments must be valid directories.")
+def class_name(rel_path: str) -> Optional[str]:
+    """'X/0Ab.java' -> 'X.0Ab', None for files that are not classes."""
+    base, extension = os.path.splitext(rel_path)
+    return base.replace('/', '.') if extension in CLASS_EXTENSIONS else None
+
+
+def intersection_size(keys1: Dict[str, str], keys2: Dict[str, str]) -> int:
+    """Number of distinct file contents present in both trees."""
+    return len(set(keys1.values()) & set(keys2.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Match the files of two decompiled trees by content.")
+    parser.add_argument("dir1", help="First decompiled tree")
+    parser.add_argument("dir2", help="Second decompiled tree")
+    parser.add_argument("--package", help='Only compare files under this package, e.g. "com.example"')
+    parser.add_argument("--ignore", help="File of glob patterns (relative paths) to skip")
+    parser.add_argument("--jobs", type=int, default=16, help="Threads used for hashing")
+    parser.add_argument("--output", help="JSON file for the file matches {path1: path2}")
+    parser.add_argument("--class-output", help="JSON file for the class matches {class1: class2}")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir1) or not os.path.isdir(args.dir2):
+        print("Both arguments must be valid directories.", file=sys.stderr)
         sys.exit(1)
-    main(dir1, dir2)
\ No newline at end of file
+
+    ignore = load_ignore_patterns(args.ignore) if args.ignore else []
+    files1 = list_files(args.dir1, args.package, ignore)
+    files2 = list_files(args.dir2, args.package, ignore)
+    print(f"Found {len(files1)} files in {args.dir1} and {len(files2)} files in {args.dir2}")
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        keys1, keys2 = content_keys([files1, files2], pool)
+
+    matches = match_files(keys1, keys2)
+    print(f"Intersection: {intersection_size(keys1, keys2)} distinct contents in both trees")
+    for pass_name, pass_matches in matches.items():
+        print(f"Matched by {pass_name}: {len(pass_matches)}")
+    all_matches = {path1: path2 for pass_matches in matches.values() for path1, path2 in pass_matches.items()}
+    print(f"Matched {len(all_matches)} of {len(files1)} files")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(all_matches, f, indent=2)
+    if args.class_output:
+        classes = {class_name(path1): class_name(path2) for path1, path2 in all_matches.items()
+                   if class_name(path1) and class_name(path2)}
+        with open(args.class_output, 'w', encoding='utf-8') as f:
+            json.dump(classes, f, indent=2)
+        print(f"{len(classes)} class matches saved to {args.class_output}")
+
+
+if __name__ == "__main__":
+    main()
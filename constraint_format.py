@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Versioned binary file format for ConstraintSets.
+
+Layout (all integers little-endian, every section 8-byte aligned):
+
+    header    magic b"APKC", u16 version, u16 flags, u32 constraint count,
+              then (u64 offset, u64 byte size) for each of the 7 sections
+    sections  left names, right names, strings   -> name tables
+              left offsets, left ids, right offsets, right ids -> int32 arrays
+
+A name table is a u32 count, count + 1 u32 offsets and the UTF-8 blob.
+
+The id arrays are memory-mapped and used as they are, without parsing. Name
+tables are decoded lazily, so the (much larger) string table costs nothing
+unless something asks for the strings. The mapping stays open until the set
+is closed, so use it as a context manager (an open mapping keeps the file
+locked on Windows).
+"""
+import json
+import mmap
+import struct
+import sys
+from array import array
+from typing import List
+
+from constraint_set import ConstraintSet, NameTable, ID_TYPECODE
+
+MAGIC = b"APKC"
+FORMAT_VERSION = 1
+SECTIONS = ("left_names", "right_names", "strings",
+            "left_offsets", "left_ids", "right_offsets", "right_ids")
+HEADER = struct.Struct("<4sHHI" + "QQ" * len(SECTIONS))
+ALIGNMENT = 8
+
+
+class MappedNameTable(NameTable):
+    """Read-only name table that decodes names from a mapped blob on demand."""
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+        self._names = None
+        self._ids = None
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, name_id: int) -> str:
+        if self._names is not None:
+            return self._names[name_id]
+        return str(self._blob[self._offsets[name_id]:self._offsets[name_id + 1]], 'utf-8', 'surrogatepass')
+
+    @property
+    def names(self) -> List[str]:
+        if self._names is None:
+            self._names = [self[i] for i in range(len(self))]
+        return self._names
+
+    @property
+    def ids(self):
+        if self._ids is None:
+            self._ids = {name: i for i, name in enumerate(self.names)}
+        return self._ids
+
+    def intern(self, name: str) -> int:
+        name_id = self.ids.get(name)
+        if name_id is None:
+            raise ValueError("Cannot add names to a memory-mapped constraint file")
+        return name_id
+
+
+def is_binary_constraints(path) -> bool:
+    """True if path starts with the binary constraint file magic."""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _int_array(values) -> array:
+    result = array(ID_TYPECODE, values)
+    if sys.byteorder != 'little':
+        result.byteswap()
+    return result
+
+
+def _encode_name_table(names) -> bytes:
+    encoded = [name.encode('utf-8', 'surrogatepass') for name in names]
+    offsets = array('I', [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    return struct.pack("<I", len(encoded)) + offsets.tobytes() + b"".join(encoded)
+
+
+def write_constraints(path, constraints: ConstraintSet):
+    """Write constraints in the binary format."""
+    sections = [
+        _encode_name_table(constraints.left_names.names),
+        _encode_name_table(constraints.right_names.names),
+        _encode_name_table(constraints.strings.names),
+        _int_array(constraints.left_offsets).tobytes(),
+        _int_array(constraints.left_ids).tobytes(),
+        _int_array(constraints.right_offsets).tobytes(),
+        _int_array(constraints.right_ids).tobytes(),
+    ]
+    position = HEADER.size
+    layout = []
+    for data in sections:
+        position += -position % ALIGNMENT
+        layout.extend((position, len(data)))
+        position += len(data)
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(constraints), *layout))
+        for data, offset in zip(sections, layout[::2]):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(data)
+
+
+class MappedConstraintSet(ConstraintSet):
+    """Read-only ConstraintSet over a memory-mapped file; close() unmaps it."""
+
+    def __init__(self, mapping, views, left_names: NameTable, right_names: NameTable):
+        super().__init__(left_names, right_names)
+        self._mapping = mapping
+        # Every memoryview into the mapping, which must be released before it can close
+        self._views = views
+
+    def close(self):
+        if self._mapping is None:
+            return
+        for view in reversed(self._views):
+            view.release()
+        self._mapping.close()
+        self._mapping = None
+
+
+def _view_int_array(view):
+    ints = view.cast(ID_TYPECODE)
+    if sys.byteorder != 'little':
+        # Big-endian hosts pay for a copy
+        ints = array(ID_TYPECODE, ints)
+        ints.byteswap()
+    return ints
+
+
+def _view_name_table(view, track) -> MappedNameTable:
+    count, = struct.unpack_from("<I", view)
+    if sys.byteorder == 'little':
+        offsets = track(track(view[4:8 + 4 * count]).cast('I'))
+    else:
+        offsets = array('I', struct.unpack_from("<%dI" % (count + 1), view, 4))
+    return MappedNameTable(offsets, track(view[8 + 4 * count:]))
+
+
+def read_constraints(path) -> MappedConstraintSet:
+    """
+    Memory-map a binary constraint file. The returned set is read-only; the
+    id arrays are views into the mapping and are not copied. Close it, or
+    use it in a with block, once done.
+    """
+    with open(path, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    views = []
+
+    def track(view):
+        # Big-endian hosts get copied arrays, which hold no export
+        if isinstance(view, memoryview):
+            views.append(view)
+        return view
+
+    try:
+        view = track(memoryview(mapping))
+        magic, version, _flags, _count, *layout = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a binary constraint file")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has constraint format version {version}, expected {FORMAT_VERSION}")
+        sections = {name: track(view[offset:offset + size])
+                    for name, offset, size in zip(SECTIONS, layout[::2], layout[1::2])}
+
+        constraints = MappedConstraintSet(mapping, views,
+                                          _view_name_table(sections["left_names"], track),
+                                          _view_name_table(sections["right_names"], track))
+        constraints.strings = _view_name_table(sections["strings"], track)
+        constraints.left_offsets = track(_view_int_array(sections["left_offsets"]))
+        constraints.left_ids = track(_view_int_array(sections["left_ids"]))
+        constraints.right_offsets = track(_view_int_array(sections["right_offsets"]))
+        constraints.right_ids = track(_view_int_array(sections["right_ids"]))
+    except BaseException:
+        for view in reversed(views):
+            view.release()
+        mapping.close()
+        raise
+    # Files hold the constraints as joined, so their sizes are the frequencies
+    left_offsets, right_offsets = constraints.left_offsets, constraints.right_offsets
+    constraints.frequencies = array(ID_TYPECODE, (left_offsets[i + 1] - left_offsets[i]
+                                                  + right_offsets[i + 1] - right_offsets[i]
+                                                  for i in range(len(constraints))))
+    return constraints
+
+
+def load_constraints(path) -> ConstraintSet:
+    """Load constraints from either the binary format or a JSON list of pairs."""
+    if is_binary_constraints(path):
+        return read_constraints(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        return ConstraintSet.from_pairs(json.load(f))
+
+
+def save_constraints(path, constraints: ConstraintSet, fmt: str = "binary"):
+    """Save constraints as "binary" or as a JSON list of (list, list) pairs."""
+    if fmt == "binary":
+        write_constraints(path, constraints)
+    elif fmt == "json":
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(constraints.to_pairs(), f, indent=2)
+    else:
+        raise ValueError(f"Unknown constraint format: {fmt}")
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Compact, interned representation of the string -> classes constraints.
+
+Class names and string literals are interned into dense integer ids once, and
+the constraints are stored CSR-style: one flat array of class ids per side plus
+an offsets array, so constraint i on the left side is
+left_ids[left_offsets[i]:left_offsets[i + 1]].
+"""
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Signed 32 bit ids, enough for any dex (which is limited to 2^16 types anyway)
+ID_TYPECODE = 'i'
+
+
+class NameTable:
+    """Bidirectional interning table between names and dense integer ids."""
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        for name in names:
+            self.intern(name)
+
+    def intern(self, name: str) -> int:
+        """Return the id of name, assigning the next free id if it is new."""
+        name_id = self.ids.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self.ids[name] = name_id
+            self.names.append(name)
+        return name_id
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, name_id: int) -> str:
+        return self.names[name_id]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+
+class ConstraintSet:
+    """
+    Constraints between version 1 and version 2 classes, one per shared string.
+
+    Version 1 and version 2 class names live in separate tables because the
+    same obfuscated name (e.g. "X.0Al") usually denotes different classes in
+    the two versions.
+
+    frequencies[i] is the document frequency of string i: how many classes,
+    over both versions, use it. It is taken when the constraint is first
+    added and carried over by subset() and component(), so sets reduced by
+    the solver still know how generic each string was in the full dumps.
+    """
+
+    def __init__(self, left_names: NameTable = None, right_names: NameTable = None):
+        self.strings = NameTable()
+        self.left_names = left_names if left_names is not None else NameTable()
+        self.right_names = right_names if right_names is not None else NameTable()
+        self.left_offsets = array(ID_TYPECODE, [0])
+        self.left_ids = array(ID_TYPECODE)
+        self.right_offsets = array(ID_TYPECODE, [0])
+        self.right_ids = array(ID_TYPECODE)
+        self.frequencies = array(ID_TYPECODE)
+
+    def __len__(self) -> int:
+        return len(self.left_offsets) - 1
+
+    def add(self, string: str, left: Iterable[str], right: Iterable[str]) -> int:
+        """Add the constraint for one shared string and return its index."""
+        return self.add_ids(string,
+                            [self.left_names.intern(l) for l in left],
+                            [self.right_names.intern(r) for r in right])
+
+    def add_ids(self, string: str, left_ids: Iterable[int], right_ids: Iterable[int],
+                frequency: Optional[int] = None) -> int:
+        """
+        Add a constraint given already interned class ids. frequency defaults
+        to the number of classes on both sides.
+        """
+        index = len(self)
+        # strings[i] is the string of constraint i, so a repeated string would
+        # shift every later constraint against its string
+        if string in self.strings:
+            raise ValueError(f"A constraint for string {string!r} was already added")
+        self.strings.intern(string)
+        # dict.fromkeys drops duplicates while keeping the original order
+        left, right = dict.fromkeys(left_ids), dict.fromkeys(right_ids)
+        self.left_ids.extend(left)
+        self.left_offsets.append(len(self.left_ids))
+        self.right_ids.extend(right)
+        self.right_offsets.append(len(self.right_ids))
+        self.frequencies.append(len(left) + len(right) if frequency is None else frequency)
+        return index
+
+    def left(self, i: int):
+        """Version 1 class ids of constraint i."""
+        return self.left_ids[self.left_offsets[i]:self.left_offsets[i + 1]]
+
+    def right(self, i: int):
+        """Version 2 class ids of constraint i."""
+        return self.right_ids[self.right_offsets[i]:self.right_offsets[i + 1]]
+
+    def pair(self, i: int) -> Tuple[List[str], List[str]]:
+        """Constraint i as a pair of class name lists."""
+        left_names, right_names = self.left_names.names, self.right_names.names
+        return ([left_names[l] for l in self.left(i)],
+                [right_names[r] for r in self.right(i)])
+
+    def __iter__(self) -> Iterator[Tuple[List[str], List[str]]]:
+        for i in range(len(self)):
+            yield self.pair(i)
+
+    def close(self):
+        """Release the file backing the set, if any; see constraint_format.read_constraints."""
+
+    def __enter__(self) -> "ConstraintSet":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def to_pairs(self) -> List[Tuple[List[str], List[str]]]:
+        """Expand back into the (list, list) form used by the JSON files."""
+        return list(self)
+
+    def subset(self, indices: Iterable[int]) -> "ConstraintSet":
+        """New constraint set with the given constraints, sharing the class tables."""
+        result = ConstraintSet(self.left_names, self.right_names)
+        for i in indices:
+            result.add_ids(self.strings[i], self.left(i), self.right(i), self.frequencies[i])
+        return result
+
+    def component(self, indices: Iterable[int]) -> "ConstraintSet":
+        """
+        Constraints at indices renumbered to small local ids, e.g. to ship one
+        component to a worker process. The local name tables hold the global
+        ids: local id x of the result is global id result.left_names[x].
+        """
+        result = ConstraintSet()
+        intern_left, intern_right = result.left_names.intern, result.right_names.intern
+        for i in indices:
+            result.add_ids(self.strings[i],
+                           [intern_left(l) for l in self.left(i)],
+                           [intern_right(r) for r in self.right(i)],
+                           self.frequencies[i])
+        return result
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[Tuple[List[str], List[str]]]) -> "ConstraintSet":
+        """Intern a list of (left, right) pairs, e.g. a loaded constraints JSON."""
+        result = cls()
+        for i, (left, right) in enumerate(pairs):
+            # The JSON form does not keep the strings, so number them
+            result.add(str(i), left, right)
+        return result
+
+    @classmethod
+    def from_dicts(cls, dict1: Dict[str, List[str]], dict2: Dict[str, List[str]]) -> "ConstraintSet":
+        """Build the constraints for every string present in both dumps."""
+        result = cls()
+        for key in dict1.keys() & dict2.keys():
+            result.add(key, dict1[key], dict2[key])
+        return result
+
+
+def filter_by_fanout(constraints: ConstraintSet, max_fanout: Optional[int] = None) -> ConstraintSet:
+    """
+    Constraints whose string is used by at most max_fanout classes on either
+    side (None keeps all), in their original order. Generic strings allow
+    almost every pairing and only slow the solver down.
+    """
+    if max_fanout is None:
+        return constraints
+    left_offsets, right_offsets = constraints.left_offsets, constraints.right_offsets
+    return constraints.subset(i for i in range(len(constraints))
+                              if left_offsets[i + 1] - left_offsets[i] <= max_fanout
+                              and right_offsets[i + 1] - right_offsets[i] <= max_fanout)
+
+
+def selectivity_order(constraints: ConstraintSet) -> List[int]:
+    """
+    Constraint indices, most selective first: by the document frequency of
+    their string, then by the string itself so ties do not depend on the
+    order the constraints were added in.
+    """
+    frequencies, strings = constraints.frequencies, constraints.strings.names
+    return sorted(range(len(constraints)), key=lambda i: (frequencies[i], strings[i]))
+
+
+def order_by_selectivity(constraints: ConstraintSet) -> ConstraintSet:
+    """
+    The constraints in selectivity order (see selectivity_order), so the
+    solver fixes high-information mappings first.
+    """
+    return constraints.subset(selectivity_order(constraints))
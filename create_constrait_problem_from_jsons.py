@@ -39,47 +39,99 @@
 #     main()
 #!/usr/bin/env python3
 import argparse
-import json
 import sys
+from array import array
 from pathlib import Path
 
+from constraint_set import ConstraintSet, NameTable, ID_TYPECODE, filter_by_fanout, order_by_selectivity
+from constraint_format import save_constraints
+from json_stream import iter_string_index
+
 def pair_matching_keys(dict1, dict2):
-    """Return list of (list, list) tuples for keys present in both dicts."""
-    return [(dict1[key], dict2[key]) for key in dict1.keys() & dict2.keys()]
+    """Return an interned ConstraintSet with a (list, list) constraint per key present in both dicts."""
+    return ConstraintSet.from_dicts(dict1, dict2)
+
+def build_string_index(path, names: NameTable):
+    """
+    Materialize one dump as {string: array of class ids}, interning its
+    classes into names. This is the only side held fully in memory.
+    """
+    intern = names.intern
+    return {key: array(ID_TYPECODE, map(intern, classes))
+            for key, classes in iter_string_index(path)}
+
+def pair_with_index(index1, left_names: NameTable, version2, max_fanout=None):
+    """
+    Stream version 2's dump against an already built version 1 index.
+    Returns the constraints without the strings used by more than
+    max_fanout classes on either side, most selective first (see
+    constraint_set.selectivity_order), and the number of strings in version 2.
+    """
+    constraints = ConstraintSet(left_names=left_names)
+    intern_right = constraints.right_names.intern
+    count2 = 0
+    matches = {}
+    for key, classes in iter_string_index(version2):
+        count2 += 1
+        right_ids = [intern_right(c) for c in classes]
+        if key in index1:
+            # A repeated string keeps its last class list, as json.load would
+            matches[key] = right_ids
+    for key, right_ids in matches.items():
+        constraints.add_ids(key, index1[key], right_ids)
+    return order_by_selectivity(filter_by_fanout(constraints, max_fanout)), count2
+
+def pair_matching_keys_streaming(version1, version2, max_fanout=None):
+    """
+    Build the constraints straight from two (optionally compressed) dump files.
+
+    Only version 1's index is materialized, with its classes already interned;
+    version 2 is streamed entry by entry and joined against it, so peak memory
+    is bounded by one side's index. Returns the constraints and the number of
+    strings in each version.
+    """
+    left_names = NameTable()
+    index1 = build_string_index(version1, left_names)
+    constraints, count2 = pair_with_index(index1, left_names, version2, max_fanout)
+    return constraints, len(index1), count2
 
 def main():
     parser = argparse.ArgumentParser(
         description="Compare two JSON dicts (version 1 and version 2) and return paired lists for matching keys."
     )
-    parser.add_argument("version1", type=Path, help="Path to version 1 JSON file")
-    parser.add_argument("version2", type=Path, help="Path to version 2 JSON file")
+    parser.add_argument("version1", type=Path, help="Path to version 1 JSON file (may be .gz/.zst compressed)")
+    parser.add_argument("version2", type=Path, help="Path to version 2 JSON file (may be .gz/.zst compressed)")
     parser.add_argument(
         "output",
         type=Path,
-        help="Path to output JSON file where paired lists will be saved"
+        help="Path to output file where the constraints will be saved"
+    )
+    parser.add_argument(
+        "--format",
+        choices=["binary", "json"],
+        default="binary",
+        help="Output format: memory-mappable binary (default) or a JSON list of paired lists"
+    )
+    parser.add_argument(
+        "--max-fanout",
+        type=int,
+        default=None,
+        help="Drop strings used by more than this many classes in either version (default: keep all)"
     )
 
     args = parser.parse_args()
 
     try:
-        dict1 = json.loads(args.version1.read_text(encoding='utf-8'))
-        dict2 = json.loads(args.version2.read_text(encoding='utf-8'))
+        result, count1, count2 = pair_matching_keys_streaming(args.version1, args.version2, args.max_fanout)
     except Exception as e:
         print(f"Error reading JSON files: {e}", file=sys.stderr)
         sys.exit(1)
 
-    print(len(dict1), len(dict2), len(dict1.keys() & dict2.keys()))
-
-    if not isinstance(dict1, dict) or not isinstance(dict2, dict):
-        print("Both JSON files must contain top-level objects (dicts).", file=sys.stderr)
-        sys.exit(1)
-
-    result = pair_matching_keys(dict1, dict2)
+    print(count1, count2, len(result))
 
-    with args.output.open('w', encoding='utf-8') as f:
-        json.dump(result, f, indent=2)
+    save_constraints(args.output, result, args.format)
 
-    print(f"Paired lists saved to {args.output}")
+    print(f"Paired lists saved to {args.output} ({args.format})")
 
 if __name__ == "__main__":
     main()
@@ -6,6 +6,7 @@ import soot.util.Chain;
 import java.io.FileWriter;
 import java.io.IOException;
 import java.io.PrintWriter;
+import java.nio.charset.StandardCharsets;
 import java.util.Collections;
 import java.security.MessageDigest;
 import java.security.NoSuchAlgorithmException;
@@ -69,8 +70,7 @@ public class ApkLister {
             try {
                 Body body = m.retrieveActiveBody();
                 String bodyStr = body.toString(); // Jimple representation
-                hash = md5Digest.digest(bodyStr.getBytes())
-                        .toString(); // Convert to hex string
+                hash = toHex(md5Digest.digest(bodyStr.getBytes(StandardCharsets.UTF_8)));
                 pw.println(bodyStr);
             } catch (Exception e) {
                 // Method might have no body or fail to retrieve
@@ -82,6 +82,14 @@ public class ApkLister {
         pw.println("  METHOD " + m.getSignature() + " MD5=" + hash);
     }
 
+    public static String toHex(byte[] digest) {
+        StringBuilder hex = new StringBuilder(digest.length * 2);
+        for (byte b : digest) {
+            hex.append(String.format("%02x", b));
+        }
+        return hex.toString();
+    }
+
     public static void printStrings(PrintWriter pw, SootMethod m){
         Set<String> stringsInMethod = new TreeSet<>(); // TreeSet for sorted order
 
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Minimal DEX reader: just enough of the format to find which classes load
+which string constants.
+
+Only the tables needed for that are touched: string_ids, type_ids and
+class_defs, then class_data and code items. Method bytecode is walked
+instruction by instruction with a width table, picking out the operands of
+const-string and const-string/jumbo. Strings are decoded from MUTF-8 on first
+use only.
+
+Dex files of an APK are memory-mapped in place when the zip entry is stored
+uncompressed (the usual case for installable APKs), otherwise they are
+inflated into memory.
+"""
+import mmap
+import struct
+import sys
+import zipfile
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEX_MAGIC = b"dex\n"
+# (size, offset) pairs of the header, in header order from offset 56
+HEADER_TABLES = struct.Struct("<12I")
+CLASS_DEF = struct.Struct("<8I")
+CODE_ITEM_HEADER = struct.Struct("<4HII")
+PROTO_ID = struct.Struct("<3I")
+# field_id_item and method_id_item: u2 class_idx, u2 type/proto idx, u4 name_idx
+MEMBER_ID = struct.Struct("<HHI")
+ZIP_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+
+CONST_STRING = 0x1a
+CONST_STRING_JUMBO = 0x1b
+
+# Instruction width in 16-bit code units, indexed by opcode
+OPCODE_WIDTHS = bytes(
+    [1, 1, 2, 3, 1, 2, 3, 1, 2, 3, 1, 1, 1, 1, 1, 1]  # 0x00 nop .. 0x0f return
+    + [1, 1, 1, 2, 3, 2, 2, 3, 5, 2, 2, 3, 2, 1, 1, 2]  # 0x10 return-wide .. 0x1f check-cast
+    + [2, 1, 2, 2, 3, 3, 3, 1, 1, 2, 3, 3, 3, 2, 2, 2]  # 0x20 instance-of .. 0x2f cmpl-double
+    + [2, 2] + [2] * 6 + [2] * 6 + [1] * 6  # 0x30 cmpg-double .. 0x43 unused
+    + [2] * 14 + [2] * 14 + [2] * 14  # 0x44 aget .. 0x6d sput-short
+    + [3] * 5 + [1] + [3] * 5 + [1] * 2  # 0x6e invoke-virtual .. 0x7a unused
+    + [1] * 21 + [2] * 32 + [1] * 32  # 0x7b neg-int .. 0xcf rem-double/2addr
+    + [2] * 8 + [2] * 11  # 0xd0 add-int/lit16 .. 0xe2 ushr-int/lit8
+    + [1] * 23  # 0xe3 .. 0xf9 unused
+    + [4, 4, 3, 3, 2, 2]  # 0xfa invoke-polymorphic .. 0xff const-method-type
+)
+assert len(OPCODE_WIDTHS) == 256
+
+# Pseudo-instructions in the middle of the bytecode, identified by a whole nop unit
+PACKED_SWITCH_PAYLOAD = 0x0100
+SPARSE_SWITCH_PAYLOAD = 0x0200
+FILL_ARRAY_DATA_PAYLOAD = 0x0300
+
+
+def read_uleb128(data, offset: int) -> Tuple[int, int]:
+    """Decode one unsigned LEB128 value. Returns (value, offset after it)."""
+    result = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+
+def iter_instructions(units) -> Iterator[Tuple[int, int]]:
+    """(position, width) of every instruction in a method's code units, payloads included."""
+    widths = OPCODE_WIDTHS
+    size = len(units)
+    pc = 0
+    while pc < size:
+        unit = units[pc]
+        opcode = unit & 0xff
+        if opcode == 0 and unit:
+            if unit == PACKED_SWITCH_PAYLOAD:
+                width = 4 + 2 * units[pc + 1]
+            elif unit == SPARSE_SWITCH_PAYLOAD:
+                width = 2 + 4 * units[pc + 1]
+            elif unit == FILL_ARRAY_DATA_PAYLOAD:
+                element_width = units[pc + 1]
+                count = units[pc + 2] | units[pc + 3] << 16
+                width = 4 + (count * element_width + 1) // 2
+            else:
+                width = 1
+        else:
+            width = widths[opcode]
+        yield pc, width
+        pc += width
+
+
+def decode_mutf8(raw: bytes) -> str:
+    """
+    Decode Java's modified UTF-8: NUL is encoded as C0 80 and characters
+    outside the BMP as two 3-byte surrogates instead of one 4-byte sequence.
+    """
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        pass
+    text = raw.replace(b"\xc0\x80", b"\x00").decode('utf-8', 'surrogatepass')
+    # Join surrogate pairs; lone surrogates are kept as they are
+    return text.encode('utf-16-le', 'surrogatepass').decode('utf-16-le', 'surrogatepass')
+
+
+def type_to_class_name(descriptor: str) -> str:
+    """'Lcom/example/Foo;' -> 'com.example.Foo', the form used in the JSON dumps."""
+    if descriptor.startswith('L') and descriptor.endswith(';'):
+        return descriptor[1:-1].replace('/', '.')
+    return descriptor
+
+
+class DexFile:
+    """Read-only view of one dex file held in a bytes-like buffer (bytes, mmap, memoryview)."""
+
+    def __init__(self, data, name: str = "classes.dex"):
+        self.data = data
+        self.name = name
+        if bytes(data[:4]) != DEX_MAGIC:
+            raise ValueError(f"{name} is not a dex file")
+        (self.string_ids_size, self.string_ids_off,
+         self.type_ids_size, self.type_ids_off,
+         self.proto_ids_size, self.proto_ids_off,
+         self.field_ids_size, self.field_ids_off,
+         self.method_ids_size, self.method_ids_off,
+         self.class_defs_size, self.class_defs_off) = HEADER_TABLES.unpack_from(data, 56)
+        self._string_offsets = self._u32_table(self.string_ids_off, self.string_ids_size)
+        self._type_string_ids = self._u32_table(self.type_ids_off, self.type_ids_size)
+        self._strings: Dict[int, str] = {}
+
+    def _u32_table(self, offset: int, count: int) -> array:
+        table = array('I')
+        table.frombytes(self.data[offset:offset + 4 * count])
+        if sys.byteorder != 'little':
+            table.byteswap()
+        return table
+
+    def string(self, string_idx: int) -> str:
+        """String constant string_idx, decoded on first use."""
+        text = self._strings.get(string_idx)
+        if text is None:
+            data = self.data
+            # string_data_item: uleb128 utf16 length, then NUL-terminated MUTF-8
+            _, start = read_uleb128(data, self._string_offsets[string_idx])
+            end = start
+            while data[end]:
+                end += 1
+            text = self._strings[string_idx] = decode_mutf8(bytes(data[start:end]))
+        return text
+
+    def type_descriptor(self, type_idx: int) -> str:
+        """Descriptor of type type_idx, e.g. 'Lcom/example/Foo;' or 'I'."""
+        return self.string(self._type_string_ids[type_idx])
+
+    def type_name(self, type_idx: int) -> str:
+        """Class name of type type_idx."""
+        return type_to_class_name(self.type_descriptor(type_idx))
+
+    def proto(self, proto_idx: int) -> Tuple[str, List[str]]:
+        """(return type, parameter types) descriptors of prototype proto_idx."""
+        _, return_type_idx, parameters_off = PROTO_ID.unpack_from(
+            self.data, self.proto_ids_off + proto_idx * PROTO_ID.size)
+        parameters = []
+        if parameters_off:
+            count, = struct.unpack_from("<I", self.data, parameters_off)
+            parameters = [self.type_descriptor(type_idx)
+                          for type_idx in struct.unpack_from(f"<{count}H", self.data, parameters_off + 4)]
+        return self.type_descriptor(return_type_idx), parameters
+
+    def field_ref(self, field_idx: int) -> Tuple[str, str, str]:
+        """(declaring class, name, type) descriptors of field field_idx."""
+        class_idx, type_idx, name_idx = MEMBER_ID.unpack_from(
+            self.data, self.field_ids_off + field_idx * MEMBER_ID.size)
+        return self.type_descriptor(class_idx), self.string(name_idx), self.type_descriptor(type_idx)
+
+    def method_ref(self, method_idx: int) -> Tuple[str, str, Tuple[str, List[str]]]:
+        """(declaring class, name, (return type, parameter types)) of method method_idx."""
+        class_idx, proto_idx, name_idx = MEMBER_ID.unpack_from(
+            self.data, self.method_ids_off + method_idx * MEMBER_ID.size)
+        return self.type_descriptor(class_idx), self.string(name_idx), self.proto(proto_idx)
+
+    def iter_classes(self) -> Iterator[Tuple[str, int]]:
+        """(class name, class_data_off) of every class defined in this dex."""
+        for i in range(self.class_defs_size):
+            class_idx, _, _, _, _, _, class_data_off, _ = CLASS_DEF.unpack_from(
+                self.data, self.class_defs_off + i * CLASS_DEF.size)
+            yield self.type_name(class_idx), class_data_off
+
+    def iter_code_offsets(self, class_data_off: int) -> Iterator[int]:
+        """code_off of every concrete (not abstract or native) method of a class."""
+        for _, code_off in self.iter_methods(class_data_off):
+            if code_off:
+                yield code_off
+
+    def iter_methods(self, class_data_off: int) -> Iterator[Tuple[int, int]]:
+        """(method_idx, code_off) of every method of a class; code_off is 0 for abstract and native ones."""
+        if not class_data_off:
+            return
+        data = self.data
+        offset = class_data_off
+        static_fields, offset = read_uleb128(data, offset)
+        instance_fields, offset = read_uleb128(data, offset)
+        direct_methods, offset = read_uleb128(data, offset)
+        virtual_methods, offset = read_uleb128(data, offset)
+        for _ in range(2 * (static_fields + instance_fields)):
+            _, offset = read_uleb128(data, offset)  # field_idx_diff, access_flags
+        for count in (direct_methods, virtual_methods):
+            # method_idx is delta-encoded, restarting for the virtual methods
+            method_idx = 0
+            for _ in range(count):
+                diff, offset = read_uleb128(data, offset)
+                _, offset = read_uleb128(data, offset)  # access_flags
+                code_off, offset = read_uleb128(data, offset)
+                method_idx += diff
+                yield method_idx, code_off
+
+    def code_units(self, code_off: int) -> array:
+        """Bytecode of the code item at code_off as 16-bit code units."""
+        _, _, _, _, _, insns_size = CODE_ITEM_HEADER.unpack_from(self.data, code_off)
+        start = code_off + CODE_ITEM_HEADER.size
+        units = array('H')
+        units.frombytes(self.data[start:start + 2 * insns_size])
+        if sys.byteorder != 'little':
+            units.byteswap()
+        return units
+
+    def string_refs(self, code_off: int) -> List[int]:
+        """String ids loaded by const-string(/jumbo) in the code item at code_off."""
+        units = self.code_units(code_off)
+        refs = []
+        for pc, _ in iter_instructions(units):
+            opcode = units[pc] & 0xff
+            if opcode == CONST_STRING:
+                refs.append(units[pc + 1])
+            elif opcode == CONST_STRING_JUMBO:
+                refs.append(units[pc + 1] | units[pc + 2] << 16)
+        return refs
+
+    def iter_class_strings(self, package_prefix: str = "") -> Iterator[Tuple[str, List[str]]]:
+        """(class name, string constants in its methods) for every class under package_prefix."""
+        for class_name, class_data_off in self.iter_classes():
+            if not class_name.startswith(package_prefix):
+                continue
+            strings = [self.string(idx)
+                       for code_off in self.iter_code_offsets(class_data_off)
+                       for idx in self.string_refs(code_off)]
+            yield class_name, strings
+
+
+def _zip_entry_offset(apk, info: zipfile.ZipInfo) -> int:
+    """Offset of an entry's data, past its local header (whose extra field may differ from the central one)."""
+    apk.seek(info.header_offset)
+    header = ZIP_LOCAL_HEADER.unpack(apk.read(ZIP_LOCAL_HEADER.size))
+    name_length, extra_length = header[-2], header[-1]
+    return info.header_offset + ZIP_LOCAL_HEADER.size + name_length + extra_length
+
+
+def _dex_order(name: str) -> int:
+    """classes.dex, classes2.dex, ..., the order the runtime loads them in."""
+    number = name[len("classes"):-len(".dex")]
+    return int(number) if number else 1
+
+
+def _is_dex_entry(name: str) -> bool:
+    number = name[len("classes"):-len(".dex")]
+    return name.startswith("classes") and name.endswith(".dex") and (not number or number.isdigit())
+
+
+def dex_names(path) -> List[str]:
+    """Names of the classes*.dex entries of an APK in load order, or [path] for a single dex file."""
+    with open(path, 'rb') as f:
+        if f.read(len(DEX_MAGIC)) == DEX_MAGIC:
+            return [path]
+    with zipfile.ZipFile(path) as apk:
+        return sorted((name for name in apk.namelist() if _is_dex_entry(name)), key=_dex_order)
+
+
+def open_dex_files(path, names: Optional[List[str]] = None) -> List[DexFile]:
+    """
+    Every classes*.dex of an APK in load order (only the given entry names
+    if names is set), or the single dex file at path. The returned objects
+    keep the file mapped; they stay valid until garbage collected.
+    """
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mapped[:4] == DEX_MAGIC:
+        return [DexFile(mapped, path)]
+
+    result = []
+    with zipfile.ZipFile(path) as apk, open(path, 'rb') as raw:
+        for name in (names if names is not None else dex_names(path)):
+            info = apk.getinfo(name)
+            if info.compress_type == zipfile.ZIP_STORED:
+                start = _zip_entry_offset(raw, info)
+                data = memoryview(mapped)[start:start + info.file_size]
+            else:
+                data = apk.read(info)
+            result.append(DexFile(data, name))
+    return result
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Python replacement for create_strings_to_classes_json.java.
+
+Reads the const-string operands straight from the APK's dex files (see
+dex_file.py) instead of loading the whole program into Soot, so it needs
+neither a JVM nor an Android SDK. Writes the same string -> classes JSON:
+every non-empty string constant mapped to the sorted names of the classes
+under the package prefix whose methods load it.
+
+Each dex file of a multi-dex APK is scanned in its own worker process into a
+partial index sorted by string; the partial indexes are then combined with a
+k-way merge.
+"""
+import argparse
+import heapq
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby, repeat
+from operator import itemgetter
+from typing import Dict, Set
+
+from dex_file import dex_names, open_dex_files
+
+
+def java_order(text: str) -> bytes:
+    """Sort key matching Java's String.compareTo (UTF-16 code units), as the Soot extractor's TreeMap."""
+    return text.encode('utf-16-be', 'surrogatepass')
+
+
+def extract_dex(apk, dex_name: str, package_prefix: str):
+    """
+    Worker task: partial index of one dex file. Returns the classes under the
+    prefix it defines, those of them with strings, and its entries
+    [(sort key, string, sorted class names)] sorted by key.
+    """
+    dex, = open_dex_files(apk, [dex_name])
+    string_to_classes: Dict[str, Set[str]] = {}
+    classes, classes_with_strings = [], []
+    for class_name, strings in dex.iter_class_strings(package_prefix):
+        classes.append(class_name)
+        strings = [s for s in strings if s]
+        if strings:
+            classes_with_strings.append(class_name)
+        for s in strings:
+            string_to_classes.setdefault(s, set()).add(class_name)
+    entries = sorted((java_order(s), s, sorted(names, key=java_order)) for s, names in string_to_classes.items())
+    return classes, classes_with_strings, entries
+
+
+def merge_partial_indexes(partials):
+    """
+    k-way merge of the extract_dex results of every dex, in load order, into
+    ({string: sorted class names}, classes with strings, classes total). A
+    class defined in several dex files is taken from the first one, as the
+    runtime does.
+    """
+    seen: Set[str] = set()
+    shadowed = []
+    for classes, _, _ in partials:
+        shadowed.append(seen.intersection(classes))
+        seen.update(classes)
+    classes_with_strings = sum(1 for (_, with_strings, _), hidden in zip(partials, shadowed)
+                               for name in with_strings if name not in hidden)
+
+    def visible(entries, hidden):
+        for key, s, names in entries:
+            if hidden:
+                names = [name for name in names if name not in hidden]
+            if names:
+                yield key, s, names
+
+    merged = heapq.merge(*(visible(entries, hidden) for (_, _, entries), hidden in zip(partials, shadowed)),
+                         key=itemgetter(0))
+    result = {}
+    for _, group in groupby(merged, key=itemgetter(0)):
+        group = list(group)
+        if len(group) == 1:
+            _, s, names = group[0]
+        else:
+            s = group[0][1]
+            # Every list is sorted, so merging and dropping repeats keeps the order
+            names = list(dict.fromkeys(heapq.merge(*(names for _, _, names in group), key=java_order)))
+        result[s] = names
+    return result, classes_with_strings, len(seen)
+
+
+def strings_to_classes(apk, package_prefix: str, jobs: int = 1):
+    """
+    {string: sorted class names} for the classes under package_prefix, plus the
+    number of classes with at least one string and the number of classes total.
+    With jobs > 1 every dex file is scanned in its own worker process.
+    """
+    names = dex_names(apk)
+    if jobs > 1 and len(names) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(names))) as pool:
+            partials = list(pool.map(extract_dex, repeat(apk), names, repeat(package_prefix)))
+    else:
+        partials = [extract_dex(apk, name, package_prefix) for name in names]
+    return merge_partial_indexes(partials)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract string constant -> classes JSON from an APK's dex files.")
+    parser.add_argument("apk", help="Path to the APK (or a single .dex file)")
+    parser.add_argument("output_json", help="Path of the JSON file to write")
+    parser.add_argument("package_prefix", help='Only include classes whose name starts with this, e.g. "com.example"')
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="Scan the dex files of a multi-dex APK in this many worker processes")
+    args = parser.parse_args()
+
+    try:
+        result, classes_with_strings, total_classes = strings_to_classes(args.apk, args.package_prefix,
+                                                                         args.jobs)
+    except (OSError, ValueError) as e:
+        print(f"Error reading {args.apk}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # Unpaired surrogates become '?', as Java's writer would do
+    with open(args.output_json, 'w', encoding='utf-8', errors='replace') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    print(f"### Found string literals from {classes_with_strings} classes. "
+          f"(There are {total_classes} classes total)")
+
+
+if __name__ == "__main__":
+    main()
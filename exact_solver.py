@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Exact solver for the small residual components left after propagation.
+
+Model: a version 1 class l may only be renamed to a version 2 class r that
+carries every remaining string of l, and vice versa. So the domain of l is the
+intersection of the right sides of its constraints (a bitset over the
+component's version 2 classes), restricted to the classes whose own domain
+contains l. Classes with an empty domain have no possible partner and are
+left unmatched. Every other class needs a distinct partner.
+
+Search uses singleton propagation over bitset domains, picks the most
+constrained class first, and stops at the second solution or when the node
+budget runs out. The budget counts search nodes, not seconds, so the same
+constraints always get the same status however loaded the machine is (the
+pipeline caches solutions across runs).
+"""
+from typing import Dict, Optional, Tuple
+
+from constraint_set import ConstraintSet
+
+UNIQUE = "unique"
+AMBIGUOUS = "ambiguous"
+UNSATISFIABLE = "unsatisfiable"
+UNKNOWN = "unknown"  # budget exhausted before the answer was known
+
+DEFAULT_MAX_NODES = 20000
+
+
+class _BudgetExceeded(Exception):
+    pass
+
+
+def build_domains(constraints: ConstraintSet) -> Dict[int, int]:
+    """Bitset domain {v1 id: bits of allowed v2 ids} for every constrained v1 class."""
+    all_right = 0
+    for r in constraints.right_ids:
+        all_right |= 1 << r
+    left_domain: Dict[int, int] = {}
+    right_domain: Dict[int, int] = {}
+    for i in range(len(constraints)):
+        left, right = constraints.left(i), constraints.right(i)
+        right_bits = 0
+        for r in right:
+            right_bits |= 1 << r
+        left_bits = 0
+        for l in left:
+            left_bits |= 1 << l
+        for l in left:
+            left_domain[l] = left_domain.get(l, all_right) & right_bits
+        for r in right:
+            right_domain[r] = right_domain.get(r, -1) & left_bits
+
+    # Keep l -> r only when r's own strings also allow l
+    domains = {}
+    for l, bits in left_domain.items():
+        allowed = 0
+        while bits:
+            low = bits & -bits
+            r = low.bit_length() - 1
+            if right_domain.get(r, -1) >> l & 1:
+                allowed |= low
+            bits ^= low
+        domains[l] = allowed
+    return domains
+
+
+def _propagate(domains: Dict[int, int], assignment: Dict[int, int]) -> bool:
+    """Assign every singleton domain and remove its value elsewhere. False on a wipe-out."""
+    queue = [l for l, bits in domains.items() if bits and not bits & (bits - 1)]
+    while queue:
+        l = queue.pop()
+        bits = domains.pop(l, None)
+        if bits is None:
+            continue
+        if not bits:
+            return False
+        assignment[l] = bits.bit_length() - 1
+        for other, other_bits in domains.items():
+            if other_bits & bits:
+                other_bits &= ~bits
+                domains[other] = other_bits
+                if not other_bits:
+                    return False
+                if not other_bits & (other_bits - 1):
+                    queue.append(other)
+    return True
+
+
+def solve_exact(constraints: ConstraintSet,
+                max_nodes: int = DEFAULT_MAX_NODES) -> Tuple[str, Optional[Dict[int, int]]]:
+    """
+    Decide whether the residual constraints have a unique, several or no
+    consistent renaming. Returns (status, {v1 id: v2 id}); the mapping is the
+    solution for UNIQUE and None otherwise.
+    """
+    initial = build_domains(constraints)
+    domains = {l: bits for l, bits in initial.items() if bits}
+    solutions = []
+    nodes = 0
+
+    def search(domains, assignment):
+        nonlocal nodes
+        nodes += 1
+        if nodes > max_nodes:
+            raise _BudgetExceeded()
+        if not _propagate(domains, assignment):
+            return
+        if not domains:
+            solutions.append(assignment)
+            return
+        # Most constrained class first
+        l = min(domains, key=lambda k: bin(domains[k]).count('1'))
+        bits = domains[l]
+        while bits and len(solutions) < 2:
+            low = bits & -bits
+            bits ^= low
+            child = {k: v & ~low for k, v in domains.items() if k != l}
+            if all(child.values()):
+                child_assignment = dict(assignment)
+                child_assignment[l] = low.bit_length() - 1
+                search(child, child_assignment)
+
+    try:
+        search(domains, {})
+    except _BudgetExceeded:
+        return UNKNOWN, None
+    if not solutions:
+        return UNSATISFIABLE, None
+    if len(solutions) > 1:
+        return AMBIGUOUS, None
+    return UNIQUE, solutions[0]
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Incremental re-solve for when one side's string dump changes, e.g. a nightly
+rebuild of version 2 against a fixed version 1.
+
+The state is a directory of binary files next to a small state.json:
+
+    v1.<n>.bin, v2.<n>.bin  string index of each side, strings sorted, in the
+                            constraint file format (the classes of string i
+                            are its left side); memory-mapped and searched by
+                            bisection, so an unchanged side is never decoded
+    joined.<n>.bin          the key intersection, grouped by component
+    arrays.<n>.bin          component boundaries and unresolved constraint
+                            counts, the component of every class, and the
+                            solved partner and confidence of every v1 class
+
+A new dump is streamed once and diffed against the stored index of its side.
+Only the components holding a changed string, or a class a changed string
+now uses, are rebuilt, decomposed and solved again. Saving writes the parts
+that changed under a new generation number n, then replaces state.json, so an
+interrupted run keeps the previous state; unchanged parts are not rewritten.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from artifact_cache import file_sha256
+from constraint_format import read_constraints, write_constraints
+from constraint_set import ConstraintSet, NameTable, ID_TYPECODE
+from json_stream import iter_string_index
+from solve_class_matches_between_versions import EXACT_MAX_SIZE, decompose, solve_component, write_solution
+
+logger = logging.getLogger("pipeline.incremental")
+
+# Bump when the layout of the state changes
+STATE_VERSION = 3
+STATE_FILE = "state.json"
+PARTS = ["v1", "v2", "joined", "arrays"]
+PART_FILE = re.compile(r"(%s)\.\d+\.bin$" % "|".join(PARTS))
+# Typecode, then element count, of every array in an arrays file
+ARRAY_HEADER = struct.Struct("<cQ")
+
+
+def write_arrays(path, arrays: List[array]):
+    """Write arrays back to back, each behind its typecode and length, little-endian."""
+    with open(path, 'wb') as f:
+        for values in arrays:
+            f.write(ARRAY_HEADER.pack(values.typecode.encode(), len(values)))
+            if sys.byteorder != 'little':
+                values = array(values.typecode, values)
+                values.byteswap()
+            f.write(values.tobytes())
+
+
+def read_arrays(path) -> List[array]:
+    """The arrays of a file written by write_arrays."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    arrays, position = [], 0
+    while position < len(data):
+        typecode, length = ARRAY_HEADER.unpack_from(data, position)
+        position += ARRAY_HEADER.size
+        values = array(typecode.decode())
+        end = position + length * values.itemsize
+        values.frombytes(data[position:end])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        arrays.append(values)
+        position = end
+    return arrays
+
+
+def build_side_index(path) -> ConstraintSet:
+    """
+    String index of one dump, strings sorted, with the classes of string i
+    as the left side of constraint i. Strings no class uses are left out.
+    A string repeated in the dump keeps its last class list, as json.load would.
+    """
+    entries = dict(iter_string_index(path))
+    index = ConstraintSet()
+    for key in sorted(entries):
+        if entries[key]:
+            index.add(key, entries[key], ())
+    return index
+
+
+def find_string(index: ConstraintSet, key: str) -> Optional[int]:
+    """Position of key in a side index, None if absent; a mapped index only decodes the probed strings."""
+    strings = index.strings
+    i = bisect_left(strings, key)
+    return i if i < len(strings) and strings[i] == key else None
+
+
+def lookup(index: Optional[ConstraintSet], key: str) -> Optional[List[str]]:
+    """Classes using key in a side index, None if absent."""
+    if index is None:
+        return None
+    i = find_string(index, key)
+    if i is None:
+        return None
+    names = index.left_names
+    return [names[c] for c in index.left(i)]
+
+
+class IncrementalSolver:
+    """Persistent constraint join and decomposition of one version pair."""
+
+    def __init__(self, assignment: bool = True, min_confidence: float = 0.0,
+                 exact_max_size: int = EXACT_MAX_SIZE):
+        self.options = [assignment, min_confidence, exact_max_size]
+        # Per side: content hash of the dump it was built from and its string index
+        self.dump_hashes = [None, None]
+        self.sides: List[Optional[ConstraintSet]] = [None, None]
+        # The key intersection, constraints of component k at component_starts[k]:component_starts[k + 1]
+        self.joined = ConstraintSet()
+        self.component_starts = array(ID_TYPECODE, [0])
+        # Unresolved constraints left in every component
+        self.remaining = array(ID_TYPECODE)
+        # Component of every class id of joined, -1 for classes no longer used
+        self.left_component = array(ID_TYPECODE)
+        self.right_component = array(ID_TYPECODE)
+        # Solved partner (-1 for none) and its confidence, per v1 class id of joined
+        self.partner = array(ID_TYPECODE)
+        self.confidence = array('d')
+        # Shared strings added, removed or changed, and the components they
+        # belonged to, since the last solve
+        self.dirty = set()
+        self.affected = set()
+        self.generation = 0
+        self.files: Dict[str, str] = {}
+        self._changed = set(PARTS)
+
+    @classmethod
+    def load(cls, path, assignment: bool = True, min_confidence: float = 0.0,
+             exact_max_size: int = EXACT_MAX_SIZE) -> "IncrementalSolver":
+        """State saved in the directory path, or an empty solver if there is none or it is unusable."""
+        solver = cls(assignment, min_confidence, exact_max_size)
+        if not os.path.exists(path):
+            return solver
+        if not os.path.isdir(path):
+            logger.info(f"Ignoring {path}: not a state directory")
+            return solver
+        try:
+            with open(os.path.join(path, STATE_FILE), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            logger.info(f"Ignoring {path}: no readable {STATE_FILE}")
+            return solver
+        if state.get("version") != STATE_VERSION:
+            logger.info(f"Ignoring {path}: state version {state.get('version')}, expected {STATE_VERSION}")
+            return solver
+
+        files = state["files"]
+        solver.dump_hashes = state["dump_hashes"]
+        solver.sides = [read_constraints(os.path.join(path, files[part])) if part in files else None
+                        for part in PARTS[:2]]
+        solver.joined = read_constraints(os.path.join(path, files["joined"]))
+        (solver.component_starts, solver.remaining, solver.left_component, solver.right_component,
+         solver.partner, solver.confidence) = read_arrays(os.path.join(path, files["arrays"]))
+        solver.generation = state["generation"]
+        solver.files = files
+        solver._changed = set()
+        solver.dirty = set(state["dirty"])
+        solver.affected = set(state["affected"])
+        # Stored solutions are only valid for the options they were solved with
+        if state["options"] != solver.options:
+            solver.affected = set(range(len(solver.remaining)))
+        return solver
+
+    def close(self):
+        """Release the memory-mapped parts of the state."""
+        for index in self.sides:
+            if index is not None:
+                index.close()
+        self.joined.close()
+
+    def __enter__(self) -> "IncrementalSolver":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def save(self, path):
+        """
+        Write the parts changed since the state was loaded, then replace
+        state.json, so an interrupted run keeps the previous state. Files of
+        older generations are removed afterwards.
+        """
+        if os.path.isfile(path):
+            # A single-file state of an older version, ignored by load()
+            os.remove(path)
+        os.makedirs(path, exist_ok=True)
+        generation = self.generation + 1
+        files = dict(self.files)
+        for part in PARTS:
+            if part not in self._changed:
+                continue
+            name = f"{part}.{generation}.bin"
+            if part == "arrays":
+                write_arrays(os.path.join(path, name),
+                             [self.component_starts, self.remaining, self.left_component,
+                              self.right_component, self.partner, self.confidence])
+            elif part == "joined":
+                write_constraints(os.path.join(path, name), self.joined)
+            elif self.sides[PARTS.index(part)] is not None:
+                write_constraints(os.path.join(path, name), self.sides[PARTS.index(part)])
+            else:
+                continue
+            files[part] = name
+
+        tmp_path = os.path.join(path, f"{STATE_FILE}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": STATE_VERSION,
+                "generation": generation,
+                "options": self.options,
+                "dump_hashes": self.dump_hashes,
+                "files": files,
+                "dirty": sorted(self.dirty),
+                "affected": sorted(self.affected),
+            }, f)
+        os.replace(tmp_path, os.path.join(path, STATE_FILE))
+        self.generation, self.files, self._changed = generation, files, set()
+
+        for entry in os.scandir(path):
+            if PART_FILE.match(entry.name) and entry.name not in files.values():
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    # Still mapped by another process, e.g. on Windows; the next save retries
+                    pass
+
+    def _components_of(self, left: List[str], right: List[str]) -> set:
+        """Components of joined holding any of the given classes."""
+        components = set()
+        for names, table, component_of in ((left, self.joined.left_names, self.left_component),
+                                           (right, self.joined.right_names, self.right_component)):
+            for name in names:
+                c = table.ids.get(name)
+                if c is not None and component_of[c] >= 0:
+                    components.add(component_of[c])
+        return components
+
+    def update(self, side: int, path) -> Optional[int]:
+        """
+        Apply the dump at path as side 0 (version 1) or 1 (version 2).
+        Returns the number of changed strings, or None if the dump is unchanged.
+        """
+        digest = file_sha256(path)
+        if digest == self.dump_hashes[side]:
+            return None
+        old_index, other_index = self.sides[side], self.sides[1 - side]
+        new_index = build_side_index(path)
+
+        changed = []
+        new_strings = new_index.strings.names
+        if old_index is None:
+            changed = list(new_strings)
+        else:
+            # Merge the two sorted string lists, comparing class lists as old class ids
+            old_ids = old_index.left_names.ids
+            to_old = [old_ids.get(name, -1) for name in new_index.left_names.names]
+            old_strings = old_index.strings.names
+            i = j = 0
+            while i < len(old_strings) or j < len(new_strings):
+                old_key = old_strings[i] if i < len(old_strings) else None
+                new_key = new_strings[j] if j < len(new_strings) else None
+                if new_key is None or (old_key is not None and old_key < new_key):
+                    changed.append(old_key)
+                    i += 1
+                elif old_key is None or new_key < old_key:
+                    changed.append(new_key)
+                    j += 1
+                else:
+                    if [to_old[c] for c in new_index.left(j)] != old_index.left(i).tolist():
+                        changed.append(new_key)
+                    i += 1
+                    j += 1
+
+        for key in changed:
+            other = lookup(other_index, key)
+            if other is None:
+                continue
+            # The components the string was part of, and is to be removed from
+            old = lookup(old_index, key)
+            if old is not None:
+                self.affected.update(self._components_of(*((old, other) if side == 0 else (other, old))))
+            self.dirty.add(key)
+
+        if old_index is not None:
+            old_index.close()
+        self.sides[side] = new_index
+        self.dump_hashes[side] = digest
+        self._changed.add(PARTS[side])
+        return len(changed)
+
+    def joined_classes(self, key: str) -> Optional[Tuple[List[str], List[str]]]:
+        """(v1 classes, v2 classes) of a shared string, None if a side does not have it."""
+        left = lookup(self.sides[0], key)
+        right = lookup(self.sides[1], key) if left is not None else None
+        return (left, right) if right is not None else None
+
+    def solve(self):
+        """
+        Solve the changed part of the constraints, reusing every unchanged component.
+        Returns ({v1 class: v2 class}, {v1 class: confidence}, remaining constraint count).
+        """
+        if self.dirty or self.affected:
+            self._resolve()
+        left_names, right_names = self.joined.left_names, self.joined.right_names
+        solution, confidence = {}, {}
+        for l, r in enumerate(self.partner):
+            if r >= 0:
+                solution[left_names[l]] = right_names[r]
+                confidence[left_names[l]] = self.confidence[l]
+        return solution, confidence, sum(self.remaining)
+
+    def _resolve(self):
+        assignment, min_confidence, exact_max_size = self.options
+        old = self.joined
+        starts = self.component_starts
+        new_constraints = {}
+        for key in self.dirty:
+            classes = self.joined_classes(key)
+            if classes is not None:
+                new_constraints[key] = classes
+                # Components the string now joins
+                self.affected.update(self._components_of(*classes))
+        affected = self.affected
+        for k in affected:
+            for i in range(starts[k], starts[k + 1]):
+                key = old.strings[i]
+                if key not in self.dirty:
+                    new_constraints[key] = self.joined_classes(key)
+
+        constraints = ConstraintSet()
+        for key in sorted(new_constraints):
+            constraints.add(key, *new_constraints[key])
+
+        # Unchanged components are copied over with their class ids; class tables only grow
+        joined = ConstraintSet(NameTable(old.left_names.names), NameTable(old.right_names.names))
+        component_map = array(ID_TYPECODE, [-1]) * len(self.remaining)
+        component_starts, remaining = array(ID_TYPECODE, [0]), array(ID_TYPECODE)
+        for k in range(len(self.remaining)):
+            if k in affected:
+                continue
+            for i in range(starts[k], starts[k + 1]):
+                joined.add_ids(old.strings[i], old.left(i), old.right(i), old.frequencies[i])
+            component_map[k] = len(remaining)
+            component_starts.append(len(joined))
+            remaining.append(self.remaining[k])
+        kept = len(remaining)
+
+        left_component = array(ID_TYPECODE, (component_map[k] if k >= 0 else -1 for k in self.left_component))
+        right_component = array(ID_TYPECODE, (component_map[k] if k >= 0 else -1 for k in self.right_component))
+        partner = array(ID_TYPECODE, (r if k >= 0 else -1 for r, k in zip(self.partner, left_component)))
+        confidence = array('d', self.confidence)
+
+        intern_left, intern_right = joined.left_names.intern, joined.right_names.intern
+        names_left, names_right = constraints.left_names.names, constraints.right_names.names
+        for group in decompose(constraints):
+            component = constraints.component(group)
+            component_remaining, component_solution, component_confidence, _, _, _ = solve_component(
+                component, assignment, min_confidence, exact_max_size)
+            # Local ids of the component -> ids of joined
+            to_left = [intern_left(names_left[l]) for l in component.left_names.names]
+            to_right = [intern_right(names_right[r]) for r in component.right_names.names]
+            grow = len(joined.left_names) - len(left_component)
+            left_component.extend([-1] * grow)
+            partner.extend([-1] * grow)
+            confidence.extend([0.0] * grow)
+            right_component.extend([-1] * (len(joined.right_names) - len(right_component)))
+
+            k = len(remaining)
+            for i in range(len(component)):
+                joined.add_ids(component.strings[i], [to_left[l] for l in component.left(i)],
+                               [to_right[r] for r in component.right(i)], component.frequencies[i])
+            for l in to_left:
+                left_component[l] = k
+            for r in to_right:
+                right_component[r] = k
+            for l, r in component_solution.items():
+                partner[to_left[l]] = to_right[r]
+                confidence[to_left[l]] = component_confidence[l]
+            component_starts.append(len(joined))
+            remaining.append(len(component_remaining))
+
+        logger.info(f"Re-solved {len(remaining) - kept} of {len(remaining)} components "
+                    f"({len(constraints)} of {len(joined)} constraints)")
+        old.close()
+        self.joined, self.component_starts, self.remaining = joined, component_starts, remaining
+        self.left_component, self.right_component = left_component, right_component
+        self.partner, self.confidence = partner, confidence
+        self.dirty, self.affected = set(), set()
+        self._changed.update(("joined", "arrays"))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Re-solve the class matches of two string dumps, reusing the state of a previous run.")
+    parser.add_argument("version1", help="Path to the first JSON file (optionally .gz/.zst)")
+    parser.add_argument("version2", help="Path to the second JSON file (optionally .gz/.zst)")
+    parser.add_argument("output_file", help="Path to output JSON file for solution")
+    parser.add_argument("--state", required=True, help="State directory, created on the first run")
+    parser.add_argument("--no-assignment", action="store_true",
+                        help="Only propagate; leave ambiguous constraints unmatched")
+    parser.add_argument("--min-confidence", type=float, default=0.0,
+                        help="Drop assignment-stage mappings below this confidence (0..1)")
+    parser.add_argument("--exact-max-size", type=int, default=EXACT_MAX_SIZE,
+                        help="Run the exact solver on residual components with at most this many "
+                             "v1 classes (0 disables it)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    start = time.perf_counter()
+    with IncrementalSolver.load(args.state, not args.no_assignment, args.min_confidence,
+                                args.exact_max_size) as solver:
+        for side, path in enumerate((args.version1, args.version2)):
+            changed = solver.update(side, path)
+            print(f"{path}: " + ("unchanged" if changed is None else f"{changed} strings changed"))
+
+        solution, _, remaining = solver.solve()
+        solver.save(args.state)
+    write_solution(args.output_file, solution)
+
+    print(f"Remaining constraints: {remaining}")
+    print(f"Number of solved mappings: {len(solution)}")
+    print(f"Solution saved to {args.output_file} in {time.perf_counter() - start:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
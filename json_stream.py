@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Streaming reader for the string -> classes JSON dumps.
+
+The dumps written by create_strings_to_classes_json.java (and the JEB
+exporters) are one top-level object mapping each string literal to a list of
+class names. iter_string_index yields the (string, classes) entries one at a
+time while reading the file in chunks, so the raw text is never held in memory
+as a whole. gzip and zstd compressed dumps are detected by their magic bytes.
+"""
+import gzip
+import io
+import json
+import re
+from json.decoder import scanstring
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+CHUNK_SIZE = 1 << 16
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def open_dump(path) -> TextIO:
+    """Open a plain, gzip or zstd compressed JSON dump as a text stream."""
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if magic == ZSTD_MAGIC:
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f"{path} is zstd compressed; install the 'zstandard' package to read it")
+        raw = open(path, 'rb')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True),
+                                encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+class ChunkedParser:
+    """
+    Incremental parser over a text stream, refilling its buffer on demand.
+
+    Given start_byte, the byte offset in the file where the stream starts,
+    it also keeps track of byte offsets (see byte_offset); the stream must
+    then be opened without newline translation (newline='').
+    """
+
+    def __init__(self, stream: TextIO, chunk_size: int = CHUNK_SIZE, start_byte: Optional[int] = None):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+        self.track_bytes = start_byte is not None
+        # Byte offset of buf[mark], advanced by encoding the text in between
+        self.mark = 0
+        self.mark_byte = start_byte or 0
+
+    def byte_offset(self, pos: Optional[int] = None) -> int:
+        """Byte offset in the file of buffer position pos, the current position by default."""
+        pos = self.pos if pos is None else pos
+        self.mark_byte += len(self.buf[self.mark:pos].encode('utf-8', 'surrogatepass'))
+        self.mark = pos
+        return self.mark_byte
+
+    def fill(self) -> bool:
+        """Append the next chunk, dropping the consumed prefix. False at EOF."""
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            return False
+        if self.track_bytes:
+            self.byte_offset()
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = self.mark = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at EOF)."""
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self.fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            where = f"byte {self.byte_offset()}" if self.track_bytes else f"character {self.pos}"
+            raise ValueError(f"Expected {char!r} at {where}, found {found!r}")
+        self.pos += 1
+
+    def parse(self, parse_func):
+        """Run a (buffer, position) -> (value, end) parser, reading more input as needed."""
+        while True:
+            try:
+                value, end = parse_func(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Most likely the value is cut off at the end of the buffer
+                if not self.fill():
+                    raise
+                continue
+            # A value that ends exactly at the buffer end might continue
+            if end == len(self.buf) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def string(self) -> str:
+        self.expect('"')
+        return self.parse(scanstring)
+
+    def value(self):
+        self.peek()
+        return self.parse(self.decoder.raw_decode)
+
+
+def iter_string_index(path, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, List[str]]]:
+    """Yield the (string, classes) entries of a dump without loading it whole."""
+    with open_dump(path) as stream:
+        parser = ChunkedParser(stream, chunk_size)
+        try:
+            parser.expect('{')
+        except ValueError:
+            raise ValueError(f"{path} must contain a top-level JSON object (dict)")
+        if parser.peek() == '}':
+            return
+        while True:
+            key = parser.string()
+            parser.expect(':')
+            yield key, parser.value()
+            separator = parser.peek()
+            parser.pos += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError(f"Expected ',' or '}}' in {path}, found {separator!r}")
+
+
+def load_string_index(path) -> Dict[str, List[str]]:
+    """Materialize a whole dump as a dict, reading it incrementally."""
+    return dict(iter_string_index(path))
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Normalized method body hashes, for matching classes whose code is unchanged.
+
+Every method's bytecode is read straight from the dex files (see dex_file.py)
+and reduced to what survives obfuscation and register allocation: opcodes,
+literals, branch offsets, string constants, and references with app class,
+field and method names erased (framework references keep their names).
+Register numbers are dropped. Each normalized body is hashed into 64 bits,
+with xxh3 when the xxhash package is installed and blake2b otherwise, and
+kept in a hash -> methods index. A class's code hash is the hash of the
+multiset of its method hashes.
+
+Classes whose code hash is unique in both versions are exact duplicates and
+are handed to the solver as seed matches, ahead of string propagation.
+"""
+import argparse
+import hashlib
+import json
+import sys
+from typing import Dict, List, Tuple
+
+from class_fingerprints import APP_TYPE, normalize_type
+from dex_file import DexFile, iter_instructions, open_dex_files
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+HASH_NAME = "xxh3_64" if xxhash else "blake2b_64"
+
+# Classes with less code than this (in 16-bit units, over all methods) are
+# never matched on their hash alone: trivial bodies are too easy to repeat
+MIN_CODE_UNITS = 16
+
+CONST_STRING, CONST_STRING_JUMBO = 0x1a, 0x1b
+TYPE_OPCODES = frozenset([0x1c, 0x1f, 0x20, 0x22, 0x23, 0x24, 0x25])
+FIELD_OPCODES = frozenset(range(0x52, 0x6e))
+METHOD_OPCODES = frozenset([*range(0x6e, 0x73), *range(0x74, 0x79), 0xfa, 0xfb])
+PROTO_OPCODE = 0xff
+# opcode -> (first unit, last unit) of its literal or branch offset; register bits are masked out below
+OPERAND_UNITS = {
+    0x13: (1, 1), 0x14: (1, 2), 0x15: (1, 1), 0x16: (1, 1), 0x17: (1, 2), 0x18: (1, 4), 0x19: (1, 1),
+    0x26: (1, 2), 0x29: (1, 1), 0x2a: (1, 2), 0x2b: (1, 2), 0x2c: (1, 2),
+    **{opcode: (1, 1) for opcode in range(0x32, 0x3e)},
+    **{opcode: (1, 1) for opcode in range(0xd0, 0xd8)},
+}
+
+
+def hash64(data: bytes) -> int:
+    """Fast 64-bit hash of a normalized body."""
+    if xxhash:
+        return xxhash.xxh3_64_intdigest(data)
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+class BodyNormalizer:
+    """Renders the bytecode of one dex file's methods without registers and obfuscated names."""
+
+    def __init__(self, dex: DexFile, app_classes):
+        self.dex = dex
+        self.app_classes = app_classes
+        self._refs: Dict[Tuple[int, int], str] = {}
+
+    def _type(self, descriptor: str) -> str:
+        return normalize_type(descriptor, self.app_classes)
+
+    def signature(self, proto) -> str:
+        """Normalized method signature '(parameter types)return type'."""
+        return_type, parameters = proto
+        return f"({''.join(map(self._type, parameters))}){self._type(return_type)}"
+
+    def _member(self, owner: str, name: str, signature: str) -> str:
+        owner = self._type(owner)
+        return f"{owner}->{'*' if owner == APP_TYPE else name}{signature}"
+
+    def reference(self, opcode: int, index: int) -> str:
+        """Normalized target of an index operand, memoized per dex."""
+        key = (opcode, index)
+        ref = self._refs.get(key)
+        if ref is None:
+            dex = self.dex
+            if opcode in (CONST_STRING, CONST_STRING_JUMBO):
+                ref = repr(dex.string(index))
+            elif opcode in TYPE_OPCODES:
+                ref = self._type(dex.type_descriptor(index))
+            elif opcode in FIELD_OPCODES:
+                owner, name, field_type = dex.field_ref(index)
+                ref = self._member(owner, name, ":" + self._type(field_type))
+            elif opcode in METHOD_OPCODES:
+                owner, name, proto = dex.method_ref(index)
+                ref = self._member(owner, name, self.signature(proto))
+            else:  # const-method-type
+                ref = self.signature(dex.proto(index))
+            self._refs[key] = ref
+        return ref
+
+    def normalize(self, units) -> bytes:
+        """The normalized form of a method body given as code units."""
+        tokens = []
+        for pc, width in iter_instructions(units):
+            unit = units[pc]
+            opcode = unit & 0xff
+            if opcode == 0 and unit:
+                # Switch and array payloads: keys, targets and data, no registers
+                tokens.append(units[pc:pc + width].tobytes().hex())
+            elif opcode == CONST_STRING_JUMBO:
+                tokens.append(f"{CONST_STRING:02x} {self.reference(opcode, units[pc + 1] | units[pc + 2] << 16)}")
+            elif opcode == CONST_STRING or opcode in TYPE_OPCODES or opcode in FIELD_OPCODES \
+                    or opcode in METHOD_OPCODES or opcode == PROTO_OPCODE:
+                tokens.append(f"{opcode:02x} {self.reference(opcode, units[pc + 1])}")
+            elif opcode == 0x12:  # const/4: literal in the top nibble
+                tokens.append(f"12 {unit >> 12}")
+            elif opcode == 0x28:  # goto: offset in the top byte
+                tokens.append(f"28 {unit >> 8}")
+            elif 0xd8 <= opcode <= 0xe2:  # binop/lit8: literal in the top byte of the second unit
+                tokens.append(f"{opcode:02x} {units[pc + 1] >> 8}")
+            elif opcode in OPERAND_UNITS:
+                first, last = OPERAND_UNITS[opcode]
+                tokens.append(f"{opcode:02x} {units[pc + first:pc + last + 1].tobytes().hex()}")
+            else:
+                tokens.append(f"{opcode:02x}")
+        return "\n".join(tokens).encode('utf-8', 'surrogatepass')
+
+
+class MethodHashIndex:
+    """Normalized body hashes of every method of one APK, indexed both ways."""
+
+    def __init__(self):
+        # {body hash: ["class->method(proto)", ...]}
+        self.methods: Dict[int, List[str]] = {}
+        # {class name: (code hash, code units)}
+        self.classes: Dict[str, Tuple[int, int]] = {}
+
+    @classmethod
+    def from_apk(cls, apk, package_prefix: str = "") -> "MethodHashIndex":
+        index = cls()
+        dex_files = open_dex_files(apk)
+        app_classes = {name.replace('.', '/') for dex in dex_files for name, _ in dex.iter_classes()}
+        for dex in dex_files:
+            normalizer = BodyNormalizer(dex, app_classes)
+            for class_name, class_data_off in dex.iter_classes():
+                if not class_name.startswith(package_prefix) or class_name in index.classes:
+                    continue
+                body_hashes, code_units = [], 0
+                for method_idx, code_off in dex.iter_methods(class_data_off):
+                    if not code_off:
+                        continue
+                    units = dex.code_units(code_off)
+                    h = hash64(normalizer.normalize(units))
+                    body_hashes.append(h)
+                    code_units += len(units)
+                    _, name, proto = dex.method_ref(method_idx)
+                    index.methods.setdefault(h, []).append(f"{class_name}->{name}{normalizer.signature(proto)}")
+                class_hash = hash64(b"".join(h.to_bytes(8, 'little') for h in sorted(body_hashes)))
+                index.classes[class_name] = (class_hash, code_units)
+        return index
+
+    def to_dict(self) -> Dict[str, List[str]]:
+        """{hex body hash: methods}, for exporting."""
+        return {f"{h:016x}": methods for h, methods in self.methods.items()}
+
+
+def match_duplicate_classes(index1: MethodHashIndex, index2: MethodHashIndex,
+                            min_code_units: int = MIN_CODE_UNITS) -> Dict[str, str]:
+    """{v1 class: v2 class} for classes whose code hash is unique in both versions."""
+    def by_hash(index):
+        classes: Dict[int, List[str]] = {}
+        for name, (h, code_units) in index.classes.items():
+            classes.setdefault(h, []).append(name if code_units >= min_code_units else None)
+        return classes
+
+    classes1, classes2 = by_hash(index1), by_hash(index2)
+    return {names[0]: classes2[h][0] for h, names in classes1.items()
+            if len(names) == 1 and names[0] and len(classes2.get(h, ())) == 1 and classes2[h][0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Match classes with identical normalized method bodies.")
+    parser.add_argument("apk1", help="First APK (or dex) file")
+    parser.add_argument("package1", help="Package prefix for the first APK")
+    parser.add_argument("apk2", help="Second APK (or dex) file")
+    parser.add_argument("package2", help="Package prefix for the second APK")
+    parser.add_argument("output_file", help="Path to output JSON file for the duplicate class matches")
+    parser.add_argument("--min-code-units", type=int, default=MIN_CODE_UNITS,
+                        help="Ignore classes with less bytecode than this (16-bit units)")
+    parser.add_argument("--export-index", nargs=2, metavar=("INDEX1", "INDEX2"),
+                        help="Write the hash -> methods index of both versions as JSON")
+    args = parser.parse_args()
+
+    try:
+        index1 = MethodHashIndex.from_apk(args.apk1, args.package1)
+        index2 = MethodHashIndex.from_apk(args.apk2, args.package2)
+    except (OSError, ValueError) as e:
+        print(f"Error reading input: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Hashed {len(index1.classes)} and {len(index2.classes)} classes with {HASH_NAME}")
+
+    result = match_duplicate_classes(index1, index2, args.min_code_units)
+    with open(args.output_file, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"Number of duplicate class matches: {len(result)}")
+    print(f"Matches saved to {args.output_file}")
+
+    if args.export_index:
+        for index, path in zip((index1, index2), args.export_index):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(index.to_dict(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
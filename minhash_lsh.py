@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+MinHash signatures and an LSH banding index for fuzzy class similarity.
+
+Every class is described by a feature set: its string literals, and
+optionally the normalized types of its members (class_fingerprints.py) and
+its method body hashes (method_body_hashes.py). A MinHash signature of
+NUM_PERMUTATIONS values estimates the Jaccard similarity of two feature
+sets. The signatures of version 2 are split into bands and indexed, so the
+candidates of a version 1 class are the classes sharing at least one band
+bucket with it, not every class of version 2.
+
+The shortlist {v1 class: [(v2 class, estimated similarity), ...]} can be
+passed to solve_class_matches_between_versions.py (--shortlist) to restrict
+the assignment stage to those pairs.
+"""
+import argparse
+import hashlib
+import json
+import random
+import sys
+from array import array
+from typing import Dict, Iterable, List, Set, Tuple
+
+from class_fingerprints import class_features
+from json_stream import iter_string_index
+from method_body_hashes import MethodHashIndex
+
+NUM_PERMUTATIONS = 128
+NUM_BANDS = 32  # 4 rows per band: pairs above ~0.42 similarity are likely candidates
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+SIGNATURE_TYPECODE = 'Q'
+SEED = 1
+
+FeatureSets = Dict[str, Set[str]]
+
+
+def feature_hash(feature: str) -> int:
+    """Stable 32-bit hash of one feature (Python's hash() changes between runs)."""
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8', 'surrogatepass'), digest_size=4).digest(),
+                          'little')
+
+
+def string_features(path, features: FeatureSets = None) -> FeatureSets:
+    """Add every class's string literals ("s:" features) from a string -> classes dump."""
+    features = {} if features is None else features
+    for string, classes in iter_string_index(path):
+        feature = "s:" + string
+        for name in classes:
+            features.setdefault(name, set()).add(feature)
+    return features
+
+
+def member_features(metadata: Dict, features: FeatureSets = None) -> FeatureSets:
+    """Add normalized field types and method signatures ("f:" / "m:") from extract_types.py metadata."""
+    features = {} if features is None else features
+    app_classes = set(metadata)
+    for name, meta in metadata.items():
+        class_set = features.setdefault(name.replace('/', '.'), set())
+        items = class_features(meta, app_classes)
+        # Repeated items are numbered so the multiset survives as a set
+        for prefix, values in (("f:", items["fields"]), ("m:", items["signatures"])):
+            seen: Dict[str, int] = {}
+            for value in values:
+                seen[value] = seen.get(value, 0) + 1
+                class_set.add(f"{prefix}{value}#{seen[value]}")
+    return features
+
+
+def body_features(index: MethodHashIndex, features: FeatureSets = None) -> FeatureSets:
+    """Add method body hashes ("b:") from a method_body_hashes.MethodHashIndex."""
+    features = {} if features is None else features
+    for h, methods in index.methods.items():
+        for method in methods:
+            features.setdefault(method.split("->", 1)[0], set()).add(f"b:{h:016x}")
+    return features
+
+
+class MinHasher:
+    """NUM_PERMUTATIONS universal hash functions (a * x + b) mod p, the same for both versions."""
+
+    def __init__(self, num_permutations: int = NUM_PERMUTATIONS, seed: int = SEED):
+        rng = random.Random(seed)
+        self.num_permutations = num_permutations
+        self.params = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+                       for _ in range(num_permutations)]
+
+    def signature(self, features: Iterable[str]) -> List[int]:
+        """MinHash signature of a feature set; all MAX_HASH for an empty set."""
+        hashes = [feature_hash(f) for f in features]
+        if not hashes:
+            return [MAX_HASH] * self.num_permutations
+        p = MERSENNE_PRIME
+        return [min((a * x + b) % p for x in hashes) & MAX_HASH for a, b in self.params]
+
+
+class MinHashIndex:
+    """Signatures of one version's classes, stored flat, plus their LSH band buckets."""
+
+    def __init__(self, hasher: MinHasher, num_bands: int = NUM_BANDS):
+        if hasher.num_permutations % num_bands:
+            raise ValueError(f"{hasher.num_permutations} permutations do not split into {num_bands} bands")
+        self.hasher = hasher
+        self.num_bands = num_bands
+        self.rows = hasher.num_permutations // num_bands
+        self.names: List[str] = []
+        self.signatures = array(SIGNATURE_TYPECODE)
+        self.buckets: List[Dict[Tuple[int, ...], List[int]]] = [{} for _ in range(num_bands)]
+
+    def signature_of(self, class_id: int) -> array:
+        k = self.hasher.num_permutations
+        return self.signatures[class_id * k:(class_id + 1) * k]
+
+    def add(self, name: str, features: Iterable[str]):
+        class_id = len(self.names)
+        self.names.append(name)
+        signature = self.hasher.signature(features)
+        self.signatures.extend(signature)
+        for band, buckets in enumerate(self.buckets):
+            key = tuple(signature[band * self.rows:(band + 1) * self.rows])
+            buckets.setdefault(key, []).append(class_id)
+
+    @classmethod
+    def build(cls, features: FeatureSets, hasher: MinHasher, num_bands: int = NUM_BANDS) -> "MinHashIndex":
+        index = cls(hasher, num_bands)
+        for name, class_set in features.items():
+            if class_set:
+                index.add(name, class_set)
+        return index
+
+    def query(self, features: Iterable[str], min_similarity: float = 0.0,
+              limit: int = 10) -> List[Tuple[str, float]]:
+        """Most similar indexed classes as (name, estimated Jaccard similarity), best first."""
+        signature = self.hasher.signature(features)
+        candidates = set()
+        for band, buckets in enumerate(self.buckets):
+            candidates.update(buckets.get(tuple(signature[band * self.rows:(band + 1) * self.rows]), ()))
+        k = self.hasher.num_permutations
+        scored = []
+        for class_id in candidates:
+            other = self.signature_of(class_id)
+            similarity = sum(1 for x, y in zip(signature, other) if x == y) / k
+            if similarity >= min_similarity:
+                scored.append((self.names[class_id], similarity))
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:limit]
+
+
+def build_shortlist(features1: FeatureSets, features2: FeatureSets, min_similarity: float = 0.0,
+                    limit: int = 10, num_bands: int = NUM_BANDS) -> Dict[str, List[Tuple[str, float]]]:
+    """{v1 class: [(v2 class, similarity), ...]} for every v1 class with at least one candidate."""
+    hasher = MinHasher()
+    index2 = MinHashIndex.build(features2, hasher, num_bands)
+    shortlist = {}
+    for name, class_set in features1.items():
+        if class_set:
+            candidates = index2.query(class_set, min_similarity, limit)
+            if candidates:
+                shortlist[name] = candidates
+    return shortlist
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Shortlist likely v2 matches of every v1 class with MinHash/LSH.")
+    parser.add_argument("version1", help="String -> classes JSON of version 1")
+    parser.add_argument("version2", help="String -> classes JSON of version 2")
+    parser.add_argument("output_file", help="Path to output JSON file for the shortlist")
+    parser.add_argument("--meta", nargs=2, metavar=("META1", "META2"),
+                        help="Also use member types from extract_types.py metadata of both versions")
+    parser.add_argument("--apks", nargs=4, metavar=("APK1", "PACKAGE1", "APK2", "PACKAGE2"),
+                        help="Also use normalized method body hashes read from both APKs")
+    parser.add_argument("--bands", type=int, default=NUM_BANDS,
+                        help=f"LSH bands over the {NUM_PERMUTATIONS} signature values; more bands "
+                             f"find less similar candidates")
+    parser.add_argument("--min-similarity", type=float, default=0.2,
+                        help="Drop candidates with a lower estimated Jaccard similarity")
+    parser.add_argument("--limit", type=int, default=10, help="Candidates kept per v1 class")
+    args = parser.parse_args()
+
+    try:
+        features1, features2 = string_features(args.version1), string_features(args.version2)
+        if args.meta:
+            for path, features in zip(args.meta, (features1, features2)):
+                with open(path, 'r', encoding='utf-8') as f:
+                    member_features(json.load(f), features)
+        if args.apks:
+            apk1, package1, apk2, package2 = args.apks
+            body_features(MethodHashIndex.from_apk(apk1, package1), features1)
+            body_features(MethodHashIndex.from_apk(apk2, package2), features2)
+    except (OSError, ValueError) as e:
+        print(f"Error reading input: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    shortlist = build_shortlist(features1, features2, args.min_similarity, args.limit, args.bands)
+    with open(args.output_file, 'w', encoding='utf-8') as f:
+        json.dump({name: [[candidate, round(similarity, 4)] for candidate, similarity in candidates]
+                   for name, candidates in shortlist.items()}, f, indent=2)
+
+    sizes = [len(candidates) for candidates in shortlist.values()]
+    print(f"Shortlisted {len(shortlist)} of {len(features1)} classes, "
+          f"{sum(sizes) / max(1, len(sizes)):.1f} candidates on average")
+    print(f"Shortlist saved to {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
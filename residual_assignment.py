@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Second solving stage: maximum-weight bipartite matching on the constraints
+that propagation could not resolve.
+
+Every remaining constraint links each of its version 1 classes to each of its
+version 2 classes; the weight of an edge is the number of shared strings
+supporting it, or the sum of their IDF weights. The graph is split into
+connected components and each one is matched on its own: exactly by
+shortest augmenting paths over its edges (a sparse Hungarian method, no
+n x m matrix is built) when it has few enough edges, greedily by
+descending weight otherwise.
+"""
+import heapq
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from constraint_set import ConstraintSet
+
+# Components with more edges than this are matched greedily
+MAX_EXACT_EDGES = 200000
+
+
+def build_edges(constraints: ConstraintSet, string_weights: Optional[Dict[str, float]] = None,
+                allowed: Optional[Dict[int, Set[int]]] = None) -> Dict[Tuple[int, int], float]:
+    """
+    Edge weights {(v1 id, v2 id): shared strings} of the remaining constraints.
+    With string_weights each string adds its own weight instead of 1. With
+    allowed {v1 id: v2 ids}, e.g. a MinHash shortlist, only those pairs
+    become edges, and each constraint only looks at the candidates of its
+    v1 classes instead of every (v1, v2) pair it links.
+    """
+    weights: Dict[Tuple[int, int], float] = defaultdict(float)
+    for i in range(len(constraints)):
+        left, right = constraints.left(i), constraints.right(i)
+        if not left or not right:
+            continue
+        weight = string_weights.get(constraints.strings[i], 1.0) if string_weights else 1.0
+        if allowed is None:
+            for l in left:
+                for r in right:
+                    weights[(l, r)] += weight
+            continue
+        right_set = set(right)
+        for l in left:
+            for r in allowed.get(l, ()):
+                if r in right_set:
+                    weights[(l, r)] += weight
+    return weights
+
+
+def evidence_totals(constraints: ConstraintSet, string_weights: Optional[Dict[str, float]] = None):
+    """
+    Total edge weight of every v1 and v2 class over all the pairs its
+    constraints link, shortlisted or not: ({v1 id: total}, {v2 id: total}).
+    """
+    left_total: Dict[int, float] = defaultdict(float)
+    right_total: Dict[int, float] = defaultdict(float)
+    for i in range(len(constraints)):
+        left, right = constraints.left(i), constraints.right(i)
+        if not left or not right:
+            continue
+        weight = string_weights.get(constraints.strings[i], 1.0) if string_weights else 1.0
+        for l in left:
+            left_total[l] += weight * len(right)
+        for r in right:
+            right_total[r] += weight * len(left)
+    return left_total, right_total
+
+
+def connected_components(weights) -> List[Tuple[List[int], List[int], List[Tuple[int, int, float]]]]:
+    """Split the weighted bipartite graph into (v1 ids, v2 ids, edges (l, r, weight)) components."""
+    left_adjacent = defaultdict(list)
+    right_adjacent = defaultdict(list)
+    for (l, r), w in weights.items():
+        left_adjacent[l].append((r, w))
+        right_adjacent[r].append(l)
+
+    components = []
+    seen_left, seen_right = set(), set()
+    for start in left_adjacent:
+        if start in seen_left:
+            continue
+        lefts, rights, edges = [start], [], []
+        seen_left.add(start)
+        stack = [start]
+        while stack:
+            l = stack.pop()
+            for r, w in left_adjacent[l]:
+                edges.append((l, r, w))
+                if r in seen_right:
+                    continue
+                seen_right.add(r)
+                rights.append(r)
+                for other in right_adjacent[r]:
+                    if other not in seen_left:
+                        seen_left.add(other)
+                        lefts.append(other)
+                        stack.append(other)
+        components.append((lefts, rights, edges))
+    return components
+
+
+def max_weight_matching(lefts, rights, edges) -> List[Tuple[int, int]]:
+    """
+    Maximum-weight (not necessarily perfect) matching of a bipartite graph
+    given as (l, r, weight) edges with positive weights.
+
+    Sparse shortest augmenting path assignment (the Dijkstra form of the
+    Hungarian method, as in LAPJV): costs are -weight, and every v1 class
+    also has a private zero-cost "unmatched" column, so a full assignment
+    of the v1 classes is a maximum-weight matching. Each v1 class is added
+    with one Dijkstra over the alternating tree it reaches, which only
+    visits real edges; no n x m matrix is built.
+    """
+    adjacent: Dict[int, List[Tuple[int, float]]] = {l: [(-(i + 1), 0.0)] for i, l in enumerate(lefts)}
+    for l, r, w in edges:
+        adjacent[l].append((r, -w))
+    # Reduced costs c - u[l] - v[r] stay >= 0, and are 0 on matched edges
+    u = {l: min(c for _, c in adjacent[l]) for l in lefts}
+    v: Dict[int, float] = defaultdict(float)
+    owner: Dict[int, int] = {}  # column -> v1 class
+    inf = float('inf')
+
+    for root in lefts:
+        distance = {}
+        previous = {}  # column -> column whose owner reached it, None from the root
+        settled = []
+        queue = []
+        for r, c in adjacent[root]:
+            d = c - u[root] - v[r]
+            if d < distance.get(r, inf):
+                distance[r] = d
+                previous[r] = None
+                heapq.heappush(queue, (d, r))
+        done = set()
+        while True:
+            d, r = heapq.heappop(queue)
+            if r in done or d > distance[r]:
+                continue
+            done.add(r)
+            if r not in owner:
+                final, limit = r, d
+                break
+            settled.append(r)
+            l = owner[r]
+            for r2, c in adjacent[l]:
+                nd = d + c - u[l] - v[r2]
+                if r2 not in done and nd < distance.get(r2, inf):
+                    distance[r2] = nd
+                    previous[r2] = r
+                    heapq.heappush(queue, (nd, r2))
+
+        # Potentials of the tree, see the reduced cost invariant above
+        u[root] += limit
+        for r in settled:
+            u[owner[r]] += limit - distance[r]
+            v[r] -= limit - distance[r]
+        r = final
+        while previous[r] is not None:
+            owner[r] = owner[previous[r]]
+            r = previous[r]
+        owner[r] = root
+
+    return [(l, r) for r, l in owner.items() if r >= 0]
+
+
+def match_component(lefts, rights, edges) -> List[Tuple[int, int]]:
+    """Maximum-weight matching of one component, as (v1 id, v2 id) pairs."""
+    if len(edges) > MAX_EXACT_EDGES:
+        return match_greedy(edges)
+    return max_weight_matching(lefts, rights, edges)
+
+
+def match_greedy(edges) -> List[Tuple[int, int]]:
+    """Greedy matching by descending weight, for components too big to match exactly."""
+    used_left, used_right = set(), set()
+    pairs = []
+    for l, r, _ in sorted(edges, key=lambda edge: (-edge[2], edge[0], edge[1])):
+        if l not in used_left and r not in used_right:
+            used_left.add(l)
+            used_right.add(r)
+            pairs.append((l, r))
+    return pairs
+
+
+def assign_remaining(constraints: ConstraintSet, string_weights: Optional[Dict[str, float]] = None,
+                     allowed: Optional[Dict[int, Set[int]]] = None) -> Dict[int, Tuple[int, float]]:
+    """
+    Match the classes of the remaining constraints, over the allowed
+    {v1 id: v2 ids} pairs only if given.
+
+    Returns {v1 id: (v2 id, confidence)}. The confidence of a pair is its edge
+    weight over the larger of the two classes' total weights: 1.0 means all
+    the evidence of both classes points at each other. The totals include
+    the pairs a shortlist left out, so a shortlist does not inflate them.
+    """
+    weights = build_edges(constraints, string_weights, allowed)
+    left_total, right_total = evidence_totals(constraints, string_weights)
+
+    result = {}
+    for lefts, rights, edges in connected_components(weights):
+        for l, r in match_component(lefts, rights, edges):
+            w = weights[(l, r)]
+            result[l] = (r, w / max(left_total[l], right_total[r]))
+    return result
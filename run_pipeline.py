@@ -92,27 +92,78 @@ import sys
 import os
 import argparse
 import logging
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from artifact_cache import ArtifactCache, cache_key, file_sha256, source_version
+from constraint_format import read_constraints, write_constraints
+from create_constrait_problem_from_jsons import pair_matching_keys_streaming
+from incremental_solve import IncrementalSolver
+from method_body_hashes import MethodHashIndex, match_duplicate_classes
+from solve_class_matches_between_versions import (merge_extra_seeds, seed_ids, solution_names, solve_staged,
+                                                   write_solution)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SOOT_JAR = "soot-4.6.0-jar-with-dependencies.jar"
+EXTRACTOR_SOURCE = "create_strings_to_classes_json.java"
+# Python extractor reading the dex files directly, no JVM or Android SDK needed
+DEX_EXTRACTOR_SOURCES = ["dex_file.py", "dex_strings_to_classes_json.py"]
+EXTRACTORS = ["dex", "soot"]
+# Sources whose content decides the constraints and matches
+SOLVER_SOURCES = ["json_stream.py", "constraint_set.py", "constraint_format.py",
+                  "create_constrait_problem_from_jsons.py", "solve_class_matches_between_versions.py",
+                  "residual_assignment.py", "exact_solver.py", "incremental_solve.py",
+                  "dex_file.py", "class_fingerprints.py", "method_body_hashes.py"]
+
+# Artifact names inside a cache entry
+STRINGS_ARTIFACT = "strings.json"
+CONSTRAINTS_ARTIFACT = "constraints.bin"
+MATCHES_ARTIFACT = "matches.json"
+
+# Bounds the number of extractors running at once, JVMs or dex extractors, see set_max_jvms
+jvm_slots = threading.BoundedSemaphore(2)
+# Worker processes of one dex extractor, its share of the CPUs, see set_max_jvms
+dex_jobs = max(1, (os.cpu_count() or 1) // 2)
+# String extractor used by run_extractor, see set_extractor
+extractor = "dex"
 
-# Configure logging
 logger = logging.getLogger("pipeline")
-logger.setLevel(logging.DEBUG)
-
-# File handler: all DEBUG+ go to file
-file_handler = logging.FileHandler("pipeline.log", mode="w", encoding="utf-8")
-file_handler.setLevel(logging.DEBUG)
-file_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
-file_handler.setFormatter(file_formatter)
-logger.addHandler(file_handler)
-
-# Stream handler: only INFO+ to stdout
-stream_handler = logging.StreamHandler(sys.stdout)
-stream_handler.setLevel(logging.INFO)
-stream_formatter = logging.Formatter("%(message)s")
-stream_handler.setFormatter(stream_formatter)
-logger.addHandler(stream_handler)
-
-def run_command(cmd):
-    """Run a single command and print its output live."""
+
+def setup_logging(log_path="pipeline.log"):
+    """
+    Log DEBUG+ to log_path and INFO+ to stdout. Called from main(), not at
+    import, so worker processes re-importing this module do not truncate
+    the log.
+    """
+    if logger.handlers:
+        return
+    logger.setLevel(logging.DEBUG)
+
+    # File handler: all DEBUG+ go to file
+    file_handler = logging.FileHandler(log_path, mode="w", encoding="utf-8")
+    file_handler.setLevel(logging.DEBUG)
+    file_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+    file_handler.setFormatter(file_formatter)
+    logger.addHandler(file_handler)
+
+    # Stream handler: only INFO+ to stdout
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setLevel(logging.INFO)
+    stream_formatter = logging.Formatter("%(message)s")
+    stream_handler.setFormatter(stream_formatter)
+    logger.addHandler(stream_handler)
+
+def run_command(cmd, prefix=None):
+    """
+    Run a single command and print its output live.
+    With a prefix every output line is tagged, so concurrent commands can share the log.
+    Raises CalledProcessError if it fails; it may run in a worker thread, so
+    the caller decides how to exit.
+    """
     logger.debug("Running command: %s", " ".join(cmd))
     process = subprocess.Popen(
         cmd,
@@ -123,74 +174,312 @@ def run_command(cmd):
 
     # Print command output line by line as INFO
     for line in process.stdout:
-        logger.info(line.rstrip())
+        if prefix:
+            logger.info(f"[{prefix}] {line.rstrip()}")
+        else:
+            logger.info(line.rstrip())
 
     process.wait()
     if process.returncode != 0:
-        logger.info(f"Command failed with exit code {process.returncode}")
-        sys.exit(process.returncode)
+        raise subprocess.CalledProcessError(process.returncode, cmd)
 
-def main():
-    parser = argparse.ArgumentParser(description="Run APK comparison pipeline.")
-    parser.add_argument("apk1", help="First APK file")
-    parser.add_argument("package1", help="Package name for first APK")
-    parser.add_argument("apk2", help="Second APK file")
-    parser.add_argument("package2", help="Package name for second APK")
-    parser.add_argument("--force", action="store_true",
-                        help="If set, re-generate the JSONs even if they exist")
+def artifact_bases(paths):
+    """
+    Base name of every input for naming its artifacts. Inputs with the same
+    file name in different directories get a _1, _2, ... suffix, so they are
+    not extracted to the same file.
+    """
+    bases = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    repeated = {base for base, count in Counter(bases).items() if count > 1}
+    seen = Counter()
+    unique = []
+    for base in bases:
+        if base in repeated:
+            seen[base] += 1
+            base = f"{base}_{seen[base]}"
+        unique.append(base)
+    return unique
 
-    args = parser.parse_args()
+@contextmanager
+def timed_stage(name):
+    """Log how long the wrapped pipeline stage took."""
+    start = time.perf_counter()
+    yield
+    logger.info(f"[timing] {name}: {time.perf_counter() - start:.3f}s")
+
+def extractor_version():
+    """Version of the string extractor: its sources, and the Soot jar for the Soot extractor."""
+    if extractor == "dex":
+        return f"dex:{source_version(*(os.path.join(SCRIPT_DIR, name) for name in DEX_EXTRACTOR_SOURCES))}"
+    return f"{source_version(os.path.join(SCRIPT_DIR, EXTRACTOR_SOURCE))}:{SOOT_JAR}"
+
+def solver_version():
+    """Version of the constraint builder and solver code."""
+    return source_version(*(os.path.join(SCRIPT_DIR, name) for name in SOLVER_SOURCES))
+
+def set_max_jvms(count):
+    """
+    Limit how many extractors may run concurrently. A dex extractor takes a
+    slot like a JVM and gets count-th of the CPUs for its worker processes,
+    so concurrent extractions do not start more processes than there are CPUs.
+    """
+    global jvm_slots, dex_jobs
+    count = max(1, count)
+    jvm_slots = threading.BoundedSemaphore(count)
+    dex_jobs = max(1, (os.cpu_count() or 1) // count)
+
+def set_extractor(name):
+    """Select the string extractor: "dex" (Python) or "soot" (Java)."""
+    global extractor
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown extractor {name!r}, expected one of {EXTRACTORS}")
+    extractor = name
+
+def run_extractor(apk, json_path, package):
+    """
+    Run the string extractor for one APK once an extractor slot is free.
+    """
+    prefix = os.path.basename(apk)
+    if extractor == "dex":
+        with jvm_slots:
+            with timed_stage(f"extract {json_path}"):
+                run_command([
+                    sys.executable, os.path.join(SCRIPT_DIR, "dex_strings_to_classes_json.py"),
+                    apk, json_path, package, "--jobs", str(dex_jobs)
+                ], prefix=prefix)
+        return
+    with jvm_slots:
+        with timed_stage(f"extract {json_path}"):
+            run_command([
+                "java", "-cp", os.path.join(SCRIPT_DIR, SOOT_JAR),
+                os.path.join(SCRIPT_DIR, EXTRACTOR_SOURCE),
+                apk, json_path, package
+            ], prefix=prefix)
+
+def extract_strings(apk, package, json_path, force, cache):
+    """
+    Steps 1 and 2: string -> classes JSON for one APK.
+    Returns the extraction cache key, or None when running without a cache.
+    """
+    if cache is None:
+        if force or not os.path.exists(json_path):
+            run_extractor(apk, json_path, package)
+        else:
+            logger.info(f"Skipping {json_path}, already exists.")
+        return None
+
+    key = cache_key("extract", file_sha256(apk), package, extractor_version())
+    if not force and cache.fetch(key, STRINGS_ARTIFACT, json_path):
+        logger.info(f"Skipping {json_path}, cached as {key[:12]}.")
+        return key
+    run_extractor(apk, json_path, package)
+    cache.put(key, STRINGS_ARTIFACT, json_path)
+    return key
+
+def find_duplicate_classes(apk1, package1, apk2, package2, seeds_json=None):
+    """
+    Exact duplicate classes by normalized method body hashes, used as seed
+    matches for the solver. Also saved to seeds_json if given.
+    """
+    with timed_stage("method hashes"):
+        index1 = MethodHashIndex.from_apk(apk1, package1)
+        index2 = MethodHashIndex.from_apk(apk2, package2)
+        seeds = match_duplicate_classes(index1, index2)
+    logger.info(f"Duplicate classes: {len(seeds)}")
+    if seeds_json:
+        write_solution(seeds_json, seeds)
+    return seeds
+
+def run_constraints_and_solve_in_process(json1, json2, matches_json,
+                                         cache=None, constraints_key=None, force=False, seed_names=None,
+                                         max_fanout=None, weighting="count"):
+    """
+    Steps 3 and 4 as library calls, handing the constraints over in memory.
+    seed_names {v1 class: v2 class} are fixed before propagation.
+    """
+    cached_constraints = cache.get(constraints_key, CONSTRAINTS_ARTIFACT) if cache and not force else None
+    if cached_constraints:
+        with timed_stage("constraints (cached)"):
+            constraints = read_constraints(cached_constraints)
+    else:
+        with timed_stage("constraints"):
+            constraints, count1, count2 = pair_matching_keys_streaming(json1, json2, max_fanout)
+        logger.info(f"{count1} {count2} {len(constraints)}")
+        if cache:
+            with timed_stage("cache constraints"):
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    tmp_path = os.path.join(tmp_dir, CONSTRAINTS_ARTIFACT)
+                    write_constraints(tmp_path, constraints)
+                    cache.put(constraints_key, CONSTRAINTS_ARTIFACT, tmp_path)
+
+    # Unmaps cached constraints once solved, so the cache can evict the file
+    with timed_stage("solve"), constraints:
+        seeds, reserved, extra_seeds = seed_ids(constraints, seed_names or {})
+        remaining_constraints, solution_ids, _, _ = solve_staged(constraints, weighting=weighting,
+                                                                 seeds=seeds, reserved=reserved)
+        solution = merge_extra_seeds(solution_names(constraints, solution_ids), extra_seeds)
+    logger.info(f"Remaining constraints: {len(remaining_constraints)}")
+    logger.info(f"Number of solved mappings: {len(solution)}")
+
+    with timed_stage("write matches"):
+        write_solution(matches_json, solution)
+
+def run_constraints_and_solve_incremental(json1, json2, matches_json, state_path):
+    """Steps 3 and 4 against the state of the previous run, re-solving only what changed."""
+    with timed_stage("load state"):
+        solver = IncrementalSolver.load(state_path)
+    with solver:
+        with timed_stage("constraints (incremental)"):
+            for side, path in enumerate((json1, json2)):
+                changed = solver.update(side, path)
+                logger.info(f"{path}: " + ("unchanged" if changed is None else f"{changed} strings changed"))
+        with timed_stage("solve (incremental)"):
+            solution, _, remaining = solver.solve()
+        logger.info(f"Remaining constraints: {remaining}")
+        logger.info(f"Number of solved mappings: {len(solution)}")
+
+        with timed_stage("write matches"):
+            write_solution(matches_json, solution)
+        with timed_stage("save state"):
+            solver.save(state_path)
+
+def run_constraints_and_solve_subprocess(json1, json2, constraints_file, matches_json,
+                                         cache=None, constraints_key=None, force=False, seeds_json=None,
+                                         max_fanout=None, weighting="count"):
+    """Steps 3 and 4 as separate scripts talking through the constraints file."""
+    # Step 3: generate constraints
+    if cache and not force and cache.fetch(constraints_key, CONSTRAINTS_ARTIFACT, constraints_file):
+        logger.info(f"Skipping {constraints_file}, cached as {constraints_key[:12]}.")
+    else:
+        with timed_stage("constraints"):
+            run_command([
+                sys.executable, os.path.join(SCRIPT_DIR, "create_constrait_problem_from_jsons.py"),
+                json1, json2, constraints_file,
+                *(["--max-fanout", str(max_fanout)] if max_fanout is not None else [])
+            ])
+        if cache:
+            cache.put(constraints_key, CONSTRAINTS_ARTIFACT, constraints_file)
+
+    # Step 4: solve matches
+    with timed_stage("solve"):
+        run_command([
+            sys.executable, os.path.join(SCRIPT_DIR, "solve_class_matches_between_versions.py"),
+            constraints_file, matches_json, "--weighting", weighting,
+            *(["--seed-matches", seeds_json] if seeds_json else [])
+        ])
+
+def run(args):
+    """Steps 1 to 4 for the parsed command line."""
     apk1, package1, apk2, package2 = args.apk1, args.package1, args.apk2, args.package2
     force = args.force
+    cache = None if args.no_cache else ArtifactCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
 
-    # Derive base names
-    base1 = os.path.splitext(os.path.basename(apk1))[0]
-    base2 = os.path.splitext(os.path.basename(apk2))[0]
+    # Derive base names, distinct even for APKs with the same file name
+    base1, base2 = artifact_bases([apk1, apk2])
 
-    # JSON artifacts
+    # Artifacts
     json1 = f"{base1}.json"
     json2 = f"{base2}.json"
-    constraints_json = f"constraints_{base1}_vs_{base2}.json"
+    constraints_file = f"constraints_{base1}_vs_{base2}.bin"
     matches_json = f"matches_{base1}_vs_{base2}.json"
 
-    # Step 1: generate json1
-    if force or not os.path.exists(json1):
-        run_command([
-            "java", "-cp", "soot-4.6.0-jar-with-dependencies.jar",
-            "create_strings_to_classes_json.java",
-            apk1, json1, package1
-        ])
-    else:
-        logger.info(f"Skipping {json1}, already exists.")
+    # Steps 1 and 2: generate json1 and json2 concurrently
+    set_max_jvms(args.max_jvms)
+    set_extractor(args.extractor)
+    with timed_stage("extraction"):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            future1 = pool.submit(extract_strings, apk1, package1, json1, force, cache)
+            future2 = pool.submit(extract_strings, apk2, package2, json2, force, cache)
+            extract_key1, extract_key2 = future1.result(), future2.result()
 
-    # Step 2: generate json2
-    if force or not os.path.exists(json2):
-        run_command([
-            "java", "-cp", "soot-4.6.0-jar-with-dependencies.jar",
-            "create_strings_to_classes_json.java",
-            apk2, json2, package2
-        ])
-    else:
-        logger.info(f"Skipping {json2}, already exists.")
+    constraints_key = matches_key = None
+    if cache:
+        version = solver_version()
+        constraints_key = cache_key("constraints", extract_key1, extract_key2, version, args.max_fanout)
+        matches_key = cache_key("matches", constraints_key, version, args.method_hashes, args.weighting)
 
-    # Step 3: generate constraints
-    run_command([
-        "python", "create_constrait_problem_from_jsons.py",
-        json1, json2, constraints_json
-    ])
-
-    # Step 4: solve matches
-    run_command([
-        "python", "solve_class_matches_between_versions.py",
-        constraints_json, matches_json
-    ])
+    # With --incremental-state the state has to see every run, so the matches are not cached
+    matches_cache = cache if not args.incremental_state else None
+    if matches_cache and not force and matches_cache.fetch(matches_key, MATCHES_ARTIFACT, matches_json):
+        logger.info(f"Skipping {matches_json}, cached as {matches_key[:12]}.")
+        constraints_file = None
+    else:
+        if args.incremental_state:
+            run_constraints_and_solve_incremental(json1, json2, matches_json, args.incremental_state)
+            constraints_file = None
+        elif args.mode == "inprocess":
+            seeds = find_duplicate_classes(apk1, package1, apk2, package2) if args.method_hashes else None
+            # Steps 3 and 4: constraints stay in memory, no constraints file
+            run_constraints_and_solve_in_process(json1, json2, matches_json,
+                                                 cache, constraints_key, force, seeds,
+                                                 args.max_fanout, args.weighting)
+            constraints_file = None
+        else:
+            seeds_json = None
+            if args.method_hashes:
+                seeds_json = f"duplicates_{base1}_vs_{base2}.json"
+                find_duplicate_classes(apk1, package1, apk2, package2, seeds_json)
+            run_constraints_and_solve_subprocess(json1, json2, constraints_file, matches_json,
+                                                 cache, constraints_key, force, seeds_json,
+                                                 args.max_fanout, args.weighting)
+        if matches_cache:
+            matches_cache.put(matches_key, MATCHES_ARTIFACT, matches_json)
 
     logger.info("\nPipeline finished successfully!")
     logger.info("Artifacts generated:")
     logger.info(f"- {json1}")
     logger.info(f"- {json2}")
-    logger.info(f"- {constraints_json}")
+    if constraints_file:
+        logger.info(f"- {constraints_file}")
     logger.info(f"- {matches_json}")
 
+def main():
+    parser = argparse.ArgumentParser(description="Run APK comparison pipeline.")
+    parser.add_argument("apk1", help="First APK file")
+    parser.add_argument("package1", help="Package name for first APK")
+    parser.add_argument("apk2", help="Second APK file")
+    parser.add_argument("package2", help="Package name for second APK")
+    parser.add_argument("--force", action="store_true",
+                        help="If set, re-generate all artifacts even if they exist or are cached")
+    parser.add_argument("--mode", choices=["inprocess", "subprocess"], default="inprocess",
+                        help="Run the constraint and solve steps as library calls in this process "
+                             "(default) or as separate python scripts")
+    parser.add_argument("--cache-dir", default=".apkdiff_cache",
+                        help="Directory of the content-addressed artifact cache")
+    parser.add_argument("--cache-max-mb", type=int, default=4096,
+                        help="Evict least recently used cache entries beyond this size")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Disable the artifact cache and only skip JSONs that exist by name")
+    parser.add_argument("--max-jvms", type=int, default=2,
+                        help="Maximum number of extractors (JVMs, or dex extractors sharing the CPUs) "
+                             "running at the same time")
+    parser.add_argument("--extractor", choices=EXTRACTORS, default="dex",
+                        help="String extractor: read the dex files directly (default) or run Soot")
+    parser.add_argument("--incremental-state",
+                        help="Keep the constraint join and solved components in this directory and only "
+                             "re-solve what changed since the last run (in-process mode)")
+    parser.add_argument("--method-hashes", action="store_true",
+                        help="Match classes with identical normalized method bodies first and fix them "
+                             "before string propagation")
+    parser.add_argument("--max-fanout", type=int,
+                        help="Drop strings used by more than this many classes in either version "
+                             "(default: keep all)")
+    parser.add_argument("--weighting", choices=["count", "idf"], default="count",
+                        help="Edge weights of the assignment stage: shared string count, or IDF "
+                             "so generic strings weigh less")
+
+    args = parser.parse_args()
+    setup_logging()
+    if args.method_hashes and args.incremental_state:
+        parser.error("--method-hashes cannot be combined with --incremental-state")
+    if args.incremental_state and (args.max_fanout is not None or args.weighting != "count"):
+        parser.error("--max-fanout and --weighting cannot be combined with --incremental-state")
+
+    try:
+        run(args)
+    except subprocess.CalledProcessError as e:
+        logger.info(f"Command failed with exit code {e.returncode}: {' '.join(e.cmd)}")
+        sys.exit(e.returncode)
+
 if __name__ == "__main__":
     main()
@@ -1,116 +1,31 @@
-# from typing import List, Tuple, Dict, Optional, Set
-# import json 
-
-# def solve_renaming1(constraints: List[Tuple[List[str], List[str]]]):
-#     """
-#     constraints: list of pairs ([v1 functions], [v2 functions])
-#     Returns: 
-#       - "unsolvable" if no mapping exists
-#       - "unique", mapping if one solution
-#       - "multiple", [mappings] if more than one solution
-#     """
-
-#     # Collect all function names
-#     v1_funcs: Set[str] = set()
-#     v2_funcs: Set[str] = set()
-#     for left, right in constraints:
-#         v1_funcs.update(left)
-#         v2_funcs.update(right)
-
-#     v1_funcs = list(v1_funcs)
-#     v2_funcs = list(v2_funcs)
-
-#     solutions = []
-
-#     def is_valid(mapping: Dict[str, Optional[str]]) -> bool:
-#         """Check if partial mapping violates injectivity"""
-#         mapped_values = [v for v in mapping.values() if v is not None]
-#         return len(mapped_values) == len(set(mapped_values))
-
-#     def satisfies_constraints(mapping: Dict[str, Optional[str]]) -> bool:
-#         """Check if all constraints are satisfied (only when all v1 assigned)"""
-#         for left, right in constraints:
-#             # At least one mapping from left → right
-#             ok = False
-#             for l in left:
-#                 if l in mapping and mapping[l] in right:
-#                     ok = True
-#                     break
-#             if not ok:
-#                 return False
-#         return True
-
-#     def backtrack(i: int, mapping: Dict[str, Optional[str]]):
-#         if i == len(v1_funcs):
-#             if satisfies_constraints(mapping):
-#                 solutions.append(mapping.copy())
-#             return
-
-#         func = v1_funcs[i]
-
-#         # Option 1: leave unmapped
-#         mapping[func] = None
-#         if is_valid(mapping):
-#             backtrack(i+1, mapping)
-
-#         # Option 2: map to some v2
-#         for v2 in v2_funcs:
-#             mapping[func] = v2
-#             if is_valid(mapping):
-#                 backtrack(i+1, mapping)
-
-#         # cleanup
-#         del mapping[func]
-
-#     backtrack(0, {})
-
-#     if not solutions:
-#         return "unsolvable", []
-#     elif len(solutions) == 1:
-#         return "unique", solutions[0]
-#     else:
-#         return "multiple", solutions
-
-# def remove_from_constraints(constraints: List[Tuple[List[str], List[str]]], lefts, rights):
-#     '''Remove lefts and rights from constraints'''
-#     new_constraints = []
-#     for left, right in constraints:
-#         new_left = [l for l in left if l not in lefts]
-#         new_right = [r for r in right if r not in rights]
-#         if new_left or new_right:
-#             new_constraints.append((new_left, new_right))
-#     return new_constraints
-
-# def solve_renaming(constraints: List[Tuple[List[str], List[str]]]):
-#     solution = {}
-#     changed_last_round = True
-#     while changed_last_round:
-#         lefts, rights = set(), set()
-#         changed_last_round = False
-#         for constraint in constraints:
-#             left, right = constraint
-#             if not left or not right:
-#                 print(constraint)
-#                 # return "unsolvable", [] 
-#             if len(left) == 1 and len(right) == 1:
-#                 solution[left[0]] = right[0]
-#                 lefts.add(left[0])
-#                 rights.add(right[0])
-#                 changed_last_round = True
-#         constraints = remove_from_constraints(constraints, lefts, rights)
-#     return constraints, solution
-
-
-# with open('constraints.json', 'r', encoding='utf-8') as f:
-#     constraints = json.load(f)
-# print(len(constraints))
-# kind, sols = solve_renaming(constraints)
-# # print(len(solve_renaming1(kind)))
-# print(len(sols))
 #!/usr/bin/env python3
 import argparse
 from typing import List, Tuple, Dict, Optional, Set
+from array import array
+from collections import Counter
+from heapq import heapify, heappop, heappush
+from functools import reduce
+from itertools import repeat
+from operator import sub, xor
+from concurrent.futures import ProcessPoolExecutor
 import json
+import logging
+import math
+import time
+
+from constraint_set import ConstraintSet, ID_TYPECODE, order_by_selectivity, selectivity_order
+from constraint_format import load_constraints
+from residual_assignment import assign_remaining
+from exact_solver import solve_exact, UNIQUE
+
+# Child of the pipeline logger, so in-process runs also log to pipeline.log
+logger = logging.getLogger("pipeline.solver")
+
+# Residual components with at most this many v1 classes go to the exact solver
+EXACT_MAX_SIZE = 24
+
+# (max constraints, label) buckets for the component size histogram
+COMPONENT_BUCKETS = [(1, "1"), (10, "2-10"), (100, "11-100"), (1000, "101-1000"), (float('inf'), ">1000")]
 
 def remove_from_constraints(constraints: List[Tuple[List[str], List[str]]], lefts, rights):
     """
@@ -126,53 +41,432 @@ def remove_from_constraints(constraints: List[Tuple[List[str], List[str]]], left
             new_constraints.append((new_left, new_right))
     return new_constraints
 
-def solve_renaming(constraints: List[Tuple[List[str], List[str]]]):
+def build_class_index(offsets, ids, num_classes: int) -> List[List[int]]:
+    """Reverse index from class id to the constraints that mention it, in constraint order."""
+    index: List[List[int]] = [[] for _ in range(num_classes)]
+    # Constraint of every position in the flat id array
+    owners = []
+    for i, size in enumerate(map(sub, offsets[1:], offsets[:-1])):
+        owners.extend(repeat(i, size))
+    for c, i in zip(ids, owners):
+        index[c].append(i)
+    return index
+
+def propagate(constraints: ConstraintSet) -> Tuple[ConstraintSet, Dict[int, int]]:
     """
-    Iterative solver that greedily resolves constraints with only one possibility.
-    Returns remaining constraints and solved mappings.
+    Incremental solver that resolves constraints with only one possibility.
+
+    Works on interned class ids. Every constraint keeps a count of its live
+    classes per side and the XOR of their ids, so once a side is down to one
+    class the XOR is that class. Reverse indexes from class id to constraints
+    mean fixing a mapping only touches the constraints mentioning the fixed
+    pair, so a full solve is linear in the total size of the constraints.
+
+    When single-class constraints give a class two different partners, the
+    class is fixed to the partner of the most selective of them (see
+    constraint_set.selectivity_order) and the other partners are consumed,
+    i.e. left unmatched, as the original round-based solver did. Resolved
+    constraints are always taken in selectivity order, so the mapping does
+    not depend on the order of the constraints or of their classes.
+    Returns the remaining constraints (sharing the class tables) and the
+    solved mappings as {v1 id: v2 id}.
     """
+    n = len(constraints)
+    left_offsets, left_ids = constraints.left_offsets, constraints.left_ids
+    right_offsets, right_ids = constraints.right_offsets, constraints.right_ids
+
+    left_count = list(map(sub, left_offsets[1:], left_offsets[:-1]))
+    right_count = list(map(sub, right_offsets[1:], right_offsets[:-1]))
+    # Most constraints have a single class per side, which is its own XOR
+    left_xor = [left_ids[left_offsets[i]] if left_count[i] == 1
+                else reduce(xor, left_ids[left_offsets[i]:left_offsets[i + 1]], 0) for i in range(n)]
+    right_xor = [right_ids[right_offsets[i]] if right_count[i] == 1
+                 else reduce(xor, right_ids[right_offsets[i]:right_offsets[i + 1]], 0) for i in range(n)]
+
+    left_index = build_class_index(left_offsets, left_ids, len(constraints.left_names))
+    right_index = build_class_index(right_offsets, right_ids, len(constraints.right_names))
+    left_fixed = bytearray(len(constraints.left_names))
+    right_fixed = bytearray(len(constraints.right_names))
+
+    # Heap of (selectivity rank, constraint): which partner wins a conflict
+    # depends on the order constraints are resolved in, so fix that order
+    rank = [0] * n
+    for position, i in enumerate(selectivity_order(constraints)):
+        rank[i] = position
+    worklist = [(rank[i], i) for i in range(n) if left_count[i] == 1 and right_count[i] == 1]
+    heapify(worklist)
     solution = {}
-    changed_last_round = True
 
-    while changed_last_round:
-        lefts, rights = set(), set()
-        changed_last_round = False
+    def remove_left(l):
+        left_fixed[l] = 1
+        for j in left_index[l]:
+            left_count[j] -= 1
+            left_xor[j] ^= l
+            if left_count[j] == 1 and right_count[j] == 1:
+                heappush(worklist, (rank[j], j))
+
+    def remove_right(r):
+        right_fixed[r] = 1
+        for j in right_index[r]:
+            right_count[j] -= 1
+            right_xor[j] ^= r
+            if left_count[j] == 1 and right_count[j] == 1:
+                heappush(worklist, (rank[j], j))
+
+    while worklist:
+        _, i = heappop(worklist)
+        # The constraint may have shrunk further since it was queued
+        if left_count[i] != 1 or right_count[i] != 1:
+            continue
+        l, r = left_xor[i], right_xor[i]
+        solution[l] = r
+
+        # Partners that other single-class constraints give l or r
+        conflicts_right = {right_xor[j] for j in left_index[l]
+                           if left_count[j] == 1 and right_count[j] == 1 and right_xor[j] != r}
+        conflicts_left = {left_xor[j] for j in right_index[r]
+                          if left_count[j] == 1 and right_count[j] == 1 and left_xor[j] != l}
+
+        # Remove the solved functions, and every conflicting partner, from the constraints
+        remove_left(l)
+        remove_right(r)
+        for c in conflicts_right:
+            if not right_fixed[c]:
+                remove_right(c)
+        for c in conflicts_left:
+            if not left_fixed[c]:
+                remove_left(c)
+
+    remaining = ConstraintSet(constraints.left_names, constraints.right_names)
+    for i in range(n):
+        if left_count[i] or right_count[i]:
+            remaining.add_ids(constraints.strings[i],
+                              [l for l in constraints.left(i) if not left_fixed[l]],
+                              [r for r in constraints.right(i) if not right_fixed[r]],
+                              constraints.frequencies[i])
+    return remaining, solution
+
+def solve_renaming(constraints):
+    """
+    Solve a list of (left, right) name pairs or a ConstraintSet by propagation.
+    Returns remaining constraints, most selective first, and solved mappings,
+    both by class name.
+    """
+    if not isinstance(constraints, ConstraintSet):
+        constraints = ConstraintSet.from_pairs(constraints)
+    remaining, solution = propagate(order_by_selectivity(constraints))
+    left_names, right_names = constraints.left_names.names, constraints.right_names.names
+    return remaining.to_pairs(), {left_names[l]: right_names[r] for l, r in solution.items()}
+
+class UnionFind:
+    """Disjoint sets over 0..size-1 with path halving and union by size."""
+
+    def __init__(self, size: int):
+        self.parent = array(ID_TYPECODE, range(size))
+        self.size = array(ID_TYPECODE, [1]) * size
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+def decompose(constraints: ConstraintSet) -> List[List[int]]:
+    """
+    Partition constraint indices into independent components: two constraints
+    are in the same component when they share a class on either side.
+    Largest components come first.
+    """
+    n = len(constraints)
+    sets = UnionFind(n)
+    for offsets, ids in ((constraints.left_offsets, constraints.left_ids),
+                         (constraints.right_offsets, constraints.right_ids)):
+        first_seen = {}
+        for i in range(n):
+            for c in ids[offsets[i]:offsets[i + 1]]:
+                j = first_seen.setdefault(c, i)
+                if j != i:
+                    sets.union(i, j)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(n):
+        groups.setdefault(sets.find(i), []).append(i)
+    return sorted(groups.values(), key=len, reverse=True)
+
+def log_component_stats(components: List[List[int]], seconds: List[float]):
+    """Log how the constraints split into components and where the solve time went."""
+    if not components:
+        return
+    sizes = [len(c) for c in components]
+    buckets = Counter(next(label for limit, label in COMPONENT_BUCKETS if size <= limit) for size in sizes)
+    logger.info(f"Components: {len(sizes)}, largest {sizes[0]} constraints, "
+                f"median {sorted(sizes)[len(sizes) // 2]}")
+    logger.info("Component sizes: " + ", ".join(f"{label}: {buckets[label]}"
+                                                 for _, label in COMPONENT_BUCKETS if buckets[label]))
+    slowest = sorted(zip(seconds, sizes), reverse=True)[:5]
+    logger.info(f"Total component solve time {sum(seconds):.3f}s, slowest: "
+                + ", ".join(f"{size} constraints in {t:.3f}s" for t, size in slowest))
 
-        for constraint in constraints:
-            left, right = constraint
-            # If exactly one option in both sides, fix the mapping
-            if len(left) == 1 and len(right) == 1:
-                solution[left[0]] = right[0]
-                lefts.add(left[0])
-                rights.add(right[0])
-                changed_last_round = True
+def string_weights(constraints: ConstraintSet) -> Dict[str, float]:
+    """
+    IDF weight of every constraint's string, log(1 + classes / frequency),
+    so generic strings count for less in the assignment stage.
+    """
+    total = len(constraints.left_names) + len(constraints.right_names)
+    frequencies = constraints.frequencies
+    return {constraints.strings[i]: math.log(1 + total / frequencies[i]) for i in range(len(constraints))}
+
+def seed_ids(constraints: ConstraintSet, seed_names: Dict[str, str]):
+    """
+    Split seed matches {v1 class: v2 class} into an id mapping for the
+    pairs whose classes both appear in the constraints, the (v1 ids, v2 ids)
+    of seeded classes whose partner does not appear (reserved: they are
+    taken out before solving so nothing else is matched with them), and
+    every such partial seed by name (extra, see merge_extra_seeds).
+    """
+    left_ids, right_ids = constraints.left_names.ids, constraints.right_names.ids
+    seeds, extra = {}, {}
+    reserved_left, reserved_right = set(), set()
+    for l, r in seed_names.items():
+        if l in left_ids and r in right_ids:
+            seeds[left_ids[l]] = right_ids[r]
+            continue
+        if l in left_ids:
+            reserved_left.add(left_ids[l])
+        if r in right_ids:
+            reserved_right.add(right_ids[r])
+        extra[l] = r
+    return seeds, (reserved_left, reserved_right), extra
+
+def merge_extra_seeds(solution: Dict[str, str], extra: Dict[str, str]) -> Dict[str, str]:
+    """
+    Add the seeds outside the constraints to a solution by name, skipping
+    classes that are already mapped and targets that are already used, so
+    the mapping stays one-to-one.
+    """
+    used = set(solution.values())
+    for l, r in extra.items():
+        if l not in solution and r not in used:
+            solution[l] = r
+            used.add(r)
+    return solution
+
+def shortlist_ids(constraints: ConstraintSet, shortlist_names) -> Dict[int, Set[int]]:
+    """Translate a minhash_lsh.py shortlist to {v1 id: v2 ids}, skipping unknown classes."""
+    left_ids, right_ids = constraints.left_names.ids, constraints.right_names.ids
+    return {left_ids[l]: {right_ids[r] for r, _ in candidates if r in right_ids}
+            for l, candidates in shortlist_names.items() if l in left_ids}
 
-        # Remove the solved functions from remaining constraints
-        constraints = remove_from_constraints(constraints, lefts, rights)
+def apply_seeds(constraints: ConstraintSet, seeds: Dict[int, int],
+                reserved: Tuple[Set[int], Set[int]] = (frozenset(), frozenset())) -> ConstraintSet:
+    """
+    Constraints with the classes of seed matches {v1 id: v2 id} and the
+    reserved (v1 ids, v2 ids) taken out, as if propagation had already
+    fixed them. Constraints left without any class are dropped.
+    """
+    seeded_left, seeded_right = set(seeds) | reserved[0], set(seeds.values()) | reserved[1]
+    result = ConstraintSet(constraints.left_names, constraints.right_names)
+    for i in range(len(constraints)):
+        left = [l for l in constraints.left(i) if l not in seeded_left]
+        right = [r for r in constraints.right(i) if r not in seeded_right]
+        if left or right:
+            result.add_ids(constraints.strings[i], left, right, constraints.frequencies[i])
+    return result
 
-    return constraints, solution
+def component_shortlist(component: ConstraintSet, shortlist: Dict[int, Set[int]]) -> Dict[int, Set[int]]:
+    """A shortlist {v1 id: v2 ids} in a component's local ids."""
+    local_right = component.right_names.ids
+    allowed = {}
+    for local_l, l in enumerate(component.left_names.names):
+        candidates = {local_right[r] for r in shortlist.get(l, ()) if r in local_right}
+        if candidates:
+            allowed[local_l] = candidates
+    return allowed
+
+def solve_component(component: ConstraintSet, assignment: bool, min_confidence: float,
+                    exact_max_size: int = EXACT_MAX_SIZE, weights: Optional[Dict[str, float]] = None,
+                    allowed: Optional[Dict[int, Set[int]]] = None):
+    """
+    Solve one component: propagation, then the exact solver if what is left
+    has at most exact_max_size version 1 classes, then a maximum-weight
+    matching of whatever is still ambiguous, over the allowed {v1 id: v2 ids}
+    pairs only if given. Runs in worker processes, so it returns plain data
+    in the component's local ids: the remaining constraints, the mapping,
+    its confidences, the v1 ids mapped by the assignment stage, the exact
+    solver status (None when it did not run) and the solve time.
+    """
+    start = time.perf_counter()
+    remaining, solution = propagate(component)
+    confidence = dict.fromkeys(solution, 1.0)
+
+    exact_status = None
+    residual_classes = len(set(remaining.left_ids))
+    if 0 < residual_classes <= exact_max_size:
+        exact_status, exact_solution = solve_exact(remaining)
+        if exact_status == UNIQUE:
+            solution.update(exact_solution)
+            confidence.update(dict.fromkeys(exact_solution, 1.0))
+            assignment = False
+
+    assigned = set()
+    if assignment:
+        for l, (r, score) in assign_remaining(remaining, weights, allowed).items():
+            if score >= min_confidence:
+                solution[l] = r
+                confidence[l] = score
+                assigned.add(l)
+    return remaining, solution, confidence, assigned, exact_status, time.perf_counter() - start
+
+def solve_staged(constraints: ConstraintSet, assignment: bool = True, min_confidence: float = 0.0,
+                 jobs: int = 1, exact_max_size: int = EXACT_MAX_SIZE, weighting: str = "count",
+                 seeds: Optional[Dict[int, int]] = None, shortlist: Optional[Dict[int, Set[int]]] = None,
+                 reserved: Optional[Tuple[Set[int], Set[int]]] = None):
+    """
+    Full solve of every independent component, in a process pool when
+    jobs > 1. weighting is "count" (every shared string weighs 1 in the
+    assignment stage) or "idf". seeds {v1 id: v2 id} are matches known up
+    front, e.g. exact duplicate classes from method_body_hashes.py; they are
+    fixed before propagation runs, and the reserved (v1 ids, v2 ids) of
+    seeds whose partner is not in the constraints are left out of the
+    solve (see seed_ids). shortlist {v1 id: v2 ids}, e.g. from
+    minhash_lsh.py, limits the assignment stage to those pairs. Returns the
+    constraints propagation could not resolve, the mapping {v1 id: v2 id},
+    the confidence of every mapping (1.0 for propagated and seeded ones) and
+    the v1 ids mapped by the assignment stage.
+    """
+    if seeds or reserved:
+        constraints = apply_seeds(constraints, seeds or {}, reserved or (frozenset(), frozenset()))
+    groups = decompose(constraints)
+    components = [constraints.component(group) for group in groups]
+    if weighting == "idf":
+        # The class totals are global, so weigh the strings before splitting
+        all_weights = string_weights(constraints)
+        weights = [{constraints.strings[i]: all_weights[constraints.strings[i]] for i in group}
+                   for group in groups]
+    else:
+        weights = [None] * len(groups)
+    if shortlist is not None:
+        allowed = [component_shortlist(component, shortlist) for component in components]
+    else:
+        allowed = [None] * len(components)
+    if jobs > 1 and len(components) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(solve_component, components, repeat(assignment), repeat(min_confidence),
+                                    repeat(exact_max_size), weights, allowed,
+                                    chunksize=max(1, len(components) // (jobs * 4))))
+    else:
+        results = [solve_component(*args)
+                   for args in zip(components, repeat(assignment), repeat(min_confidence),
+                                   repeat(exact_max_size), weights, allowed)]
+
+    # Merge the per-component results back into global ids
+    remaining = ConstraintSet(constraints.left_names, constraints.right_names)
+    solution, confidence, assigned, seconds = {}, {}, set(), []
+    exact_statuses = Counter()
+    for component, (component_remaining, component_solution, component_confidence, component_assigned,
+                    exact_status, t) in zip(components, results):
+        left_ids, right_ids = component.left_names.names, component.right_names.names
+        for i in range(len(component_remaining)):
+            remaining.add_ids(component_remaining.strings[i],
+                              [left_ids[l] for l in component_remaining.left(i)],
+                              [right_ids[r] for r in component_remaining.right(i)],
+                              component_remaining.frequencies[i])
+        for l, r in component_solution.items():
+            solution[left_ids[l]] = right_ids[r]
+            confidence[left_ids[l]] = component_confidence[l]
+        assigned.update(left_ids[l] for l in component_assigned)
+        seconds.append(t)
+        if exact_status:
+            exact_statuses[exact_status] += 1
+
+    log_component_stats(groups, seconds)
+    if exact_statuses:
+        logger.info("Exact solver: " + ", ".join(f"{count} {status}" for status, count in exact_statuses.items()))
+    if seeds:
+        solution.update(seeds)
+        confidence.update(dict.fromkeys(seeds, 1.0))
+    return remaining, solution, confidence, assigned
+
+def solution_names(constraints: ConstraintSet, solution: Dict[int, int]) -> Dict[str, str]:
+    """Translate an id mapping back to class names."""
+    left_names, right_names = constraints.left_names.names, constraints.right_names.names
+    return {left_names[l]: right_names[r] for l, r in solution.items()}
+
+def write_solution(path, solution: Dict[str, str]):
+    """Save the solved {v1 class: v2 class} mapping as JSON."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(solution, f, indent=2)
 
 def main():
     parser = argparse.ArgumentParser(description="Solve function renaming constraints.")
-    parser.add_argument("input_file", type=str, help="Path to input constraints JSON file")
+    parser.add_argument("input_file", type=str, help="Path to input constraints file (binary or JSON)")
     parser.add_argument("output_file", type=str, help="Path to output JSON file for solution")
+    parser.add_argument("--no-assignment", action="store_true",
+                        help="Only propagate; leave ambiguous constraints unmatched")
+    parser.add_argument("--min-confidence", type=float, default=0.0,
+                        help="Drop assignment-stage mappings below this confidence (0..1)")
+    parser.add_argument("--confidence-output", type=str,
+                        help="Optional JSON file for {v1 class: {match, confidence}}")
+    parser.add_argument("--exact-max-size", type=int, default=EXACT_MAX_SIZE,
+                        help="Run the exact solver on residual components with at most this many "
+                             "v1 classes (0 disables it)")
+    parser.add_argument("--weighting", choices=["count", "idf"], default="count",
+                        help="Edge weights of the assignment stage: shared string count, or IDF "
+                             "so generic strings weigh less")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Solve independent components in this many worker processes")
+    parser.add_argument("--seed-matches", type=str,
+                        help="JSON {v1 class: v2 class} of matches fixed before propagation, "
+                             "e.g. from method_body_hashes.py")
+    parser.add_argument("--shortlist", type=str,
+                        help="JSON {v1 class: [[v2 class, similarity], ...]} from minhash_lsh.py; "
+                             "the assignment stage only considers these pairs")
     args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
 
-    # Load constraints from input JSON file
-    with open(args.input_file, 'r', encoding='utf-8') as f:
-        constraints = json.load(f)
+    # Load constraints from the input file, binary files are memory-mapped
+    with load_constraints(args.input_file) as constraints:
+        print(f"Loaded {len(constraints)} constraints.")
 
-    print(f"Loaded {len(constraints)} constraints.")
+        seeds, reserved, extra_seeds = {}, None, {}
+        if args.seed_matches:
+            with open(args.seed_matches, 'r', encoding='utf-8') as f:
+                seeds, reserved, extra_seeds = seed_ids(constraints, json.load(f))
+            print(f"Loaded {len(seeds) + len(extra_seeds)} seed matches.")
 
-    # Solve the renaming problem
-    remaining_constraints, solution = solve_renaming(constraints)
+        shortlist = None
+        if args.shortlist:
+            with open(args.shortlist, 'r', encoding='utf-8') as f:
+                shortlist = shortlist_ids(constraints, json.load(f))
 
-    print(f"Remaining constraints: {len(remaining_constraints)}")
-    print(f"Number of solved mappings: {len(solution)}")
+        # Solve the renaming problem
+        remaining_constraints, solution_ids, confidence, assigned_ids = solve_staged(
+            constraints, not args.no_assignment, args.min_confidence, args.jobs, args.exact_max_size,
+            args.weighting, seeds, shortlist, reserved)
+        solution = merge_extra_seeds(solution_names(constraints, solution_ids), extra_seeds)
+        assigned = len(assigned_ids)
+
+        print(f"Remaining constraints: {len(remaining_constraints)}")
+        print(f"Number of solved mappings: {len(solution)} ({assigned} from the assignment stage)")
+
+        if args.confidence_output:
+            left_names = constraints.left_names.names
+            with open(args.confidence_output, 'w', encoding='utf-8') as f:
+                json.dump({left_names[l]: {"match": solution[left_names[l]], "confidence": round(score, 4)}
+                           for l, score in confidence.items()}, f, indent=2)
 
     # Save the solved mapping to the output file
-    with open(args.output_file, 'w', encoding='utf-8') as f:
-        json.dump(solution, f, indent=2)
+    write_solution(args.output_file, solution)
 
     print(f"Solution saved to {args.output_file}")
 
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic string -> classes dumps of two versions, with the true mapping.
+
+Version 1 has num_classes classes and num_strings strings. Every string is
+used by a number of classes drawn from the fan-out distribution:
+
+    pareto     power law, P(fan-out >= k) = k^-alpha; mostly 1, a long tail of
+               generic strings (alpha 3 is close to the bundled dumps)
+    geometric  P(fan-out = k) = (1 - p)^(k - 1) p with p = 1 / mean
+    fixed      always the same fan-out
+
+Version 2 deletes a fraction of the classes, renames a fraction of the
+survivors (obfuscated names are reassigned), adds new classes, and drops
+and adds string uses, so the solver sees realistic noise. The true mapping
+{v1 class: v2 class} covers every surviving class.
+"""
+import argparse
+import json
+import random
+import sys
+from typing import Dict, List, Tuple
+
+NAME_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+NAME_PREFIX = "X."
+FANOUTS = ["pareto", "geometric", "fixed"]
+
+Dump = Dict[str, List[str]]
+
+
+def class_name(number: int) -> str:
+    """Obfuscated-style class name, e.g. 'X.0Ab'."""
+    digits = []
+    while True:
+        number, digit = divmod(number, len(NAME_ALPHABET))
+        digits.append(NAME_ALPHABET[digit])
+        if not number:
+            break
+    return NAME_PREFIX + "".join(reversed(digits)).rjust(3, "0")
+
+
+def fanout_sampler(rng: random.Random, kind: str, param: float, max_fanout: int):
+    """Function returning one string's fan-out (number of classes using it), at most max_fanout."""
+    if kind == "pareto":
+        return lambda: min(max_fanout, int(rng.paretovariate(param)))
+    if kind == "geometric":
+        p = 1.0 / max(1.0, param)
+
+        def geometric():
+            k = 1
+            while k < max_fanout and rng.random() > p:
+                k += 1
+            return k
+        return geometric
+    if kind == "fixed":
+        return lambda: min(max_fanout, max(1, int(param)))
+    raise ValueError(f"Unknown fan-out distribution: {kind}")
+
+
+def to_dump(uses: Dict[str, set]) -> Dump:
+    """{string: sorted classes}, skipping strings no class uses."""
+    return {string: sorted(classes) for string, classes in uses.items() if classes}
+
+
+def generate(num_classes: int = 1000, num_strings: int = 10000, fanout: str = "pareto",
+             fanout_param: float = 3.0, max_fanout: int = 50, rename_rate: float = 0.9,
+             add_rate: float = 0.05, delete_rate: float = 0.05, churn_rate: float = 0.05,
+             seed: int = 0) -> Tuple[Dump, Dump, Dict[str, str]]:
+    """
+    Two dumps and the true mapping. Rates are fractions of version 1's
+    classes (rename, add, delete) or of its string uses (churn: dropped
+    uses, and as many new ones).
+    """
+    rng = random.Random(seed)
+    num_added = int(num_classes * add_rate)
+    # Distinct names for every v1 class, and for every renamed or added v2 class
+    numbers = rng.sample(range(max(4 * (num_classes + num_added), len(NAME_ALPHABET) ** 3)),
+                         2 * num_classes + num_added)
+    names1 = [class_name(n) for n in numbers[:num_classes]]
+    fresh_names = iter(class_name(n) for n in numbers[num_classes:])
+
+    sample_fanout = fanout_sampler(rng, fanout, fanout_param, min(max_fanout, num_classes))
+    strings = [f"string {i:07d}" for i in range(num_strings)]
+    uses1 = {s: set(rng.sample(names1, sample_fanout())) for s in strings}
+
+    survivors = [name for name in names1 if rng.random() >= delete_rate]
+    truth = {name: next(fresh_names) if rng.random() < rename_rate else name for name in survivors}
+    added = [next(fresh_names) for _ in range(num_added)]
+    names2 = list(truth.values()) + added
+
+    uses2: Dict[str, set] = {}
+    dropped = 0
+    for s, classes in uses1.items():
+        kept = set()
+        for name in classes:
+            if name in truth and rng.random() >= churn_rate:
+                kept.add(truth[name])
+            else:
+                dropped += 1
+        uses2[s] = kept
+    # As many new uses as were dropped, spread over new strings and existing ones
+    for i in range(dropped):
+        if rng.random() < 0.5:
+            s = f"new string {i:07d}"
+            uses2[s] = set(rng.sample(names2, min(len(names2), sample_fanout())))
+        else:
+            uses2[rng.choice(strings)].add(rng.choice(names2))
+    return to_dump(uses1), to_dump(uses2), truth
+
+
+def write_json(path, value):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(value, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic string -> classes dumps of two versions.")
+    parser.add_argument("version1", help="Output JSON dump of version 1")
+    parser.add_argument("version2", help="Output JSON dump of version 2")
+    parser.add_argument("truth", help="Output JSON of the true mapping {v1 class: v2 class}")
+    parser.add_argument("--classes", type=int, default=1000, help="Classes in version 1")
+    parser.add_argument("--strings", type=int, default=10000, help="Strings in version 1")
+    parser.add_argument("--fanout", choices=FANOUTS, default="pareto", help="Fan-out distribution of strings")
+    parser.add_argument("--fanout-param", type=float, default=3.0,
+                        help="Pareto alpha, geometric mean, or fixed fan-out")
+    parser.add_argument("--max-fanout", type=int, default=50, help="Largest fan-out of a string")
+    parser.add_argument("--rename-rate", type=float, default=0.9, help="Fraction of surviving classes renamed")
+    parser.add_argument("--add-rate", type=float, default=0.05, help="Classes added, as a fraction of version 1")
+    parser.add_argument("--delete-rate", type=float, default=0.05, help="Fraction of classes deleted")
+    parser.add_argument("--churn-rate", type=float, default=0.05, help="Fraction of string uses changed")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    try:
+        dump1, dump2, truth = generate(args.classes, args.strings, args.fanout, args.fanout_param,
+                                       args.max_fanout, args.rename_rate, args.add_rate, args.delete_rate,
+                                       args.churn_rate, args.seed)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    write_json(args.version1, dump1)
+    write_json(args.version2, dump2)
+    write_json(args.truth, truth)
+    print(f"Version 1: {len(dump1)} strings, version 2: {len(dump2)} strings, {len(truth)} true matches")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import json
+
+from create_constrait_problem_from_jsons import pair_matching_keys, pair_matching_keys_streaming
+
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+def pairs_by_string(constraints):
+    return {constraints.strings[i]: constraints.pair(i) for i in range(len(constraints))}
+
+
+def test_repeated_string_keeps_last_classes(tmp_path):
+    version1 = write(tmp_path / "v1.json", '{"a": ["A"], "b": ["B", "C"], "a": ["A2"]}')
+    version2 = write(tmp_path / "v2.json", '{"b": ["X"], "a": ["Y"], "b": ["Z", "W"], "c": ["V"]}')
+    constraints, count1, count2 = pair_matching_keys_streaming(version1, version2)
+    expected = pair_matching_keys(json.loads(version1.read_text()), json.loads(version2.read_text()))
+    assert pairs_by_string(constraints) == pairs_by_string(expected)
+    assert pairs_by_string(constraints) == {"a": (["A2"], ["Y"]), "b": (["B", "C"], ["Z", "W"])}
+    assert count1 == 2
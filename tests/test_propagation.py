@@ -0,0 +1,52 @@
+import glob
+import os
+import random
+
+from constraint_set import ConstraintSet
+from json_stream import load_string_index
+from solve_class_matches_between_versions import propagate, solution_names
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def shuffled(pairs, seed):
+    """ConstraintSet of {string: (left, right)} with constraints and classes in a random order."""
+    rng = random.Random(seed)
+    strings = list(pairs)
+    rng.shuffle(strings)
+    constraints = ConstraintSet()
+    for string in strings:
+        left, right = list(pairs[string][0]), list(pairs[string][1])
+        rng.shuffle(left)
+        rng.shuffle(right)
+        constraints.add(string, left, right)
+    return constraints
+
+
+def propagate_names(constraints):
+    remaining, solution = propagate(constraints)
+    return solution_names(constraints, solution), sorted(remaining.strings.names)
+
+
+def test_conflict_keeps_most_selective_partner():
+    pairs = {
+        "b": (["A"], ["B2"]),
+        "a": (["A"], ["B1"]),
+        "common": (["A", "C", "D"], ["B1", "B2", "E", "F"]),
+        "c": (["C"], ["E"]),
+    }
+    for seed in range(10):
+        solution, _ = propagate_names(shuffled(pairs, seed))
+        # "a" and "b" are equally frequent, so the string breaks the tie;
+        # B2 is consumed by the conflict and D is left with F only
+        assert solution == {"A": "B1", "C": "E", "D": "F"}
+
+
+def test_shuffled_constraints_give_the_same_solution():
+    paths = sorted(glob.glob(os.path.join(ROOT, "com.instagram.lite_*.json")))
+    dump1, dump2 = load_string_index(paths[0]), load_string_index(paths[1])
+    pairs = {key: (dump1[key], dump2[key]) for key in dump1.keys() & dump2.keys()}
+    expected = propagate_names(shuffled(pairs, 0))
+    assert len(expected[0]) > 0
+    for seed in range(1, 10):
+        assert propagate_names(shuffled(pairs, seed)) == expected
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Compose pairwise matches along a release series (v469 -> v470 -> ... -> v480).
+
+Each link between consecutive versions is stored as an int array indexed by
+the class id of the earlier version, holding the class id in the later one
+(or -1 when the class is unmatched), plus the inverse array for going back.
+Compositions between any two versions are built link by link from cached
+prefixes, so after the first query of a version pair every lookup is a dict
+lookup and one array index. Re-solving a link drops every cached
+composition that spans it.
+"""
+import argparse
+import json
+import sys
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from constraint_set import NameTable, ID_TYPECODE
+
+UNMAPPED = -1
+
+
+def compose(first, second):
+    """Mapping x -> second[first[x]], with -1 for anything unmapped on the way."""
+    size = len(second)
+    return array(ID_TYPECODE, [second[x] if 0 <= x < size else UNMAPPED for x in first])
+
+
+class VersionChain:
+    """Pairwise class mappings between consecutive versions, composable across the series."""
+
+    def __init__(self, versions: List[str]):
+        self.versions = list(versions)
+        self.position = {version: i for i, version in enumerate(self.versions)}
+        self.names = [NameTable() for _ in self.versions]
+        # forward[k] maps version k ids to version k + 1 ids, backward[k] the reverse
+        self.forward: List[Optional[array]] = [None] * (len(self.versions) - 1)
+        self.backward: List[Optional[array]] = [None] * (len(self.versions) - 1)
+        self._compositions: Dict[Tuple[int, int], array] = {}
+
+    def set_link(self, version: str, solution: Dict[str, str]):
+        """
+        Store (or replace) the solved mapping from version to the next version
+        in the series, as returned by solve_renaming.
+        """
+        k = self.position[version]
+        if k >= len(self.versions) - 1:
+            raise ValueError(f"{version} is the last version of the chain")
+        src_names, dst_names = self.names[k], self.names[k + 1]
+        pairs = [(src_names.intern(a), dst_names.intern(b)) for a, b in solution.items()]
+
+        forward = array(ID_TYPECODE, [UNMAPPED]) * len(src_names)
+        backward = array(ID_TYPECODE, [UNMAPPED]) * len(dst_names)
+        for a, b in pairs:
+            forward[a] = b
+            backward[b] = a
+        self.forward[k], self.backward[k] = forward, backward
+
+        # Every cached composition passing through this link is stale now, and
+        # so are the identities of its two versions, which may have new names
+        self._compositions = {(i, j): m for (i, j), m in self._compositions.items()
+                              if not min(i, j) <= k < max(i, j) and not i == j in (k, k + 1)}
+
+    def mapping(self, src: str, dst: str) -> array:
+        """Composed id mapping from version src to version dst (either direction)."""
+        i, j = self.position[src], self.position[dst]
+        if i == j:
+            identity = self._compositions.get((i, i))
+            if identity is None:
+                identity = self._compositions[(i, i)] = array(ID_TYPECODE, range(len(self.names[i])))
+            return identity
+        return self._mapping(i, j)
+
+    def _mapping(self, i: int, j: int) -> array:
+        cached = self._compositions.get((i, j))
+        if cached is not None:
+            return cached
+        step = 1 if j > i else -1
+        link_index = j - 1 if step == 1 else j
+        link = (self.forward if step == 1 else self.backward)[link_index]
+        if link is None:
+            raise ValueError(f"No matches between {self.versions[j - step]} and {self.versions[j]}")
+        result = link if i == j - step else compose(self._mapping(i, j - step), link)
+        self._compositions[(i, j)] = result
+        return result
+
+    def translate(self, name: str, src: str, dst: str) -> Optional[str]:
+        """Name in version dst of class name from version src, or None if it has no match."""
+        i, j = self.position[src], self.position[dst]
+        name_id = self.names[i].ids.get(name)
+        if name_id is None:
+            return None
+        mapped = self.mapping(src, dst)
+        target = mapped[name_id] if name_id < len(mapped) else UNMAPPED
+        return self.names[j][target] if target != UNMAPPED else None
+
+    def to_dict(self, src: str, dst: str) -> Dict[str, str]:
+        """Full composed mapping from src to dst by class name."""
+        src_names, dst_names = self.names[self.position[src]], self.names[self.position[dst]]
+        return {src_names[a]: dst_names[b]
+                for a, b in enumerate(self.mapping(src, dst)) if b != UNMAPPED}
+
+    @classmethod
+    def from_match_files(cls, versions: List[str], match_files: List[str]) -> "VersionChain":
+        """Chain from the matches JSON of every consecutive pair of versions."""
+        if len(match_files) != len(versions) - 1:
+            raise ValueError("Expected one matches file per consecutive pair of versions")
+        chain = cls(versions)
+        for version, path in zip(versions, match_files):
+            with open(path, 'r', encoding='utf-8') as f:
+                chain.set_link(version, json.load(f))
+        return chain
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compose pairwise class matches across a release series.")
+    parser.add_argument("match_files", nargs="+",
+                        help="Matches JSON of each consecutive version pair, in series order")
+    parser.add_argument("--versions", nargs="+", required=True,
+                        help="Version labels in series order (one more than the matches files)")
+    parser.add_argument("--query", nargs=3, metavar=("CLASS", "SRC", "DST"),
+                        help="Print the name in DST of CLASS from SRC")
+    parser.add_argument("--export", nargs=3, metavar=("SRC", "DST", "OUTPUT"),
+                        help="Write the composed SRC -> DST mapping as JSON")
+    args = parser.parse_args()
+
+    try:
+        chain = VersionChain.from_match_files(args.versions, args.match_files)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    if args.query:
+        name, src, dst = args.query
+        print(chain.translate(name, src, dst))
+    if args.export:
+        src, dst, output = args.export
+        mapping = chain.to_dict(src, dst)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(mapping, f, indent=2)
+        print(f"{len(mapping)} composed mappings saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
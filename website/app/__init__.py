@@ -1,12 +1,29 @@
 from flask import Flask
 import os
+import sys
+
+# The website reuses the pipeline modules in the repository root
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
 
 def create_app():
     app = Flask(__name__)
     app.secret_key = 'your_secret_key'
     app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), 'uploads')
+    app.config['JOB_WORKERS'] = 2
+    app.config['JOB_TTL'] = 24 * 3600
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+    from .storage import UploadStore
+    store = UploadStore(app.config['UPLOAD_FOLDER'])
+    store.import_existing()
+    app.extensions['uploads'] = store
+
+    from .jobs import JobQueue
+    app.extensions['jobs'] = JobQueue(max_workers=app.config['JOB_WORKERS'], results=store,
+                                       ttl=app.config['JOB_TTL'])
+
     from .routes import bp
     app.register_blueprint(bp)
 
@@ -3,6 +3,12 @@ import sys
 import json
 import os
 
+from artifact_cache import source_version
+
+# Part of the stored results' keys, so results made by an older version of
+# this module are not reused once it changes
+ANALYZER_VERSION = source_version(__file__)
+
 def analyze_apk(apk_path):
     # Example: call your run_pipeline.py for a single APK (customize as needed)
     # Here, just return the filename for demo
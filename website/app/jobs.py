@@ -0,0 +1,130 @@
+"""
+Background jobs for the long running analyze and compare requests.
+
+Requests only submit a job and redirect to its status page, the work runs
+in a local thread pool (the pipeline itself runs external processes).
+Jobs are deduplicated by kind and the content hashes of their input files,
+so the same APK pair submitted twice, even concurrently, shares one job.
+With a results store (storage.UploadStore), finished results also outlive
+the process and are reused when known files are uploaded again. Finished
+jobs are forgotten ttl seconds after they finish.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from artifact_cache import file_sha256
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+JOB_TTL = 24 * 3600
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    def __init__(self, kind, inputs, key):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.inputs = inputs
+        self.key = key
+        self.state = QUEUED
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'inputs': self.inputs,
+            'state': self.state,
+            'result': self.result,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+
+class JobQueue:
+    def __init__(self, max_workers=2, results=None, ttl=JOB_TTL):
+        self._results = results
+        self._ttl = ttl
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._by_key = {}
+
+    def submit(self, kind, func, *paths, hashes=None, names=None, version=None):
+        """
+        Run func(*paths) in the background and return its job. A job of the
+        same kind and version on files with the same content is reused
+        unless it failed. hashes (SHA-256 of the paths, when already known)
+        saves re-reading the files, names replaces their base names in the
+        job's inputs. version (of func) is part of the stored results' keys,
+        so results of an older func are computed again.
+        """
+        key = (kind, *([version] if version else []), *(hashes or [file_sha256(p) for p in paths]))
+        with self._lock:
+            self._expire()
+            existing = self._by_key.get(key)
+            if existing is not None and existing.state != FAILED:
+                return existing
+            job = Job(kind, names or [os.path.basename(p) for p in paths], key)
+            stored = self._results.result(':'.join(key)) if self._results else None
+            if stored is not None:
+                job.result = stored
+                job.state = DONE
+                job.started = job.finished = time.time()
+            else:
+                self._pool.submit(self._run, job, func, paths)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+        return job
+
+    def _expire(self):
+        # Called with the lock held
+        cutoff = time.time() - self._ttl
+        for job in [job for job in self._jobs.values() if job.finished is not None and job.finished < cutoff]:
+            del self._jobs[job.id]
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+
+    def _run(self, job, func, paths):
+        with self._lock:
+            job.state = RUNNING
+            job.started = time.time()
+        try:
+            result = func(*paths)
+            if self._results:
+                self._results.save_result(':'.join(job.key), result)
+        except Exception as e:
+            logger.exception('Job %s (%s) failed', job.id, job.kind)
+            with self._lock:
+                job.error = f'{type(e).__name__}: {e}'
+                job.state = FAILED
+                job.finished = time.time()
+            return
+        with self._lock:
+            job.result = result
+            job.state = DONE
+            job.finished = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            self._expire()
+            return sorted(self._jobs.values(), key=lambda job: job.created, reverse=True)
@@ -0,0 +1,174 @@
+"""
+Lazily loaded views of large JSON artifacts (string dumps, constraints, matches).
+
+Each file is streamed once, in chunks, with the pipeline's
+json_stream.ChunkedParser to record the byte range of every top-level entry
+(object member or array item) in the file, plus an inverted index of the
+strings inside the values (class names, mostly). Keys and value strings are
+kept sorted, so a search is a prefix lookup by bisection. The index is cached
+by path and mtime, so a page or a search reads only the entries it returns.
+"""
+import json
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from json_stream import ChunkedParser
+
+MAX_CACHED_FILES = 16
+UTF8_BOM = b'\xef\xbb\xbf'
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _strings(value, out):
+    """Collect every string in a decoded value."""
+    if isinstance(value, str):
+        out.add(value)
+    elif isinstance(value, list):
+        for item in value:
+            _strings(item, out)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            out.add(key)
+            _strings(item, out)
+    return out
+
+
+def _prefixed(sorted_strings, prefix):
+    """Range of the positions of the strings starting with prefix in a sorted list."""
+    start = end = bisect_left(sorted_strings, prefix)
+    while end < len(sorted_strings) and sorted_strings[end].startswith(prefix):
+        end += 1
+    return range(start, end)
+
+
+class JsonIndex:
+    """Byte ranges of the top-level entries of one JSON file, and a value string index."""
+
+    def __init__(self, path):
+        self.path = path
+        self.keys = []  # object member names, None for array items
+        self.offsets = array('Q')  # start, end byte offset of every value
+        self.positions = {}  # object member name -> entry number
+        # Lowercased keys, and lowercased strings found in values, sorted,
+        # with the entry numbers of each
+        self.sorted_keys, self.key_entries = [], []
+        self.sorted_values, self.value_entries = [], []
+        self.kind = None
+        postings = {}
+        self._build(postings)
+        for key, entry in sorted((key.lower(), entry) for entry, key in enumerate(self.keys) if key is not None):
+            self.sorted_keys.append(key)
+            self.key_entries.append(entry)
+        for value, entries in sorted((value.lower(), entries) for value, entries in postings.items()):
+            self.sorted_values.append(value)
+            self.value_entries.append(entries)
+
+    def _build(self, postings):
+        with open(self.path, 'rb') as f:
+            start_byte = len(UTF8_BOM) if f.read(len(UTF8_BOM)) == UTF8_BOM else 0
+        # newline='' keeps CRLF as is, so the byte offsets match the file
+        with open(self.path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = ChunkedParser(f, start_byte=start_byte)
+
+            def add(key):
+                reader.peek()
+                start = reader.byte_offset()
+                value = reader.value()
+                entry = len(self.keys)
+                self.keys.append(key)
+                if key is not None:
+                    self.positions[key] = entry
+                self.offsets.append(start)
+                self.offsets.append(reader.byte_offset())
+                for s in _strings(value, set()):
+                    postings.setdefault(s, []).append(entry)
+
+            opening = reader.peek()
+            if opening not in ('{', '['):
+                self.kind = 'scalar'
+                add(None)
+                return
+            self.kind = 'object' if opening == '{' else 'array'
+            closing = '}' if opening == '{' else ']'
+            reader.pos += 1
+            if reader.peek() == closing:
+                return
+            while True:
+                key = None
+                if self.kind == 'object':
+                    key = reader.string()
+                    reader.expect(':')
+                add(key)
+                separator = reader.peek()
+                if separator == closing:
+                    return
+                if separator != ',':
+                    raise ValueError(f"Expected ',' or '{closing}' at byte {reader.byte_offset()}")
+                reader.pos += 1
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, query, field='any'):
+        """Entry numbers whose key (field 'key') or a value string (field 'value') starts with query, case-insensitive."""
+        query = query.lower()
+        found = set()
+        if field in ('key', 'any'):
+            found.update(self.key_entries[i] for i in _prefixed(self.sorted_keys, query))
+        if field in ('value', 'any'):
+            found.update(entry for i in _prefixed(self.sorted_values, query) for entry in self.value_entries[i])
+        return sorted(found)
+
+    def entries(self, numbers):
+        """[(key, value)] of the given entry numbers, read from the file."""
+        result = []
+        with open(self.path, 'rb') as f:
+            for i in numbers:
+                start, end = self.offsets[2 * i], self.offsets[2 * i + 1]
+                f.seek(start)
+                result.append((self.keys[i], json.loads(f.read(end - start).decode('utf-8', 'surrogatepass'))))
+        return result
+
+    def page(self, offset=0, limit=100, query=None, field='any'):
+        """One page of entries, optionally filtered by a search, as a JSON-ready dict."""
+        numbers = self.search(query, field) if query else range(len(self))
+        offset = max(0, offset)
+        selected = numbers[offset:offset + limit]
+        return {
+            'kind': self.kind,
+            'total': len(self),
+            'matches': len(numbers),
+            'offset': offset,
+            'limit': limit,
+            'items': [{'key': key, 'value': value} for key, value in self.entries(selected)],
+        }
+
+    def lookup(self, key):
+        """Value of one object member, or None if there is no such key."""
+        i = self.positions.get(key)
+        if i is None:
+            return None
+        return self.entries([i])[0][1]
+
+
+def get_index(path):
+    """Index of path, rebuilt only when the file's mtime or size changed."""
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == signature:
+            _cache.move_to_end(path)
+            return cached[1]
+    index = JsonIndex(path)
+    with _cache_lock:
+        _cache[path] = (signature, index)
+        _cache.move_to_end(path)
+        while len(_cache) > MAX_CACHED_FILES:
+            _cache.popitem(last=False)
+    return index
@@ -1,40 +1,74 @@
 from flask import send_from_directory, abort
 import json
 from flask import Blueprint, render_template, request, redirect, url_for, flash, send_from_directory, abort
+from flask import current_app, jsonify
 from werkzeug.utils import secure_filename
 import os
 import json
-from .analysis import analyze_apk, compare_apks
+from artifact_cache import stream_sha256
+from .analysis import ANALYZER_VERSION, analyze_apk, compare_apks
+from .jobs import DONE, FAILED
+from .json_index import get_index
 
 
 bp = Blueprint('main', __name__)
 
+JSON_PAGE_SIZE = 100
+MAX_JSON_PAGE_SIZE = 1000
+RAW_PREVIEW_SIZE = 64 * 1024
+
+def uploaded_json_path(filename):
+    json_path = current_app.extensions['uploads'].path(filename) if filename.endswith('.json') else None
+    if json_path is None or not os.path.exists(json_path):
+        abort(404)
+    return json_path
+
 @bp.route('/view_json/<filename>')
 def view_json(filename):
-    upload_dir = os.path.join(os.path.dirname(__file__), 'uploads')
-    json_path = os.path.join(upload_dir, filename)
-    if not os.path.exists(json_path) or not filename.endswith('.json'):
-        abort(404)
-    with open(json_path, 'r', encoding='utf-8') as f:
-        try:
-            data = json.load(f)
-        except Exception:
-            data = f.read()
-    return render_template('view_json.html', filename=filename, data=data)
+    json_path = uploaded_json_path(filename)
+    try:
+        page = get_index(json_path).page(0, JSON_PAGE_SIZE)
+    except ValueError:
+        # Not valid JSON: show the beginning of the file as text
+        with open(json_path, 'r', encoding='utf-8', errors='replace') as f:
+            return render_template('view_json.html', filename=filename, page=None, raw=f.read(RAW_PREVIEW_SIZE))
+    return render_template('view_json.html', filename=filename, page=page, page_size=JSON_PAGE_SIZE)
+
+@bp.route('/api/json/<filename>')
+def json_page(filename):
+    """One page of a JSON file's top-level entries: ?offset=&limit=&q=&field=any|key|value"""
+    json_path = uploaded_json_path(filename)
+    offset = request.args.get('offset', 0, type=int)
+    limit = min(max(1, request.args.get('limit', JSON_PAGE_SIZE, type=int)), MAX_JSON_PAGE_SIZE)
+    field = request.args.get('field', 'any')
+    if field not in ('any', 'key', 'value'):
+        abort(400)
+    try:
+        page = get_index(json_path).page(offset, limit, request.args.get('q') or None, field)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 422
+    return jsonify(page)
+
+@bp.route('/api/json/<filename>/entry')
+def json_entry(filename):
+    """Value of one top-level member: ?key="""
+    json_path = uploaded_json_path(filename)
+    key = request.args.get('key')
+    if key is None:
+        abort(400)
+    try:
+        index = get_index(json_path)
+        if key not in index.positions:
+            abort(404)
+        value = index.lookup(key)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 422
+    return jsonify({'key': key, 'value': value})
 
 def get_uploaded_files():
-    upload_dir = os.path.join(os.path.dirname(__file__), 'uploads')
-    files = os.listdir(upload_dir)
-    apks = [f for f in files if f.endswith('.apk')]
-    jsons = [f for f in files if f.endswith('.json')]
-    # Associate JSONs to APKs by base name (before extension)
-    apk_map = {}
-    for apk in apks:
-        base = os.path.splitext(apk)[0]
-        # Find json with same base name
-        json_match = next((j for j in jsons if os.path.splitext(j)[0] == base), None)
-        apk_map[apk] = json_match
-    return apk_map
+    # APKs are associated to the JSON uploaded with them (or, for files from
+    # before the upload index, to the JSON with the same base name)
+    return current_app.extensions['uploads'].list_apks()
 
 @bp.route('/list_apks')
 def list_apks():
@@ -42,6 +76,12 @@ def list_apks():
     return render_template('list_apks.html', apk_map=apk_map)
 
 
+def save_upload(file):
+    """Stream an upload into the store, returns (name, sha256, path)."""
+    name = secure_filename(file.filename)
+    sha256, path = current_app.extensions['uploads'].save(file.stream, name)
+    return name, sha256, path
+
 @bp.route('/', methods=['GET', 'POST'])
 def upload_apk():
     if request.method == 'POST':
@@ -50,25 +90,27 @@ def upload_apk():
         if not apk_file or apk_file.filename == '':
             flash('No APK file selected')
             return redirect(request.url)
-        if not json_file or json_file.filename == '':
-            flash('No JSON file selected')
-            return redirect(request.url)
         if not apk_file.filename.endswith('.apk'):
             flash('Invalid APK file type')
             return redirect(request.url)
-        if not json_file.filename.endswith('.json'):
+        if json_file and json_file.filename != '' and not json_file.filename.endswith('.json'):
             flash('Invalid JSON file type')
             return redirect(request.url)
-        apk_filename = secure_filename(apk_file.filename)
-        json_filename = secure_filename(json_file.filename)
-        upload_dir = os.path.join(os.path.dirname(__file__), 'uploads')
-        apk_path = os.path.join(upload_dir, apk_filename)
-        json_path = os.path.join(upload_dir, json_filename)
-        apk_file.save(apk_path)
-        json_file.save(json_path)
-        # Optionally, store association in a manifest file or DB
-        results = analyze_apk(apk_path)
-        return render_template('result.html', results=results)
+        store = current_app.extensions['uploads']
+        has_json = json_file and json_file.filename != ''
+        # A known APK reuses the JSON extracted from it, a new one needs its
+        # own; checked before anything is stored
+        if not has_json and store.extraction(stream_sha256(apk_file.stream)) is None:
+            flash('No JSON file selected')
+            return redirect(request.url)
+        apk_name, apk_sha256, apk_path = save_upload(apk_file)
+        if has_json:
+            _, json_sha256, _ = save_upload(json_file)
+            store.set_extraction(apk_sha256, json_sha256)
+        job = current_app.extensions['jobs'].submit('analyze', analyze_apk, apk_path,
+                                                    hashes=[apk_sha256], names=[apk_name],
+                                                    version=ANALYZER_VERSION)
+        return redirect(url_for('main.job_page', job_id=job.id))
     return render_template('upload.html')
 
 @bp.route('/compare', methods=['GET', 'POST'])
@@ -80,15 +122,29 @@ def compare_apk():
             flash('Please select two APK files')
             return redirect(request.url)
         if file1.filename.endswith('.apk') and file2.filename.endswith('.apk'):
-            filename1 = secure_filename(file1.filename)
-            filename2 = secure_filename(file2.filename)
-            path1 = os.path.join(os.path.dirname(__file__), 'uploads', filename1)
-            path2 = os.path.join(os.path.dirname(__file__), 'uploads', filename2)
-            file1.save(path1)
-            file2.save(path2)
-            results = compare_apks(path1, path2)
-            return render_template('result.html', results=results)
+            name1, sha1, path1 = save_upload(file1)
+            name2, sha2, path2 = save_upload(file2)
+            job = current_app.extensions['jobs'].submit('compare', compare_apks, path1, path2,
+                                                        hashes=[sha1, sha2], names=[name1, name2],
+                                                        version=ANALYZER_VERSION)
+            return redirect(url_for('main.job_page', job_id=job.id))
         else:
             flash('Invalid file type(s)')
             return redirect(request.url)
     return render_template('compare.html')
+
+@bp.route('/jobs/<job_id>')
+def job_page(job_id):
+    job = current_app.extensions['jobs'].get(job_id)
+    if job is None:
+        abort(404)
+    if job.state == DONE:
+        return render_template('result.html', results=job.result)
+    return render_template('job.html', job=job, failed=job.state == FAILED)
+
+@bp.route('/jobs/<job_id>/status')
+def job_status(job_id):
+    job = current_app.extensions['jobs'].get(job_id)
+    if job is None:
+        return jsonify({'error': 'unknown job'}), 404
+    return jsonify(job.to_dict())
@@ -0,0 +1,215 @@
+"""
+Content-addressed storage of uploaded APKs and JSONs, indexed in SQLite.
+
+Uploads are streamed to a temporary file in chunks and hashed on the fly,
+then moved to objects/<sha256>/<name of the first upload>, so the same APK
+uploaded twice is stored once. The index maps upload names to content
+hashes, APKs to the JSON extracted from them, and job keys to their results.
+Blob paths are stored relative to the root, so the uploads folder can move.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+from artifact_cache import file_sha256
+
+CHUNK_SIZE = 1 << 20
+UPLOAD_EXTENSIONS = ('.apk', '.json')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL REFERENCES blobs(sha256),
+    uploaded REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_sha256 ON files(sha256);
+CREATE TABLE IF NOT EXISTS extractions (
+    apk_sha256 TEXT PRIMARY KEY REFERENCES blobs(sha256),
+    json_sha256 TEXT NOT NULL REFERENCES blobs(sha256)
+);
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS imports (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+'''
+
+
+class UploadStore:
+    def __init__(self, root, db_path=None):
+        self.root = root
+        self.objects = os.path.join(root, 'objects')
+        self.db_path = db_path or os.path.join(root, 'uploads.sqlite3')
+        os.makedirs(self.objects, exist_ok=True)
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+            # Indexes from before relative paths stored absolute ones
+            for sha256, path in db.execute('SELECT sha256, path FROM blobs').fetchall():
+                if os.path.isabs(path):
+                    db.execute('UPDATE blobs SET path = ? WHERE sha256 = ?', (self._relative(path), sha256))
+
+    @contextmanager
+    def _connect(self):
+        # One connection per call: requests and jobs run in different threads
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            db.execute('PRAGMA foreign_keys = ON')
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.root)
+
+    def _absolute(self, path):
+        return os.path.join(self.root, path)
+
+    def save(self, stream, name):
+        """
+        Stream an upload to disk, hashing it on the fly, and record it under
+        name. Returns (sha256, path); known content is not stored again.
+        """
+        h = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    h.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            sha256 = h.hexdigest()
+            path = self.blob_path(sha256)
+            if path is None:
+                path = os.path.join(self.objects, sha256, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                # A concurrent upload of the same content under another name
+                # may have recorded its blob first; keep that one only
+                stored = self._record_blob(sha256, path, size)
+                if stored != path:
+                    os.remove(path)
+                    path = stored
+            else:
+                os.remove(tmp_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._record_file(name, sha256)
+        return sha256, path
+
+    def _record_blob(self, sha256, path, size):
+        """Record a blob unless its content is known, and return the path stored for it."""
+        with self._connect() as db:
+            db.execute('INSERT OR IGNORE INTO blobs (sha256, path, size) VALUES (?, ?, ?)',
+                       (sha256, self._relative(path), size))
+            stored, = db.execute('SELECT path FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+        return self._absolute(stored)
+
+    def _forget_blob(self, sha256):
+        """Drop a blob whose file no longer holds its content, with the names and extractions using it."""
+        with self._connect() as db:
+            db.execute('DELETE FROM extractions WHERE apk_sha256 = ? OR json_sha256 = ?', (sha256, sha256))
+            db.execute('DELETE FROM files WHERE sha256 = ?', (sha256,))
+            db.execute('DELETE FROM blobs WHERE sha256 = ?', (sha256,))
+
+    def _record_file(self, name, sha256):
+        with self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO files (name, sha256, uploaded) VALUES (?, ?, ?)',
+                       (name, sha256, time.time()))
+
+    def import_existing(self):
+        """
+        Index the files stored directly in root by earlier versions, pairing
+        APKs and JSONs by base name. The size and mtime of every imported
+        file are kept, so a file is only hashed again once it changes; the
+        content it held before is then forgotten, as it is no longer on disk.
+        """
+        with self._connect() as db:
+            imported = {name: (size, mtime_ns)
+                        for name, size, mtime_ns in db.execute('SELECT name, size, mtime_ns FROM imports')}
+        hashes = {}
+        for entry in os.scandir(self.root):
+            if not entry.is_file() or not entry.name.endswith(UPLOAD_EXTENSIONS):
+                continue
+            stat = entry.stat()
+            if imported.get(entry.name) == (stat.st_size, stat.st_mtime_ns):
+                continue
+            sha256 = file_sha256(entry.path)
+            with self._connect() as db:
+                stale = [old for old, in db.execute('SELECT sha256 FROM blobs WHERE path = ? AND sha256 != ?',
+                                                    (self._relative(entry.path), sha256))]
+            for old in stale:
+                self._forget_blob(old)
+            self._record_blob(sha256, entry.path, stat.st_size)
+            self._record_file(entry.name, sha256)
+            with self._connect() as db:
+                db.execute('INSERT OR REPLACE INTO imports (name, size, mtime_ns) VALUES (?, ?, ?)',
+                           (entry.name, stat.st_size, stat.st_mtime_ns))
+            hashes[entry.name] = sha256
+        jsons = {os.path.splitext(name)[0]: sha256 for name, sha256 in hashes.items() if name.endswith('.json')}
+        for name, sha256 in hashes.items():
+            base, extension = os.path.splitext(name)
+            if extension == '.apk' and base in jsons and self.extraction(sha256) is None:
+                self.set_extraction(sha256, jsons[base])
+
+    def blob_path(self, sha256):
+        with self._connect() as db:
+            row = db.execute('SELECT path FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+        return self._absolute(row[0]) if row else None
+
+    def path(self, name):
+        """Stored path of an upload name, None if unknown."""
+        with self._connect() as db:
+            row = db.execute('SELECT b.path FROM files f JOIN blobs b ON b.sha256 = f.sha256 WHERE f.name = ?',
+                             (name,)).fetchone()
+        return self._absolute(row[0]) if row else None
+
+    def set_extraction(self, apk_sha256, json_sha256):
+        with self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO extractions (apk_sha256, json_sha256) VALUES (?, ?)',
+                       (apk_sha256, json_sha256))
+
+    def extraction(self, apk_sha256):
+        """(name, path) of the JSON extracted from an APK, None if there is none yet."""
+        with self._connect() as db:
+            row = db.execute('SELECT MIN(f.name), b.path FROM extractions e '
+                             'JOIN blobs b ON b.sha256 = e.json_sha256 '
+                             'JOIN files f ON f.sha256 = e.json_sha256 '
+                             'WHERE e.apk_sha256 = ?', (apk_sha256,)).fetchone()
+        return (row[0], self._absolute(row[1])) if row and row[0] else None
+
+    def list_apks(self):
+        """{APK name: name of its JSON or None}, newest upload first."""
+        with self._connect() as db:
+            rows = db.execute("SELECT a.name, MIN(j.name) FROM files a "
+                              "LEFT JOIN extractions e ON e.apk_sha256 = a.sha256 "
+                              "LEFT JOIN files j ON j.sha256 = e.json_sha256 "
+                              "WHERE a.name LIKE '%.apk' GROUP BY a.name ORDER BY a.uploaded DESC").fetchall()
+        return dict(rows)
+
+    def result(self, key):
+        with self._connect() as db:
+            row = db.execute('SELECT result FROM results WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_result(self, key, result):
+        with self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO results (key, result, created) VALUES (?, ?, ?)',
+                       (key, json.dumps(result), time.time()))